@@ -0,0 +1,433 @@
+"""
+Batch Convert - Conversione headless di cartelle di mappe in GeoJSON
+Distribuisce le immagini su un pool di processi; ogni worker carica una sola volta
+gli shapefile di riferimento e decodifica l'immagine successiva mentre elabora quella
+corrente. Un manifest (JSON Lines) permette di riprendere un lavoro interrotto.
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SRC_DIR / "tests" / "test with ai"))
+sys.path.insert(0, str(SRC_DIR / "tests" / "test comparison"))
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.webp'}
+MODES = ('kmeans', 'contours', 'match')
+
+
+@dataclass
+class BatchConfig:
+    """Parametri comuni a tutte le immagini del lavoro"""
+    mode: str = 'kmeans'
+    input_root: str = '.'
+    output_dir: str = 'batch_output'
+    n_colors: int = 40
+    min_area: int = 500
+    max_regions: int = 30
+    pyramid_levels: int = 0
+    calibration: str = 'none'           # 'none' o 'italy' (kmeans)
+    confidence_threshold: float = 0.18  # match
+    region_filter: Optional[str] = None  # match
+    verbose: bool = False
+
+    def signature(self) -> str:
+        """Parametri che influenzano il risultato (non i path né la verbosità)"""
+        params = asdict(self)
+        for key in ('input_root', 'output_dir', 'verbose'):
+            params.pop(key)
+        return json.dumps(params, sort_keys=True)
+
+
+class Manifest:
+    """Registro append-only delle immagini elaborate (una riga JSON per immagine)
+
+    Ogni riga viene scritta e sincronizzata su disco appena l'immagine termina, quindi
+    dopo un crash il lavoro riparte dalla prima immagine non registrata. Un'immagine
+    modificata (dimensione o mtime diversi) o elaborata con altri parametri viene rielaborata.
+    """
+
+    def __init__(self, path: Path, signature: str = ''):
+        self.path = Path(path)
+        self.signature = signature
+        self.entries: Dict[str, Dict] = {}
+
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # ultima riga troncata da un crash
+                    self.entries[entry['image']] = entry
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def fingerprint(image_path: Path) -> Dict:
+        stat = image_path.stat()
+        return {'image': str(image_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def is_done(self, image_path: Path, retry_failed: bool = False) -> bool:
+        entry = self.entries.get(str(image_path))
+        if entry is None:
+            return False
+        # Un file modificato va rielaborato qualunque sia l'esito precedente (anche errore)
+        fingerprint = self.fingerprint(image_path)
+        if entry['size'] != fingerprint['size'] or entry['mtime_ns'] != fingerprint['mtime_ns']:
+            return False
+        if entry.get('config') != self.signature:
+            return False
+        return entry['status'] == 'done' or not retry_failed
+
+    def record(self, entry: Dict):
+        entry['config'] = self.signature
+        self.entries[entry['image']] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def collect_images(inputs: List[str]) -> List[Path]:
+    """Immagini da cartelle (ricorsivo) e/o pattern glob, ordinate e senza duplicati"""
+    images = set()
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = path.rglob('*')
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = (Path(p) for p in glob.glob(item, recursive=True))
+
+        for candidate in candidates:
+            if candidate.is_file() and candidate.suffix.lower() in IMAGE_EXTENSIONS:
+                images.add(candidate.resolve())
+
+    return sorted(images)
+
+
+def output_path_for(image_path: Path, config: BatchConfig) -> Path:
+    """GeoJSON nella cartella di output, rispecchiando le sottocartelle dell'input"""
+    try:
+        relative = image_path.relative_to(config.input_root)
+    except ValueError:
+        relative = Path(image_path.name)
+    suffix = '.matched.geojson' if config.mode == 'match' else '.geojson'
+    return Path(config.output_dir) / relative.with_suffix(suffix)
+
+
+def chunked(items: List[Path], size: int) -> Iterator[List[Path]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# ---------------------------------------------------------------------------
+# Worker (stato per processo)
+# ---------------------------------------------------------------------------
+
+_worker: Dict = {}
+
+
+def _init_worker(config: BatchConfig, events=None, database_path: Optional[str] = None):
+    """Inizializza il processo: un solo thread OpenCV e database caricati una volta
+
+    events: coda su cui ogni immagine viene annunciata ('start') e consegnata ('done')
+    database_path: database di riferimento già scaricato/compilato dal processo principale
+    """
+    cv2.setNumThreads(1)
+    _worker['config'] = config
+    _worker['events'] = events
+    _worker['prefetch'] = ThreadPoolExecutor(max_workers=1)
+
+    if config.mode == 'match':
+        from shape_matcher import ShapeMatcher
+        with contextlib.redirect_stdout(io.StringIO()):
+            _worker['matcher'] = ShapeMatcher(database_path=database_path, use_cache=False)
+
+
+def _decode(image_path: Path) -> Optional[np.ndarray]:
+    """Decodifica l'immagine (cv2 rilascia il GIL: gira in parallelo all'elaborazione)"""
+    data = np.fromfile(str(image_path), dtype=np.uint8)
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def _convert(image_path: Path, image: np.ndarray, config: BatchConfig) -> Dict:
+    """Converte una singola immagine già decodificata, restituisce info sul risultato"""
+    output_path = output_path_for(image_path, config)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if config.mode == 'kmeans':
+        from image_to_geojson_auto import KMeansExtractor
+        with KMeansExtractor(str(image_path), image=image, use_cache=False) as extractor:
+            extractor.segment_by_color(n_colors=config.n_colors, min_area=config.min_area,
+                                       max_regions=config.max_regions,
+                                       pyramid_levels=config.pyramid_levels, save_debug=False)
+            if config.calibration == 'italy':
+                extractor.calibrate_italy()
+            extractor.to_geojson(str(output_path))
+        return {'output': str(output_path), 'regions': len(extractor.regions),
+                'method': extractor.segmentation_method}
+
+    if config.mode == 'contours':
+        from image_to_geojson import MapExtractor
+        with MapExtractor(str(image_path), image=image) as extractor:
+            extractor.preprocess()
+            extractor.detect_regions(min_area=config.min_area)
+            extractor.to_geojson(str(output_path))
+        return {'output': str(output_path), 'regions': len(extractor.regions)}
+
+    result = _worker['matcher'].match_all(
+        str(image_path), confidence_threshold=config.confidence_threshold,
+        region_filter=config.region_filter, output_path=str(output_path), image=image
+    )
+    if result is None:
+        return {'output': None, 'regions': 0}
+    return {'output': result['output_path'], 'regions': result['matched_count'],
+            'extracted': result['total_extracted']}
+
+
+def _process_chunk(paths: List[str]) -> List[Dict]:
+    """Elabora un blocco di immagini, decodificando la successiva in background
+
+    Ogni risultato viene anche inviato subito sulla coda degli eventi, così il processo
+    principale lo registra nel manifest senza aspettare la fine del blocco.
+    """
+    config = _worker['config']
+    prefetch = _worker['prefetch']
+    events = _worker.get('events')
+    records = []
+
+    pending = prefetch.submit(_decode, Path(paths[0]))
+    for i, path in enumerate(paths):
+        image_path = Path(path)
+        entry = Manifest.fingerprint(image_path)
+        t0 = time.perf_counter()
+        if events is not None:
+            events.put(('start', path))
+
+        # La decodifica successiva parte prima di attendere questa: un file corrotto
+        # fallisce da solo senza bloccare il resto del blocco
+        current = pending
+        if i + 1 < len(paths):
+            pending = prefetch.submit(_decode, Path(paths[i + 1]))
+
+        try:
+            image = current.result()
+            if image is None:
+                raise ValueError(f"Impossibile caricare: {image_path}")
+
+            log = io.StringIO()
+            with contextlib.redirect_stdout(sys.stdout if config.verbose else log):
+                entry.update(_convert(image_path, image, config))
+            entry['status'] = 'done'
+
+        except Exception as e:
+            entry['status'] = 'error'
+            entry['error'] = f"{type(e).__name__}: {e}"
+            if config.verbose:
+                traceback.print_exc()
+
+        entry['seconds'] = round(time.perf_counter() - t0, 3)
+        records.append(entry)
+        if events is not None:
+            events.put(('done', entry))
+
+    return records
+
+
+# ---------------------------------------------------------------------------
+# Processo principale
+# ---------------------------------------------------------------------------
+
+def prepare_reference(config: BatchConfig) -> Optional[str]:
+    """Scarica/compila una sola volta il database di riferimento (modalità match)
+
+    Così i worker trovano database, geostore e indice delle forme già pronti invece di
+    scaricarli e scriverli in parallelo. Restituisce il path del database.
+    """
+    if config.mode != 'match':
+        return None
+    from shape_matcher import ShapeMatcher
+    with contextlib.redirect_stdout(io.StringIO()):
+        matcher = ShapeMatcher(use_cache=False)
+    return str(matcher.database_path)
+
+
+def _error_entry(path: str, error: str) -> Dict:
+    entry = Manifest.fingerprint(Path(path))
+    entry.update(status='error', error=error, seconds=0.0)
+    return entry
+
+
+def run_batch(images: List[Path], config: BatchConfig, workers: int, chunk_size: int,
+              retry_failed: bool = False) -> Dict:
+    """Elabora le immagini non ancora nel manifest, restituisce i conteggi
+
+    Ogni immagine viene registrata appena finisce. Se un blocco fallisce per un errore
+    fuori dalla singola immagine, le sue immagini mancanti vengono registrate in errore;
+    se un worker termina in modo anomalo, l'immagine che stava elaborando viene registrata
+    in errore e le altre ripartono su un nuovo pool.
+    """
+    output_dir = Path(config.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(output_dir / 'manifest.jsonl', config.signature())
+
+    todo = [str(p) for p in images if not manifest.is_done(p, retry_failed)]
+    skipped = len(images) - len(todo)
+    print(f"📋 {len(images)} immagini, {skipped} già elaborate, {len(todo)} da elaborare")
+
+    counts = {'done': 0, 'error': 0, 'skipped': skipped}
+    total = len(todo)
+    t0 = time.perf_counter()
+
+    def record(entry: Dict):
+        manifest.record(entry)
+        counts[entry['status']] += 1
+        if entry['status'] == 'error':
+            print(f"   ❌ {entry['image']}: {entry['error']}")
+        processed = counts['done'] + counts['error']
+        rate = processed / max(time.perf_counter() - t0, 1e-9)
+        print(f"   {processed}/{total} - {rate:.2f} img/s", flush=True)
+
+    try:
+        database_path = prepare_reference(config) if todo else None
+        while todo:
+            todo = _run_pool(todo, config, workers, chunk_size, database_path, record)
+    finally:
+        manifest.close()
+
+    return counts
+
+
+def _run_pool(todo: List[str], config: BatchConfig, workers: int, chunk_size: int,
+              database_path: Optional[str], record) -> List[str]:
+    """Un pool sulle immagini todo; restituisce quelle da rilanciare se il pool si rompe"""
+    # SimpleQueue scrive subito sulla pipe: l'evento 'start' arriva anche se il worker muore
+    events = multiprocessing.get_context().SimpleQueue()
+    finished, started = set(), set()
+
+    def drain():
+        while not events.empty():
+            kind, payload = events.get()
+            if kind == 'start':
+                started.add(payload)
+            elif payload['image'] not in finished:
+                finished.add(payload['image'])
+                record(payload)
+
+    broken = False
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(config, events, database_path)) as pool:
+        futures = {pool.submit(_process_chunk, chunk): chunk for chunk in chunked(todo, chunk_size)}
+        pending = set(futures)
+
+        while pending:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            drain()
+            for future in done:
+                try:
+                    entries = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    continue
+                except Exception as e:
+                    entries = [_error_entry(p, f"{type(e).__name__}: {e}") for p in futures[future]]
+                drain()
+                for entry in entries:  # eventi persi o errore del blocco
+                    if entry['image'] not in finished:
+                        finished.add(entry['image'])
+                        record(entry)
+
+    drain()
+    if not broken:
+        return []
+
+    # Pool rotto: l'immagine avviata e mai finita è quella che ha fatto terminare il worker
+    for path in started - finished:
+        finished.add(path)
+        record(_error_entry(path, "BrokenProcessPool: il worker è terminato durante l'elaborazione"))
+    remaining = [p for p in todo if p not in finished]
+    if len(remaining) == len(todo):
+        print("\n❌ I worker terminano prima di elaborare qualsiasi immagine")
+        raise BrokenProcessPool("nessuna immagine elaborata")
+    print(f"\n⚠️  Un worker è terminato in modo anomalo: riparto con {len(remaining)} immagini")
+    return remaining
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Conversione batch di mappe in GeoJSON')
+    parser.add_argument('inputs', nargs='+', help='Cartelle, file o pattern glob (es. "scans/**/*.png")')
+    parser.add_argument('-o', '--output', default='batch_output', help='Cartella di output')
+    parser.add_argument('--mode', choices=MODES, default='kmeans',
+                        help='kmeans (KMeansExtractor), contours (MapExtractor), match (ShapeMatcher)')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help='Processi')
+    parser.add_argument('--chunk-size', type=int, default=4,
+                        help='Immagini per blocco (la successiva viene decodificata in anticipo)')
+    parser.add_argument('--n-colors', type=int, default=40, help='Numero di colori (kmeans)')
+    parser.add_argument('--min-area', type=int, default=500, help='Area minima regione (pixel²)')
+    parser.add_argument('--max-regions', type=int, default=30, help='Regioni massime (kmeans)')
+    parser.add_argument('--pyramid-levels', type=int, default=0, help='Livelli piramide (kmeans)')
+    parser.add_argument('--calibration', choices=('none', 'italy'), default='none',
+                        help='Calibrazione geografica (kmeans)')
+    parser.add_argument('--threshold', type=float, default=0.18, help='Soglia confidenza (match)')
+    parser.add_argument('--region-filter', help='Filtro paese, es. Italy (match)')
+    parser.add_argument('--retry-failed', action='store_true', help='Rielabora le immagini in errore')
+    parser.add_argument('-v', '--verbose', action='store_true', help="Mostra l'output degli estrattori")
+    args = parser.parse_args()
+
+    images = collect_images(args.inputs)
+    if not images:
+        print("❌ Nessuna immagine trovata")
+        return
+
+    input_root = images[0].parent if len(images) == 1 else Path(os.path.commonpath(images))
+    config = BatchConfig(
+        mode=args.mode,
+        input_root=str(input_root),
+        output_dir=str(Path(args.output).resolve()),
+        n_colors=args.n_colors,
+        min_area=args.min_area,
+        max_regions=args.max_regions,
+        pyramid_levels=args.pyramid_levels,
+        calibration=args.calibration,
+        confidence_threshold=args.threshold,
+        region_filter=args.region_filter,
+        verbose=args.verbose
+    )
+
+    print("\n🗺️  BATCH CONVERT")
+    print("="*60)
+    print(f"   Modalità: {config.mode} - {args.workers} worker")
+    print(f"   Output: {config.output_dir}")
+
+    t0 = time.perf_counter()
+    counts = run_batch(images, config, args.workers, args.chunk_size, args.retry_failed)
+
+    print("\n" + "="*60)
+    print(f"✅ {counts['done']} completate, {counts['error']} errori, "
+          f"{counts['skipped']} saltate ({time.perf_counter() - t0:.1f}s)")
+    print(f"📋 Manifest: {Path(config.output_dir) / 'manifest.jsonl'}")
+
+
+if __name__ == "__main__":
+    main()
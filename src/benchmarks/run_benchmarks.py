@@ -0,0 +1,288 @@
+"""
+Benchmark Suite - Tempi e picco di memoria delle pipeline di estrazione e matching
+Ogni caso gira in un processo separato su mappe sintetiche generate con un seed fisso;
+i risultati si confrontano con le baseline registrate (baselines.json) per trovare
+regressioni tra una release e l'altra.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SRC_DIR))
+sys.path.insert(0, str(SRC_DIR / "tests" / "test with ai"))
+sys.path.insert(0, str(SRC_DIR / "tests" / "test comparison"))
+sys.path.insert(0, str(SRC_DIR / "tests" / "test svg to geojson"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synthetic_maps import voronoi_map
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines.json"
+
+
+# ---------------------------------------------------------------------------
+# Input sintetici (deterministici: stesso seed → stesse mappe)
+# ---------------------------------------------------------------------------
+
+def make_inputs(work_dir: Path, width: int, height: int, n_regions: int) -> Dict[str, Path]:
+    """Mappe di Voronoi: colori piatti (PNG), scansione rumorosa (JPEG), SVG"""
+    flat = voronoi_map(width, height, n_regions, seed=1, antialias=False)
+    paths = {'flat': flat.save(work_dir / 'flat.png')['image']}
+
+    noisy = voronoi_map(width, height, n_regions, seed=2, text=True, jpeg_quality=70)
+    saved = noisy.save(work_dir / 'noisy.jpg')
+    paths['noisy'] = saved['image']
+    paths['truth'] = saved['truth']
+    paths['svg'] = noisy.save_svg(work_dir / 'noisy.svg')
+    return paths
+
+
+# ---------------------------------------------------------------------------
+# Casi: ognuno restituisce una funzione senza argomenti da cronometrare
+# ---------------------------------------------------------------------------
+
+def case_kmeans_flat(inputs: Dict[str, Path], n_regions: int) -> Callable:
+    from image_to_geojson_auto import KMeansExtractor
+    image = cv2.imread(str(inputs['flat']))
+
+    def run():
+        extractor = KMeansExtractor(str(inputs['flat']), image=image, use_cache=False)
+        extractor.segment_by_color(n_colors=n_regions + 5, min_area=300, max_regions=n_regions * 2,
+                                   save_debug=False)
+    return run
+
+
+def case_kmeans_noisy(inputs: Dict[str, Path], n_regions: int) -> Callable:
+    from image_to_geojson_auto import KMeansExtractor
+    image = cv2.imread(str(inputs['noisy']))
+
+    def run():
+        extractor = KMeansExtractor(str(inputs['noisy']), image=image, use_cache=False)
+        extractor.segment_by_color(n_colors=n_regions + 5, min_area=300, max_regions=n_regions * 2,
+                                   save_debug=False)
+    return run
+
+
+def case_map_extractor(inputs: Dict[str, Path], n_regions: int) -> Callable:
+    from image_to_geojson import MapExtractor
+    image = cv2.imread(str(inputs['noisy']))
+
+    def run():
+        extractor = MapExtractor(str(inputs['noisy']), image=image)
+        extractor.preprocess()
+        extractor.detect_regions(min_area=300)
+    return run
+
+
+def case_shape_matcher(inputs: Dict[str, Path], n_regions: int) -> Callable:
+    from shape_matcher import ShapeMatcher
+    # Database = ground truth della mappa (caricato una volta, fuori dal cronometro)
+    matcher = ShapeMatcher(database_path=str(inputs['truth']), use_gadm_italy=False, use_cache=False)
+    image = cv2.imread(str(inputs['noisy']))
+    output = Path(inputs['noisy']).with_suffix('.bench.geojson')
+
+    def run():
+        matcher.match_all(str(inputs['noisy']), confidence_threshold=0.18,
+                          output_path=str(output), image=image)
+    return run
+
+
+def case_svg_world(inputs: Dict[str, Path], n_regions: int) -> Callable:
+    from Svg_to_Geojson_Converter import convert_svg_to_geojson
+    output = Path(inputs['svg']).with_suffix('.world.geojson')
+
+    def run():
+        convert_svg_to_geojson(str(inputs['svg']), str(output))
+    return run
+
+
+def case_svg_italia(inputs: Dict[str, Path], n_regions: int) -> Callable:
+    from test_italia import convert_italia_to_geojson
+    output = Path(inputs['svg']).with_suffix('.italia.geojson')
+
+    def run():
+        convert_italia_to_geojson(str(inputs['svg']), str(output))
+    return run
+
+
+CASES = {
+    'kmeans_segment_flat': case_kmeans_flat,
+    'kmeans_segment_noisy': case_kmeans_noisy,
+    'map_extractor_detect': case_map_extractor,
+    'shape_matcher_match_all': case_shape_matcher,
+    'svg_world_converter': case_svg_world,
+    'svg_italia_converter': case_svg_italia,
+}
+
+
+# ---------------------------------------------------------------------------
+# Misura (in un processo figlio per isolare la memoria)
+# ---------------------------------------------------------------------------
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _measure(name: str, inputs: Dict[str, Path], n_regions: int, repeat: int, queue):
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run = CASES[name](inputs, n_regions)
+            rss_before = _max_rss_mb()
+
+            # Primo giro: picco di memoria (allocazioni Python/NumPy) e RSS
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            run()
+            times = [time.perf_counter() - t0]
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rss_after = _max_rss_mb()
+
+            # Giri successivi senza tracemalloc (che rallenta)
+            for _ in range(repeat - 1):
+                t0 = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - t0)
+
+        queue.put({
+            'seconds': round(min(times), 4),
+            'seconds_median': round(float(np.median(times)), 4),
+            'peak_mb': round(peak / (1024 * 1024), 2),
+            'rss_growth_mb': None if rss_before is None else round(rss_after - rss_before, 2),
+        })
+    except Exception as e:
+        queue.put({'error': f"{type(e).__name__}: {e}"})
+
+
+def measure(name: str, inputs: Dict[str, Path], n_regions: int, repeat: int) -> Dict:
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(name, inputs, n_regions, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Baseline
+# ---------------------------------------------------------------------------
+
+def machine_info() -> Dict:
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """Casi più lenti o più pesanti della baseline oltre la tolleranza"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if not reference or 'error' in result or 'error' in reference:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            if reference[metric] > 0 and result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {result[metric]} vs {reference[metric]} "
+                                   f"(+{result[metric] / reference[metric] - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark delle pipeline di estrazione e matching')
+    parser.add_argument('cases', nargs='*', help=f"Casi da eseguire (default tutti): {', '.join(CASES)}")
+    parser.add_argument('--size', default='1200x900', help='Dimensione mappe sintetiche')
+    parser.add_argument('--n-regions', type=int, default=20, help='Regioni per mappa')
+    parser.add_argument('--repeat', type=int, default=3, help='Ripetizioni per caso (si tiene il minimo)')
+    parser.add_argument('--baseline', default=str(BASELINE_PATH), help='File delle baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='Registra i risultati come baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Regressione oltre +25%% (default)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit code 1 se ci sono regressioni')
+    args = parser.parse_args()
+
+    names = args.cases or list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"Casi sconosciuti: {', '.join(unknown)}")
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    print(f"\n⏱️  BENCHMARK SUITE - mappe {width}x{height}px, {args.n_regions} regioni")
+    print("="*72)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='map_bench_') as tmp:
+        inputs = make_inputs(Path(tmp), width, height, args.n_regions)
+
+        for name in names:
+            result = measure(name, inputs, args.n_regions, args.repeat)
+            results[name] = result
+            if 'error' in result:
+                print(f"   {name:<26} ❌ {result['error']}")
+            else:
+                rss = f", RSS +{result['rss_growth_mb']:.0f} MB" if result['rss_growth_mb'] is not None else ""
+                print(f"   {name:<26} {result['seconds']:8.3f}s  picco {result['peak_mb']:7.1f} MB{rss}")
+
+    baseline_path = Path(args.baseline)
+    regressions = []
+    if baseline_path.exists() and not args.save_baseline:
+        baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+        if baseline.get('config') != {'size': args.size, 'n_regions': args.n_regions}:
+            print(f"\n⚠️  Baseline registrata con parametri diversi: {baseline.get('config')}")
+        regressions = compare(results, baseline, args.tolerance)
+
+        print("\n📊 Confronto con baseline")
+        print("-"*72)
+        for name, result in results.items():
+            reference = baseline.get('results', {}).get(name)
+            if reference and 'error' not in result and 'error' not in reference:
+                print(f"   {name:<26} tempo x{result['seconds'] / max(reference['seconds'], 1e-9):.2f}  "
+                      f"memoria x{result['peak_mb'] / max(reference['peak_mb'], 1e-9):.2f}")
+        if regressions:
+            print("\n⚠️  REGRESSIONI:")
+            for line in regressions:
+                print(f"   {line}")
+        else:
+            print("\n✅ Nessuna regressione")
+
+    if args.save_baseline:
+        baseline = {
+            'recorded': time.strftime('%Y-%m-%d'),
+            'machine': machine_info(),
+            'config': {'size': args.size, 'n_regions': args.n_regions},
+            'results': results,
+        }
+        baseline_path.write_text(json.dumps(baseline, indent=2) + '\n', encoding='utf-8')
+        print(f"\n💾 Baseline salvata: {baseline_path}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
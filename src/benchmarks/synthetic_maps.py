@@ -0,0 +1,270 @@
+"""
+Synthetic Maps - Generatore di mappe sintetiche con ground truth
+Celle di Voronoi o geometrie GADM Italy disegnate come mappe a colori piatti, con
+anti-aliasing, rumore JPEG ed etichette configurabili. Ogni mappa porta con sé i
+poligoni originali (coordinate geografiche) e la label map dei pixel.
+"""
+
+import argparse
+import colorsys
+import json
+import sys
+import cv2
+import numpy as np
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from shapely.geometry import MultiPoint, MultiPolygon, Polygon, box, mapping
+from shapely.ops import voronoi_diagram
+
+
+# Bounds (lon_min, lat_min, lon_max, lat_max) usati per le mappe di Voronoi
+ITALY_BOUNDS = (6.5, 36.0, 18.5, 47.5)
+
+GADM_DIR = Path(__file__).resolve().parents[1] / "georeferencer" / "geodata" / "gadm_italy"
+
+
+@dataclass
+class SyntheticMap:
+    """Mappa sintetica + ground truth"""
+    image: np.ndarray                     # HxWx3 BGR uint8
+    labels: np.ndarray                    # HxW int32, indice regione (-1 = sfondo)
+    regions: List[Dict]                   # name, color (RGB), geometry (lon/lat)
+    bounds: Tuple[float, float, float, float]
+    params: Dict = field(default_factory=dict)
+
+    @property
+    def height(self) -> int:
+        return self.image.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.image.shape[1]
+
+    def to_pixels(self, coords: np.ndarray) -> np.ndarray:
+        """lon/lat → pixel (y verso il basso)"""
+        lon_min, lat_min, lon_max, lat_max = self.bounds
+        x = (coords[:, 0] - lon_min) / (lon_max - lon_min) * self.width
+        y = (lat_max - coords[:, 1]) / (lat_max - lat_min) * self.height
+        return np.column_stack([x, y])
+
+    def save(self, image_path: Path) -> Dict[str, Path]:
+        """Salva immagine, ground truth GeoJSON (name/admin/region) e label map .npy"""
+        image_path = Path(image_path)
+        image_path.parent.mkdir(parents=True, exist_ok=True)
+        quality = self.params.get('jpeg_quality')
+
+        if image_path.suffix.lower() in ('.jpg', '.jpeg') and quality:
+            cv2.imwrite(str(image_path), self.image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        else:
+            cv2.imwrite(str(image_path), self.image)
+
+        truth_path = image_path.with_suffix('.truth.geojson')
+        features = [{
+            "type": "Feature",
+            "properties": {
+                "name": region['name'],
+                "admin": "Synthetic",
+                "region": "Synthetic",
+                "color": "rgb({},{},{})".format(*region['color'])
+            },
+            "geometry": mapping(region['geometry'])
+        } for region in self.regions]
+        with open(truth_path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False)
+
+        labels_path = image_path.with_suffix('.labels.npy')
+        np.save(str(labels_path), self.labels)
+
+        return {'image': image_path, 'truth': truth_path, 'labels': labels_path}
+
+    def save_svg(self, svg_path: Path) -> Path:
+        """Salva le regioni come SVG (un <path> per poligono, id/name per regione)"""
+        paths = []
+        for i, region in enumerate(self.regions):
+            geometry = region['geometry']
+            polygons = geometry.geoms if isinstance(geometry, MultiPolygon) else [geometry]
+            fill = "#{:02x}{:02x}{:02x}".format(*region['color'])
+            for poly in polygons:
+                points = self.to_pixels(np.asarray(poly.exterior.coords))
+                d = "M " + " L ".join(f"{x:.2f} {y:.2f}" for x, y in points) + " Z"
+                paths.append(f'  <path id="region_{i}" name="{region["name"]}" fill="{fill}" d="{d}"/>')
+
+        svg = (f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}" '
+               f'viewBox="0 0 {self.width} {self.height}">\n' + "\n".join(paths) + "\n</svg>\n")
+        svg_path = Path(svg_path)
+        svg_path.write_text(svg, encoding='utf-8')
+        return svg_path
+
+
+def region_colors(n: int, seed: int = 0) -> List[Tuple[int, int, int]]:
+    """Colori RGB distinti, saturi ma né bianchi né neri (come le mappe politiche)"""
+    rng = np.random.default_rng(seed)
+    hues = (np.arange(n) / max(n, 1) + rng.random()) % 1.0
+    rng.shuffle(hues)
+    colors = []
+    for i, hue in enumerate(hues):
+        saturation = 0.45 + 0.35 * ((i * 7) % 5) / 4
+        value = 0.7 + 0.25 * ((i * 3) % 4) / 3
+        r, g, b = colorsys.hsv_to_rgb(hue, saturation, value)
+        colors.append((int(r * 255), int(g * 255), int(b * 255)))
+    return colors
+
+
+def render_map(regions: List[Dict], bounds: Tuple[float, float, float, float], width: int, height: int,
+               antialias: bool = True, borders: bool = True, text: bool = False,
+               jpeg_quality: Optional[int] = None, background=(255, 255, 255)) -> SyntheticMap:
+    """Disegna le regioni (geometrie lon/lat) come mappa a colori piatti
+
+    antialias: disegno a 4x e riduzione INTER_AREA (bordi sfumati come negli export)
+    jpeg_quality: se impostato, l'immagine passa da una compressione JPEG
+    """
+    ss = 4 if antialias else 1
+    canvas = np.empty((height * ss, width * ss, 3), dtype=np.uint8)
+    canvas[:] = background[::-1]
+    labels = np.full((height, width), -1, dtype=np.int32)
+
+    synthetic = SyntheticMap(np.empty((height, width, 3), np.uint8), labels, regions, bounds)
+
+    def polygons_of(geometry):
+        parts = geometry.geoms if isinstance(geometry, MultiPolygon) else [geometry]
+        return [p for p in parts if not p.is_empty]
+
+    for i, region in enumerate(regions):
+        rings = []
+        for poly in polygons_of(region['geometry']):
+            rings.append(synthetic.to_pixels(np.asarray(poly.exterior.coords)))
+            rings.extend(synthetic.to_pixels(np.asarray(r.coords)) for r in poly.interiors)
+        if not rings:
+            continue
+
+        r, g, b = region['color']
+        cv2.fillPoly(canvas, [np.round(ring * ss).astype(np.int32) for ring in rings], (b, g, r))
+        cv2.fillPoly(labels, [np.round(ring).astype(np.int32) for ring in rings], i)
+
+    if borders:
+        for region in regions:
+            for poly in polygons_of(region['geometry']):
+                ring = np.round(synthetic.to_pixels(np.asarray(poly.exterior.coords)) * ss).astype(np.int32)
+                cv2.polylines(canvas, [ring], True, (60, 60, 60), ss)
+
+    if text:
+        for region in regions:
+            point = region['geometry'].representative_point()
+            x, y = synthetic.to_pixels(np.array([[point.x, point.y]]))[0]
+            cv2.putText(canvas, region['name'], (int(x * ss), int(y * ss)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.35 * ss, (30, 30, 30), ss, cv2.LINE_AA)
+
+    image = canvas if ss == 1 else cv2.resize(canvas, (width, height), interpolation=cv2.INTER_AREA)
+
+    if jpeg_quality:
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)])
+        image = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+    synthetic.image = image
+    synthetic.params = {'antialias': antialias, 'borders': borders, 'text': text,
+                        'jpeg_quality': jpeg_quality}
+    return synthetic
+
+
+def voronoi_map(width: int = 1200, height: int = 900, n_regions: int = 20, seed: int = 0,
+                margin: float = 0.04, bounds=ITALY_BOUNDS, **render_kwargs) -> SyntheticMap:
+    """Mappa di n_regions celle di Voronoi (semi casuali) dentro bounds, con un bordo di mare"""
+    lon_min, lat_min, lon_max, lat_max = bounds
+    dx, dy = (lon_max - lon_min) * margin, (lat_max - lat_min) * margin
+    land = box(lon_min + dx, lat_min + dy, lon_max - dx, lat_max - dy)
+
+    rng = np.random.default_rng(seed)
+    seeds = np.column_stack([
+        rng.uniform(land.bounds[0], land.bounds[2], n_regions),
+        rng.uniform(land.bounds[1], land.bounds[3], n_regions)
+    ])
+    cells = voronoi_diagram(MultiPoint(seeds), envelope=box(*bounds))
+    cells = [cell.intersection(land) for cell in cells.geoms]
+    cells = [cell for cell in cells if not cell.is_empty and cell.area > 0]
+
+    colors = region_colors(len(cells), seed)
+    regions = [{'name': f"Cella {i}", 'color': colors[i], 'geometry': cell}
+               for i, cell in enumerate(cells)]
+
+    synthetic = render_map(regions, bounds, width, height, **render_kwargs)
+    synthetic.params.update({'kind': 'voronoi', 'n_regions': len(regions), 'seed': seed})
+    return synthetic
+
+
+def gadm_map(width: int = 1200, level: int = 1, shapefile: Optional[Path] = None,
+             simplify: float = 0.005, seed: int = 0, **render_kwargs) -> SyntheticMap:
+    """Mappa delle unità GADM Italy del livello indicato (altezza dalle proporzioni)"""
+    import geopandas as gpd
+
+    shapefile = Path(shapefile or GADM_DIR / f"gadm41_ITA_{level}.shp")
+    if not shapefile.exists():
+        raise FileNotFoundError(
+            f"Shapefile GADM non trovato: {shapefile} (esegui src/tests/test comparison/download_gadm.py)"
+        )
+
+    gdf = gpd.read_file(str(shapefile))
+    if simplify:
+        gdf['geometry'] = gdf.geometry.simplify(simplify, preserve_topology=True)
+
+    lon_min, lat_min, lon_max, lat_max = gdf.total_bounds
+    pad_x, pad_y = (lon_max - lon_min) * 0.02, (lat_max - lat_min) * 0.02
+    bounds = (lon_min - pad_x, lat_min - pad_y, lon_max + pad_x, lat_max + pad_y)
+    height = int(round(width * (bounds[3] - bounds[1]) / (bounds[2] - bounds[0])))
+
+    name_field = f"NAME_{level}" if f"NAME_{level}" in gdf.columns else gdf.columns[0]
+    colors = region_colors(len(gdf), seed)
+    regions = [{'name': str(row[name_field]), 'color': colors[i], 'geometry': row.geometry}
+               for i, (_, row) in enumerate(gdf.iterrows())]
+
+    synthetic = render_map(regions, bounds, width, height, **render_kwargs)
+    synthetic.params.update({'kind': f'gadm{level}', 'n_regions': len(regions), 'seed': seed})
+    return synthetic
+
+
+def parse_size(size: str) -> Tuple[int, int]:
+    width, height = size.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera mappe sintetiche con ground truth')
+    parser.add_argument('output', help='Path immagine di output (.png o .jpg)')
+    parser.add_argument('--kind', choices=('voronoi', 'gadm'), default='voronoi')
+    parser.add_argument('--size', default='1200x900', help='LARGHEZZAxALTEZZA (gadm: solo larghezza)')
+    parser.add_argument('--n-regions', type=int, default=20, help='Celle di Voronoi')
+    parser.add_argument('--level', type=int, default=1, help='Livello GADM (1, 2, 3)')
+    parser.add_argument('--no-antialias', action='store_true', help='Bordi netti (colori esatti)')
+    parser.add_argument('--no-borders', action='store_true', help='Senza linee di confine')
+    parser.add_argument('--labels', action='store_true', help='Disegna i nomi delle regioni')
+    parser.add_argument('--jpeg', type=int, help='Qualità JPEG (rumore di compressione)')
+    parser.add_argument('--svg', action='store_true', help='Salva anche le regioni in SVG')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    width, height = parse_size(args.size) if 'x' in args.size else (int(args.size), 0)
+    render_kwargs = {'antialias': not args.no_antialias, 'borders': not args.no_borders,
+                     'text': args.labels, 'jpeg_quality': args.jpeg}
+
+    try:
+        if args.kind == 'voronoi':
+            synthetic = voronoi_map(width, height or int(width * 0.75), args.n_regions, args.seed,
+                                    **render_kwargs)
+        else:
+            synthetic = gadm_map(width, args.level, seed=args.seed, **render_kwargs)
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    paths = synthetic.save(Path(args.output))
+    if args.svg:
+        paths['svg'] = synthetic.save_svg(Path(args.output).with_suffix('.svg'))
+
+    print(f"✅ Mappa {synthetic.params['kind']}: {synthetic.width}x{synthetic.height}px, "
+          f"{len(synthetic.regions)} regioni")
+    for name, path in paths.items():
+        print(f"   {name}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Extraction - Motori condivisi per la segmentazione delle mappe
+"""
+
+from .quantization import ColorQuantizer, quantize_colors
+from .components import ComponentBuilder, ComponentTable, find_components, rasterize_contours
+from .palette import exact_palette, pack_rgb, quantize_image
+from .region_stats import RegionStats, filled_contour_stats, region_stats
+from .dedup import remove_overlaps
+from .pyramid import label_boundaries, quantize_pyramid
+from .cache import Segmentation, SegmentationCache, segment_image
+from .tiling import TiledSegmenter, downscale, iter_strips, open_image, strip_rows
+from .geostore import GeoStore, compile_geostore, read_reference
+from .mipmap import ImagePyramid, TileCache
+from .tasks import BackgroundTask, TaskCancelled
+
+__all__ = [
+    'ColorQuantizer',
+    'quantize_colors',
+    'ComponentTable',
+    'ComponentBuilder',
+    'find_components',
+    'rasterize_contours',
+    'exact_palette',
+    'pack_rgb',
+    'quantize_image',
+    'RegionStats',
+    'region_stats',
+    'filled_contour_stats',
+    'remove_overlaps',
+    'label_boundaries',
+    'quantize_pyramid',
+    'Segmentation',
+    'SegmentationCache',
+    'segment_image',
+    'TiledSegmenter',
+    'downscale',
+    'iter_strips',
+    'open_image',
+    'strip_rows',
+    'GeoStore',
+    'compile_geostore',
+    'read_reference',
+    'ImagePyramid',
+    'TileCache',
+    'BackgroundTask',
+    'TaskCancelled',
+]
@@ -0,0 +1,82 @@
+"""
+Benchmark Mipmap - Resize dell'immagine intera vs tile della piramide
+Simula gli scatti della rotella (zoom) e un pan su un viewport di dimensione fissa:
+il metodo originale ridimensiona e converte tutta l'immagine a ogni scatto
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from extraction import ImagePyramid, TileCache
+
+
+DEFAULT_IMAGE = Path(__file__).resolve().parents[2] / "examples" / "italy_input.png"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark visualizzazione con piramide a tile')
+    parser.add_argument('image', nargs='?', default=str(DEFAULT_IMAGE), help='Immagine mappa')
+    parser.add_argument('--scale', type=float, default=4.0,
+                        help='Fattore di ingrandimento per simulare scansioni grandi')
+    parser.add_argument('--viewport', type=int, nargs=2, default=[1200, 800], help='Canvas (w h)')
+    parser.add_argument('--steps', type=int, default=10, help='Scatti di zoom simulati')
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        raise ValueError(f"Impossibile caricare: {args.image}")
+    if args.scale != 1.0:
+        image = cv2.resize(image, None, fx=args.scale, fy=args.scale, interpolation=cv2.INTER_NEAREST)
+
+    height, width = image.shape[:2]
+    view_w, view_h = args.viewport
+    fit = min(view_w / width, view_h / height, 1.0)
+    scales = [fit * 1.1 ** i for i in range(args.steps)]
+
+    print(f"\n⏱️  BENCHMARK MIPMAP - {width}x{height}px, viewport {view_w}x{view_h}, {args.steps} scatti")
+    print("="*60)
+
+    # Originale: resize dell'immagine intera + conversione colore a ogni scatto
+    t0 = time.perf_counter()
+    for scale in scales:
+        resized = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                             interpolation=cv2.INTER_LANCZOS4)
+        cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+    t_full = (time.perf_counter() - t0) / len(scales)
+
+    t0 = time.perf_counter()
+    tiles = TileCache(ImagePyramid(image), convert=cv2.COLOR_BGR2RGB)
+    t_build = time.perf_counter() - t0
+
+    # Piramide: solo i tile nel viewport (centrato) a ogni scatto
+    t0 = time.perf_counter()
+    for scale in scales:
+        w, h = tiles.pyramid.view_size(scale)
+        x0, y0 = max(0, (w - view_w) // 2), max(0, (h - view_h) // 2)
+        tiles.render(scale, x0, y0, x0 + view_w, y0 + view_h)
+    t_zoom = (time.perf_counter() - t0) / len(scales)
+
+    # Pan di 50 px all'ultima scala: i tile già calcolati vengono riusati
+    t0 = time.perf_counter()
+    for step in range(1, 11):
+        tiles.render(scale, x0 + 50 * step, y0, x0 + 50 * step + view_w, y0 + view_h)
+    t_pan = (time.perf_counter() - t0) / 10
+
+    print(f"   Resize intero:     {t_full * 1000:8.1f} ms/scatto")
+    print(f"   Piramide (zoom):   {t_zoom * 1000:8.1f} ms/scatto (costruzione {t_build:.2f}s, "
+          f"{len(tiles.pyramid.levels)} livelli)")
+    print(f"   Piramide (pan):    {t_pan * 1000:8.1f} ms/passo")
+    print("-"*60)
+    print(f"   Speedup zoom: {t_full / t_zoom:.0f}x - cache {tiles.nbytes / 1024 ** 2:.0f} MB, "
+          f"{tiles.hits} hit / {tiles.misses} miss")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark Piramide - Segmentazione a piena risoluzione vs coarse-to-fine
+Confronta tempi (quantizzazione + componenti) e confini trovati (IoU dei pixel di confine)
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from extraction import find_components, label_boundaries, quantize_image, quantize_pyramid
+
+
+DEFAULT_IMAGE = Path(__file__).resolve().parents[2] / "examples" / "italy_input.png"
+
+
+def boundary_iou(labels_a: np.ndarray, labels_b: np.ndarray, tolerance: int = 1) -> float:
+    """IoU tra i pixel di confine delle due label map
+
+    Indipendente dalla numerazione dei cluster; con tolerance > 0 un pixel di confine
+    conta come comune se l'altra mappa ha un confine entro `tolerance` pixel.
+    """
+    a = label_boundaries(labels_a)
+    b = label_boundaries(labels_b)
+    if tolerance > 0:
+        kernel = np.ones((2 * tolerance + 1, 2 * tolerance + 1), dtype=np.uint8)
+        a_near = cv2.dilate(a.astype(np.uint8), kernel).astype(bool)
+        b_near = cv2.dilate(b.astype(np.uint8), kernel).astype(bool)
+        intersection = np.count_nonzero(a & b_near) + np.count_nonzero(b & a_near)
+        union = np.count_nonzero(a) + np.count_nonzero(b)
+        return intersection / union if union else 1.0
+
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 1.0
+
+
+def run(image: np.ndarray, n_colors: int, levels: int):
+    """Quantizzazione + componenti connesse
+
+    Restituisce (labels, metodo, n componenti, secondi quantizzazione, secondi totali).
+    """
+    t0 = time.perf_counter()
+    if levels > 0:
+        labels, _, method = quantize_pyramid(image, n_colors, levels=levels)
+    else:
+        labels, _, method = quantize_image(image, n_colors)
+    t_quant = time.perf_counter() - t0
+    components = find_components(labels)
+    return labels, method, len(components), t_quant, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark segmentazione a piramide')
+    parser.add_argument('image', nargs='?', default=str(DEFAULT_IMAGE), help='Immagine mappa')
+    parser.add_argument('--n-colors', type=int, default=60, help='Numero di cluster')
+    parser.add_argument('--levels', type=int, default=2, help='Livelli di piramide (fattore 2**livelli)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Fattore di ingrandimento per simulare scansioni grandi')
+    parser.add_argument('--tolerance', type=int, default=1,
+                        help='Tolleranza in pixel per la IoU dei confini')
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        raise ValueError(f"Impossibile caricare: {args.image}")
+    if args.scale != 1.0:
+        image = cv2.resize(image, None, fx=args.scale, fy=args.scale, interpolation=cv2.INTER_NEAREST)
+
+    height, width = image.shape[:2]
+    print(f"\n⏱️  BENCHMARK PIRAMIDE - {width}x{height}px, {args.n_colors} colori, "
+          f"{args.levels} livelli")
+    print("="*60)
+
+    labels_f, method_f, n_f, q_full, t_full = run(image, args.n_colors, 0)
+    print(f"   Piena risoluzione: {t_full:.2f}s (quantizzazione {q_full:.2f}s) - "
+          f"{method_f}, {n_f} componenti")
+
+    labels_p, method_p, n_p, q_pyr, t_pyr = run(image, args.n_colors, args.levels)
+    print(f"   Piramide:          {t_pyr:.2f}s (quantizzazione {q_pyr:.2f}s) - "
+          f"{method_p}, {n_p} componenti")
+
+    print("-"*60)
+    print(f"   Speedup: {t_full / t_pyr:.1f}x (quantizzazione {q_full / q_pyr:.1f}x)")
+    print(f"   IoU confini (esatta):          {boundary_iou(labels_f, labels_p, 0):.3f}")
+    print(f"   IoU confini (±{args.tolerance} px):           "
+          f"{boundary_iou(labels_f, labels_p, args.tolerance):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark Quantizzazione - K-Means su tutti i pixel vs campione + assegnazione
+Confronta tempi e qualità (errore di ricostruzione) dei due approcci
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from extraction import ColorQuantizer
+
+
+DEFAULT_IMAGE = Path(__file__).resolve().parents[2] / "examples" / "italy_input.png"
+
+
+def full_kmeans(image: np.ndarray, n_colors: int):
+    """K-Means originale su tutti i pixel (10 tentativi, 100 iterazioni)"""
+    pixels = image.reshape((-1, 3)).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
+    _, labels, centers = cv2.kmeans(pixels, n_colors, None, criteria, 10, cv2.KMEANS_PP_CENTERS)
+    return labels.reshape(image.shape[:2]), centers
+
+
+def reconstruction_mse(image: np.ndarray, labels: np.ndarray, centers: np.ndarray) -> float:
+    """Errore quadratico medio tra pixel e centro assegnato"""
+    diff = image.reshape((-1, 3)).astype(np.float32) - centers[labels.ravel()]
+    return float(np.mean(np.sum(diff * diff, axis=1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark quantizzazione colori')
+    parser.add_argument('image', nargs='?', default=str(DEFAULT_IMAGE), help='Immagine mappa')
+    parser.add_argument('--n-colors', type=int, default=60, help='Numero di cluster')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Fattore di ingrandimento per simulare scansioni grandi')
+    parser.add_argument('--sample-size', type=int, default=50_000, help='Pixel campionati')
+    parser.add_argument('--skip-full', action='store_true', help='Salta il K-Means completo')
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        raise ValueError(f"Impossibile caricare: {args.image}")
+    if args.scale != 1.0:
+        image = cv2.resize(image, None, fx=args.scale, fy=args.scale, interpolation=cv2.INTER_NEAREST)
+
+    height, width = image.shape[:2]
+    print(f"\n⏱️  BENCHMARK QUANTIZZAZIONE - {width}x{height}px, {args.n_colors} colori")
+    print("="*60)
+
+    t0 = time.perf_counter()
+    quantizer = ColorQuantizer(args.n_colors, sample_size=args.sample_size)
+    quantizer.fit(image)
+    t_fit = time.perf_counter() - t0
+    labels_s = quantizer.predict(image)
+    t_sample = time.perf_counter() - t0
+    mse_s = reconstruction_mse(image, labels_s, quantizer.centers)
+
+    print(f"   Campione + assegnazione: {t_sample:.2f}s (fit {t_fit:.2f}s) - MSE {mse_s:.1f}")
+
+    if args.skip_full:
+        return
+
+    t0 = time.perf_counter()
+    labels_f, centers_f = full_kmeans(image, args.n_colors)
+    t_full = time.perf_counter() - t0
+    mse_f = reconstruction_mse(image, labels_f, centers_f)
+
+    # Differenza media tra le due immagini quantizzate (in unità RGB)
+    recon_f = centers_f[labels_f.ravel()]
+    recon_s = quantizer.centers[labels_s.ravel()]
+    color_diff = float(np.mean(np.linalg.norm(recon_f - recon_s, axis=1)))
+
+    print(f"   K-Means completo:        {t_full:.2f}s - MSE {mse_f:.1f}")
+    print("-"*60)
+    print(f"   Speedup: {t_full / t_sample:.1f}x")
+    print(f"   MSE relativo: {mse_s / mse_f:.3f} (1.0 = stessa qualità)" if mse_f > 0 else
+          "   MSE relativo: n/d")
+    print(f"   Differenza colore media: {color_diff:.2f} (RGB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Segmentation Cache - Cache su disco dei risultati di segmentazione
+La chiave è l'hash del contenuto dell'immagine + i parametri di quantizzazione:
+cambiando solo il post-processing (min_area, epsilon, ...) K-Means non viene rieseguito
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from .components import ComponentTable, find_components
+from .pyramid import quantize_pyramid
+
+
+# Da incrementare quando cambia il formato o l'algoritmo (invalida le voci vecchie)
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "map_to_geojson" / "segmentation"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# File .tmp più vecchi di così sono scritture interrotte (crash, kill), non in corso
+STALE_TMP_SECONDS = 3600
+
+
+@dataclass
+class Segmentation:
+    """Risultato della segmentazione: componenti connesse + centri dei colori"""
+    components: ComponentTable
+    centers: np.ndarray  # (K, 3) float32
+    method: str          # 'palette' / 'kmeans' (+ '-pyramid')
+    cached: bool = False
+
+    @property
+    def labels(self) -> np.ndarray:
+        """Label map HxW (ricavata dalla mappa delle componenti)"""
+        return self.components.labels[self.components.component_map]
+
+
+class SegmentationCache:
+    """Cache LRU di file .npz: una voce per (contenuto immagine, parametri)
+
+    Ogni lettura aggiorna l'mtime del file; quando la dimensione totale supera
+    max_bytes vengono eliminate le voci lette meno di recente.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir or os.environ.get('MAP_SEGMENTATION_CACHE', DEFAULT_CACHE_DIR))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image: np.ndarray, params: Dict) -> str:
+        """Hash di pixel, forma, dtype e parametri (ordinati)"""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps({'version': CACHE_VERSION, 'shape': image.shape,
+                                  'dtype': str(image.dtype), 'params': params},
+                                 sort_keys=True).encode())
+        digest.update(np.ascontiguousarray(image).data)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """Array salvati per la chiave, oppure None"""
+        path = self._path(key)
+        try:
+            with np.load(str(path), allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path)  # ultimo accesso (LRU)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]):
+        """Salva gli array (scrittura atomica) e applica il limite di dimensione"""
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.cache_dir), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Elimina i .tmp orfani e le voci meno recenti finché la cache sta in max_bytes"""
+        stale_before = time.time() - STALE_TMP_SECONDS
+        for path in self.cache_dir.glob('*.tmp'):
+            try:
+                if path.stat().st_mtime < stale_before:
+                    path.unlink()
+            except OSError:
+                continue
+
+        entries = []
+        for path in self.cache_dir.glob('*.npz'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.cache_dir.glob('*.npz'):
+            path.unlink(missing_ok=True)
+
+
+def segment_image(image: np.ndarray, n_colors: int, pyramid_levels: int = 0, seed: int = 42,
+                  cache: Optional[SegmentationCache] = None) -> Segmentation:
+    """Quantizzazione + componenti connesse, riusando la cache se disponibile
+
+    Il seed fisso rende K-Means riproducibile, quindi una voce in cache equivale
+    a rieseguire la segmentazione con gli stessi parametri.
+    """
+    params = {'n_colors': n_colors, 'pyramid_levels': pyramid_levels, 'seed': seed}
+    key = SegmentationCache.key(image, params) if cache is not None else None
+
+    if cache is not None:
+        arrays = cache.get(key)
+        if arrays is not None:
+            components = ComponentTable(
+                component_map=arrays['component_map'],
+                labels=arrays['labels'],
+                areas=arrays['areas'],
+                bboxes=arrays['bboxes'],
+                centroids=arrays['centroids']
+            )
+            return Segmentation(components, arrays['centers'], str(arrays['method']), cached=True)
+
+    labels, centers, method = quantize_pyramid(image, n_colors, levels=pyramid_levels, seed=seed)
+    if pyramid_levels > 0:
+        method += '-pyramid'
+    components = find_components(labels)
+
+    if cache is not None:
+        cache.put(key, {
+            'component_map': components.component_map,
+            'labels': components.labels,
+            'areas': components.areas,
+            'bboxes': components.bboxes,
+            'centroids': components.centroids,
+            'centers': centers,
+            'method': np.array(method)
+        })
+
+    return Segmentation(components, centers, method)
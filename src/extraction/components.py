@@ -0,0 +1,214 @@
+"""
+Connected Components - Componenti connesse di tutti i cluster in un solo passaggio
+Lavora sulle run orizzontali della label map invece di una maschera per colore,
+anche a bande di righe per immagini che non stanno in memoria
+"""
+
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+@dataclass
+class ComponentTable:
+    """Tabella delle componenti connesse di una label map"""
+    component_map: np.ndarray  # HxW int32, id componente per ogni pixel
+    labels: np.ndarray         # (C,) cluster di appartenenza
+    areas: np.ndarray          # (C,) numero di pixel
+    bboxes: np.ndarray         # (C, 4) x, y, w, h (come cv2.boundingRect)
+    centroids: np.ndarray      # (C, 2) cx, cy (media dei pixel)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def select(self, min_area: float = 0) -> np.ndarray:
+        """Id delle componenti che possono avere contourArea >= min_area
+
+        Filtra sull'area del bounding box (limite superiore dell'area del contorno),
+        quindi nessuna componente valida viene scartata.
+        """
+        bbox_area = self.bboxes[:, 2] * self.bboxes[:, 3]
+        return np.flatnonzero(bbox_area >= min_area)
+
+    def mask(self, cid: int) -> np.ndarray:
+        """Maschera uint8 della componente ritagliata sul suo bounding box"""
+        x, y, w, h = self.bboxes[cid]
+        return (self.component_map[y:y + h, x:x + w] == cid).astype(np.uint8) * 255
+
+    def contour(self, cid: int) -> np.ndarray:
+        """Contorno esterno della componente in coordinate immagine"""
+        x, y = self.bboxes[cid][:2]
+        contours, _ = cv2.findContours(
+            self.mask(cid), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(int(x), int(y))
+        )
+        return max(contours, key=cv2.contourArea)
+
+
+class ComponentBuilder:
+    """Costruisce la ComponentTable a bande di righe consecutive
+
+    Ogni riga viene divisa in run di pixel con la stessa label; le run di righe
+    adiacenti con la stessa label che si toccano vengono unite con un grafo sparso.
+    L'ultima riga di ogni banda fa da alone (halo) per la banda successiva, quindi le
+    componenti attraversano i bordi delle bande senza mai tenere l'immagine intera.
+
+    Memoria: i pixel servono solo durante add_rows, ma run e adiacenze di tutta
+    l'immagine restano in RAM fino a build() (~16 byte per run + 16 per adiacenza,
+    circa il doppio durante build per concatenazione e grafo). Crescono con il numero
+    di cambi di colore per riga, non con i pixel: vedi nbytes.
+    """
+
+    def __init__(self, width: int, connectivity: int = 8):
+        self.width = width
+        self.connectivity = connectivity
+        self.height = 0
+        self.n_runs = 0
+
+        self._rows, self._x, self._lengths, self._labels = [], [], [], []
+        self._src, self._dst = [], []
+        self._prev_row: Optional[np.ndarray] = None
+        self._prev_ids: Optional[np.ndarray] = None
+
+    @property
+    def nbytes(self) -> int:
+        """Byte occupati da run e adiacenze accumulate finora"""
+        return sum(a.nbytes for parts in (self._rows, self._x, self._lengths, self._labels,
+                                          self._src, self._dst) for a in parts)
+
+    def add_rows(self, rows: np.ndarray):
+        """Aggiunge una banda di righe (h x W) della label map"""
+        width = self.width
+        halo = 0 if self._prev_row is None else 1
+        block = rows if not halo else np.vstack([self._prev_row[None], rows])
+        block_h = block.shape[0]
+        flat = block.ravel()
+        n_pixels = flat.size
+
+        # 1. Run orizzontali (inizio riga o cambio di label)
+        change = np.empty(n_pixels, dtype=bool)
+        change[0] = True
+        np.not_equal(flat[1:], flat[:-1], out=change[1:])
+        change[::width] = True
+
+        starts = np.flatnonzero(change)
+        del change
+        lengths = np.diff(np.append(starts, n_pixels))
+        run_rows = starts // width
+        run_x = starts - run_rows * width
+        run_labels = flat[starts]
+
+        # Id globali: le run dell'alone esistono già, le altre sono nuove
+        n_halo = int(np.searchsorted(run_rows, halo))
+        n_new = len(starts) - n_halo
+        ids = np.empty(len(starts), dtype=np.int64)
+        if halo:
+            ids[:n_halo] = self._prev_ids
+        ids[n_halo:] = np.arange(self.n_runs, self.n_runs + n_new)
+
+        # 2. Adiacenze verticali: l'inizio di una run (e il pixel a sinistra se 8-connessa)
+        #    cade sempre dentro ogni run adiacente della riga sopra/sotto
+        offsets = [0, -1] if self.connectivity == 8 else [0]
+        for dy in (width, -width):
+            valid_row = (run_rows < block_h - 1) if dy > 0 else (run_rows > 0)
+            for dx in offsets:
+                idx = np.flatnonzero(valid_row & (run_x + dx >= 0))
+                pos = starts[idx] + dy + dx
+                other = np.searchsorted(starts, pos, side='right') - 1
+                same = run_labels[other] == run_labels[idx]
+                self._src.append(ids[idx[same]])
+                self._dst.append(ids[other[same]])
+
+        self._rows.append((run_rows[n_halo:] - halo + self.height).astype(np.int32))
+        self._x.append(run_x[n_halo:].astype(np.int32))
+        self._lengths.append(lengths[n_halo:].astype(np.int32))
+        self._labels.append(run_labels[n_halo:])
+
+        last_row = int(np.searchsorted(run_rows, block_h - 1))
+        self._prev_row = np.array(block[-1])
+        self._prev_ids = ids[last_row:]
+        self.n_runs += n_new
+        self.height += block_h - halo
+
+    def build(self, component_map: Optional[np.ndarray] = None,
+              rows_per_chunk: Optional[int] = None) -> ComponentTable:
+        """Unisce le run in componenti e calcola le statistiche
+
+        component_map: array HxW int32 da riempire (es. np.memmap su disco);
+        se None viene allocato in memoria. rows_per_chunk limita la memoria del riempimento.
+        """
+        width, height = self.width, self.height
+        run_rows = np.concatenate(self._rows)
+        run_x = np.concatenate(self._x)
+        lengths = np.concatenate(self._lengths).astype(np.int64)
+        run_labels = np.concatenate(self._labels)
+        src = np.concatenate(self._src)
+        dst = np.concatenate(self._dst)
+
+        n_runs = self.n_runs
+        graph = coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n_runs, n_runs))
+        n_comp, run_comp = connected_components(graph, directed=False)
+
+        # 3. Statistiche per componente con riduzioni vettorizzate
+        areas = np.bincount(run_comp, weights=lengths, minlength=n_comp).astype(np.int64)
+
+        x_min = np.full(n_comp, width, dtype=np.int64)
+        x_max = np.zeros(n_comp, dtype=np.int64)
+        y_min = np.full(n_comp, height, dtype=np.int64)
+        y_max = np.zeros(n_comp, dtype=np.int64)
+        np.minimum.at(x_min, run_comp, run_x)
+        np.maximum.at(x_max, run_comp, run_x + lengths - 1)
+        np.minimum.at(y_min, run_comp, run_rows)
+        np.maximum.at(y_max, run_comp, run_rows)
+        bboxes = np.column_stack([x_min, y_min, x_max - x_min + 1, y_max - y_min + 1])
+
+        sum_x = np.bincount(run_comp, weights=lengths * (2 * run_x + lengths - 1) / 2, minlength=n_comp)
+        sum_y = np.bincount(run_comp, weights=lengths * run_rows, minlength=n_comp)
+        centroids = np.column_stack([sum_x / areas, sum_y / areas])
+
+        comp_labels = np.empty(n_comp, dtype=run_labels.dtype)
+        comp_labels[run_comp] = run_labels
+
+        # Le run coprono ogni pixel in ordine row-major: la mappa è una semplice ripetizione
+        run_comp = run_comp.astype(np.int32)
+        if component_map is None:
+            component_map = np.repeat(run_comp, lengths).reshape((height, width))
+        else:
+            step = rows_per_chunk or height
+            for y0 in range(0, height, step):
+                y1 = min(height, y0 + step)
+                r0, r1 = np.searchsorted(run_rows, [y0, y1])
+                component_map[y0:y1] = np.repeat(run_comp[r0:r1], lengths[r0:r1]).reshape((y1 - y0, width))
+
+        return ComponentTable(
+            component_map=component_map,
+            labels=comp_labels,
+            areas=areas,
+            bboxes=bboxes,
+            centroids=centroids
+        )
+
+
+def find_components(labels: np.ndarray, connectivity: int = 8) -> ComponentTable:
+    """Trova le componenti connesse di tutti i cluster di una label map HxW
+
+    Con connectivity=8 le componenti coincidono con i blob di cv2.findContours.
+    """
+    builder = ComponentBuilder(labels.shape[1], connectivity)
+    builder.add_rows(labels)
+    return builder.build()
+
+
+def rasterize_contours(contours: List[np.ndarray], shape: Tuple[int, int]) -> np.ndarray:
+    """Raster id-regione HxW: indice del contorno + 1 (0 = nessuna regione)
+
+    I contorni vengono riempiti in ordine: dove si sovrappongono vince l'ultimo,
+    cioè quello disegnato sopra. uint16 fino a 65535 regioni, altrimenti int32.
+    """
+    dtype = np.uint16 if len(contours) < np.iinfo(np.uint16).max else np.int32
+    raster = np.zeros(shape[:2], dtype=dtype)
+    for i, contour in enumerate(contours):
+        cv2.drawContours(raster, [contour], 0, i + 1, thickness=cv2.FILLED)
+    return raster
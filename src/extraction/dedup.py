@@ -0,0 +1,68 @@
+"""
+Deduplicazione - Rimozione regioni sovrapposte con prefiltro sui bounding box
+La sovrapposizione viene misurata solo sul ritaglio comune dei due bbox
+"""
+
+import cv2
+import numpy as np
+from typing import Dict, List
+
+
+def _overlap_pixels(contour1: np.ndarray, contour2: np.ndarray, x: int, y: int, w: int, h: int) -> int:
+    """Pixel in comune tra i due contorni riempiti, dentro il rettangolo (x, y, w, h)"""
+    mask1 = np.zeros((h, w), dtype=np.uint8)
+    mask2 = np.zeros((h, w), dtype=np.uint8)
+    cv2.drawContours(mask1, [contour1], 0, 255, -1, offset=(-x, -y))
+    cv2.drawContours(mask2, [contour2], 0, 255, -1, offset=(-x, -y))
+    return int(np.count_nonzero(mask1 & mask2))
+
+
+def remove_overlaps(candidates: List[Dict], max_regions: int = 30,
+                    overlap_ratio: float = 0.8) -> List[Dict]:
+    """Tiene i candidati (ordinati per area) che non duplicano una regione già accettata
+
+    Un candidato è un duplicato se il suo centroide cade in una regione accettata o se
+    la sovrapposizione supera overlap_ratio dell'area minore. Entrambi i casi richiedono
+    che i bbox si intersechino, quindi si confrontano solo quelle coppie.
+    Ogni candidato deve avere 'contour', 'centroid' e 'area'.
+    """
+    accepted = []
+    boxes = np.empty((len(candidates), 4), dtype=np.int64)  # x1, y1, x2, y2 (esclusivi)
+
+    for candidate in candidates[:max_regions]:
+        x, y, w, h = cv2.boundingRect(candidate['contour'])
+        box = np.array([x, y, x + w, y + h])
+
+        # Prefiltro: solo regioni accettate con bbox che interseca quello del candidato
+        n = len(accepted)
+        hits = np.flatnonzero(
+            (boxes[:n, 0] < box[2]) & (boxes[:n, 2] > box[0]) &
+            (boxes[:n, 1] < box[3]) & (boxes[:n, 3] > box[1])
+        )
+
+        is_duplicate = False
+        cx, cy = candidate['centroid']
+
+        for idx in hits:
+            existing = accepted[idx]
+
+            # Se centroide dentro altra regione
+            result = cv2.pointPolygonTest(existing['contour'], (float(cx), float(cy)), False)
+            if result >= 0:
+                is_duplicate = True
+                break
+
+            # Se aree si sovrappongono > overlap_ratio (solo sul ritaglio comune)
+            ix1, iy1 = np.maximum(box[:2], boxes[idx, :2])
+            ix2, iy2 = np.minimum(box[2:], boxes[idx, 2:])
+            overlap = _overlap_pixels(candidate['contour'], existing['contour'],
+                                      int(ix1), int(iy1), int(ix2 - ix1), int(iy2 - iy1))
+            if overlap > overlap_ratio * min(candidate['area'], existing['area']):
+                is_duplicate = True
+                break
+
+        if not is_duplicate:
+            boxes[len(accepted)] = box
+            accepted.append(candidate)
+
+    return accepted
@@ -0,0 +1,317 @@
+"""
+Geo Store - Layer di riferimento (GADM, Natural Earth) compilati in formato binario
+Coordinate, offset di anelli/poligoni/feature, bbox e tabella attributi salvati come
+.npy in una cartella <file>.geostore accanto al file sorgente e riaperti con mmap,
+invece di rileggere lo shapefile con GeoPandas a ogni avvio
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# geopandas/shapely servono solo per compilare e ricostruire le geometrie:
+# vengono importati nelle funzioni, così il resto del pacchetto non ne dipende
+
+# Da incrementare quando cambia il formato (invalida gli store su disco)
+STORE_VERSION = 2
+
+STORE_SUFFIX = '.geostore'
+
+# File che compongono uno shapefile (la firma del sorgente li considera tutti)
+SHAPEFILE_PARTS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+
+
+def store_path_for(source_path: Path) -> Path:
+    """<file>.geostore: l'estensione resta nel nome (x.shp e x.geojson non si sovrascrivono)"""
+    source_path = Path(source_path)
+    return source_path.with_name(source_path.name + STORE_SUFFIX)
+
+
+def source_signature(source_path: Path) -> List[List[int]]:
+    """Dimensione e mtime del file sorgente (e delle altre parti se shapefile)"""
+    source_path = Path(source_path)
+    if source_path.suffix.lower() == '.shp':
+        files = [source_path.with_suffix(suffix) for suffix in SHAPEFILE_PARTS]
+    else:
+        files = [source_path]
+    return [[p.stat().st_size, p.stat().st_mtime_ns] for p in files if p.is_file()]
+
+
+class GeoStore:
+    """Store compilato aperto in sola lettura (array mappati con mmap)
+
+    L'apertura legge solo meta.json; gli array vengono mappati al primo accesso.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / 'meta.json', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Versione store non supportata: {self.meta.get('version')}")
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def _array(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            self._arrays[name] = np.load(str(self.path / f"{name}.npy"), mmap_mode='r')
+        return self._arrays[name]
+
+    def __len__(self) -> int:
+        return self.meta['count']
+
+    @property
+    def columns(self) -> List[str]:
+        return [column['name'] for column in self.meta['columns']]
+
+    @property
+    def bboxes(self) -> np.ndarray:
+        """(N, 4) minx, miny, maxx, maxy di ogni feature"""
+        return self._array('bboxes')
+
+    def is_current(self, source_path: Path) -> bool:
+        return self.meta.get('source') == source_signature(source_path)
+
+    def attribute(self, name: str) -> 'pandas.Series':
+        """Colonna della tabella attributi (pd.Series) con il dtype del sorgente
+
+        Stringhe e booleani con valori mancanti tornano oggetti Python (mancanti → None),
+        interi/booleani nullable, date e categorie tornano con il loro dtype pandas.
+        """
+        import pandas as pd
+
+        column = next(c for c in self.meta['columns'] if c['name'] == name)
+        prefix = f"attr_{column['index']}"
+        values = np.array(self._array(prefix))
+        kind = column['kind']
+
+        if kind == 'number':
+            return pd.Series(values, name=name)
+        if kind == 'masked':
+            result = pd.array(values, dtype=column['dtype'])
+            result[np.asarray(self._array(f"{prefix}_null"))] = pd.NA
+            return pd.Series(result, name=name)
+        if kind == 'datetime':
+            result = pd.DatetimeIndex(values)
+            if column['tz'] is not None:
+                result = result.tz_localize('UTC').tz_convert(column['tz'])
+            return pd.Series(result.astype(column['dtype']), name=name)
+        if kind == 'category':
+            categories = np.array(self._array(f"{prefix}_categories")).tolist()
+            return pd.Series(pd.Categorical.from_codes(values, categories=categories,
+                                                       ordered=column['ordered']), name=name)
+
+        # 'str' e 'bool': oggetti Python, i mancanti tornano None
+        result = values.astype(object)
+        if column['has_nulls']:
+            result[self._array(f"{prefix}_null")] = None
+        # dtype esplicito: 'object' resta object (pandas 3 lo convertirebbe in 'str')
+        return pd.Series(result, dtype=column['dtype'], name=name)
+
+    def geometries(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """Geometrie shapely (tutte o solo quelle in indices)"""
+        import shapely
+
+        coords = self._array('coords')
+        ring_offsets = self._array('ring_offsets')
+        polygon_offsets = self._array('polygon_offsets')
+        part_offsets = self._array('part_offsets')
+        single = self._array('single')
+
+        if indices is None:
+            geometries = shapely.from_ragged_array(
+                shapely.GeometryType.MULTIPOLYGON, np.asarray(coords, dtype=np.float64),
+                (np.asarray(ring_offsets), np.asarray(polygon_offsets), np.asarray(part_offsets)))
+        else:
+            geometries = np.array([self._geometry(i) for i in np.atleast_1d(indices)], dtype=object)
+            single = single[np.atleast_1d(indices)]
+
+        # Le feature che erano Polygon tornano Polygon (from_ragged_array dà MultiPolygon)
+        geometries[single] = shapely.get_geometry(geometries[single], 0)
+        return geometries
+
+    def _geometry(self, index: int):
+        """MultiPolygon di una feature letto solo dalla sua porzione degli array"""
+        from shapely.geometry import MultiPolygon, Polygon
+
+        coords = self._array('coords')
+        ring_offsets = self._array('ring_offsets')
+        polygon_offsets = self._array('polygon_offsets')
+        part_offsets = self._array('part_offsets')
+
+        polygons = []
+        for polygon in range(part_offsets[index], part_offsets[index + 1]):
+            rings = [np.asarray(coords[ring_offsets[r]:ring_offsets[r + 1]], dtype=np.float64)
+                     for r in range(polygon_offsets[polygon], polygon_offsets[polygon + 1])]
+            polygons.append(Polygon(rings[0], rings[1:]))
+        return MultiPolygon(polygons)
+
+    def to_geodataframe(self):
+        """GeoDataFrame con le stesse colonne (e lo stesso ordine) del sorgente"""
+        import geopandas as gpd
+
+        data = {name: self.attribute(name) for name in self.columns}
+        return gpd.GeoDataFrame(data, geometry=self.geometries(), crs=self.meta['crs'])
+
+
+def _attribute_arrays(series, prefix: str, arrays: Dict[str, np.ndarray]) -> Dict:
+    """Converte una colonna in array nativi (aggiunti ad arrays), restituisce i campi
+    di meta.json che servono a GeoStore.attribute per ricostruirla
+
+    - numeri e booleani NumPy: così come sono ('number')
+    - interi/float/booleani nullable di pandas (Int64, boolean...): valori + maschera ('masked')
+    - date (anche con fuso orario): datetime64 UTC, NaT per i mancanti ('datetime')
+    - categorie: codici + categorie ('category')
+    - oggetti tutti booleani (es. GeoJSON con null): bool + maschera ('bool')
+    - tutto il resto: stringhe + maschera dei mancanti ('str')
+    """
+    import pandas as pd
+
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        arrays[prefix] = series.to_numpy()
+        return {'kind': 'number'}
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = dtype.categories.to_numpy()
+        arrays[prefix] = series.cat.codes.to_numpy()
+        arrays[f"{prefix}_categories"] = categories.astype(str) if categories.dtype == object else categories
+        return {'kind': 'category', 'ordered': bool(dtype.ordered)}
+
+    if isinstance(dtype, pd.DatetimeTZDtype) or (isinstance(dtype, np.dtype) and dtype.kind == 'M'):
+        tz = getattr(dtype, 'tz', None)
+        values = series.dt.tz_convert('UTC').dt.tz_localize(None) if tz is not None else series
+        arrays[prefix] = values.to_numpy()
+        return {'kind': 'datetime', 'tz': str(tz) if tz is not None else None}
+
+    nulls = series.isna().to_numpy()
+    if dtype.kind in 'biuf':  # estensioni nullable di pandas
+        fill = False if dtype.kind == 'b' else 0
+        arrays[prefix] = series.fillna(fill).to_numpy(dtype=dtype.numpy_dtype)
+        arrays[f"{prefix}_null"] = nulls
+        return {'kind': 'masked'}
+
+    if pd.api.types.infer_dtype(series, skipna=True) == 'boolean':
+        arrays[prefix] = series.where(~nulls, False).to_numpy(dtype=bool)
+        kind = 'bool'
+    else:
+        arrays[prefix] = np.array(series.where(~nulls, '').astype(str).tolist(), dtype=str)
+        kind = 'str'
+    if nulls.any():
+        arrays[f"{prefix}_null"] = nulls
+    return {'kind': kind, 'has_nulls': bool(nulls.any())}
+
+
+def compile_geostore(source_path: Path, coord_dtype=np.float64, gdf=None) -> Path:
+    """Compila il layer (shapefile, GeoJSON, GeoPackage...) in <file>.geostore
+
+    coord_dtype: np.float32 dimezza lo spazio (precisione ~1e-6 gradi, circa 10 cm)
+    gdf: GeoDataFrame già letto (altrimenti gpd.read_file)
+    Solo layer poligonali (Polygon/MultiPolygon), come GADM e Natural Earth.
+    """
+    import geopandas as gpd
+    import shapely
+
+    source_path = Path(source_path)
+    if gdf is None:
+        gdf = gpd.read_file(str(source_path))
+
+    geometries = np.asarray(gdf.geometry.values, dtype=object)
+    types = shapely.get_type_id(geometries)
+    if not np.isin(types, (shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON)).all():
+        raise ValueError("Lo store supporta solo layer di Polygon/MultiPolygon")
+
+    _, coords, (ring_offsets, polygon_offsets, part_offsets) = shapely.to_ragged_array(geometries)
+    arrays = {
+        'coords': coords.astype(coord_dtype),
+        'ring_offsets': ring_offsets.astype(np.int64),
+        'polygon_offsets': polygon_offsets.astype(np.int64),
+        'part_offsets': part_offsets.astype(np.int64),
+        'single': types == shapely.GeometryType.POLYGON,
+        'bboxes': shapely.bounds(geometries),
+    }
+
+    # Tabella attributi: solo array nativi (mai object, che np.load non può mappare)
+    columns = []
+    for index, name in enumerate(c for c in gdf.columns if c != gdf.geometry.name):
+        column = {'name': name, 'index': index, 'dtype': str(gdf[name].dtype)}
+        column.update(_attribute_arrays(gdf[name], f"attr_{index}", arrays))
+        columns.append(column)
+
+    meta = {
+        'version': STORE_VERSION,
+        'source': source_signature(source_path),
+        'count': len(gdf),
+        'crs': gdf.crs.to_string() if gdf.crs is not None else None,
+        'columns': columns,
+    }
+
+    # Scrittura atomica: cartella temporanea accanto, poi sostituzione
+    path = store_path_for(source_path)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=path.name + '.', dir=path.parent))
+    try:
+        for name, array in arrays.items():
+            np.save(str(tmp_dir / f"{name}.npy"), array)
+        with open(tmp_dir / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp_dir, path)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return path
+
+
+def read_reference(source_path: Path, compile: bool = True):
+    """GeoDataFrame del layer: dallo store compilato se aggiornato, altrimenti gpd.read_file
+
+    compile: dopo una lettura con GeoPandas compila lo store per i prossimi avvii
+             (ignorato se la cartella non è scrivibile o il layer non è poligonale)
+    """
+    import geopandas as gpd
+
+    source_path = Path(source_path)
+    store_path = store_path_for(source_path)
+    if store_path.is_dir():
+        try:
+            store = GeoStore(store_path)
+            if store.is_current(source_path):
+                return store.to_geodataframe()
+        except (OSError, ValueError, KeyError):
+            pass
+
+    gdf = gpd.read_file(str(source_path))
+    if compile:
+        try:
+            compile_geostore(source_path, gdf=gdf)
+        except (OSError, ValueError):
+            pass
+    return gdf
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compila layer di riferimento in store binari (mmap)')
+    parser.add_argument('sources', nargs='+', help='Shapefile/GeoJSON da compilare')
+    parser.add_argument('--float32', action='store_true', help='Coordinate float32 (metà spazio)')
+    args = parser.parse_args()
+
+    for source in args.sources:
+        t0 = time.perf_counter()
+        path = compile_geostore(Path(source), np.float32 if args.float32 else np.float64)
+        size = sum(p.stat().st_size for p in path.iterdir()) / (1024 * 1024)
+        print(f"✅ {path} ({size:.1f} MB, {time.perf_counter() - t0:.1f}s)")
+
+        t0 = time.perf_counter()
+        read_reference(Path(source), compile=False)
+        print(f"   Apertura: {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
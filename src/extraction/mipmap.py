@@ -0,0 +1,142 @@
+"""
+Mipmap - Piramide di immagini a tile per zoom e pan nei canvas
+I livelli (1/2, 1/4, ...) vengono calcolati una volta; una vista a scala qualsiasi
+si compone di tile ricampionati dal livello più vicino, quindi il costo di un
+aggiornamento dipende dalla porzione visibile e non dalla dimensione della scansione
+"""
+
+import math
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+DEFAULT_TILE_SIZE = 256
+DEFAULT_MAX_BYTES = 128 * 1024 ** 2
+
+
+class ImagePyramid:
+    """Livelli dimezzati (INTER_AREA) fino a stare in un tile"""
+
+    def __init__(self, image: np.ndarray, min_size: int = DEFAULT_TILE_SIZE):
+        self.levels: List[np.ndarray] = [image]
+        while max(self.levels[-1].shape[:2]) > min_size:
+            h, w = self.levels[-1].shape[:2]
+            self.levels.append(cv2.resize(np.asarray(self.levels[-1]), ((w + 1) // 2, (h + 1) // 2),
+                                          interpolation=cv2.INTER_AREA))
+
+    @property
+    def width(self) -> int:
+        return self.levels[0].shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.levels[0].shape[0]
+
+    def level_for(self, scale: float) -> int:
+        """Livello più piccolo con risoluzione >= scala (la vista riduce al più di 2x)"""
+        for level in range(len(self.levels) - 1, 0, -1):
+            if self.levels[level].shape[1] / self.width >= scale:
+                return level
+        return 0
+
+    def view_size(self, scale: float) -> Tuple[int, int]:
+        """Dimensione (w, h) dell'immagine intera alla scala"""
+        return max(1, round(self.width * scale)), max(1, round(self.height * scale))
+
+
+class TileCache:
+    """Tile della vista (per scala) ricampionati dalla piramide, cache LRU con limite in byte
+
+    Coordinate della vista: pixel dell'immagine intera alla scala richiesta.
+    convert: codice cv2.cvtColor applicato ai tile (es. cv2.COLOR_BGR2RGB per Tk).
+    """
+
+    def __init__(self, pyramid: ImagePyramid, tile_size: int = DEFAULT_TILE_SIZE,
+                 max_bytes: int = DEFAULT_MAX_BYTES, convert: Optional[int] = None):
+        self.pyramid = pyramid
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes
+        self.convert = convert
+        self._tiles: 'OrderedDict[Tuple[float, int, int], np.ndarray]' = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def tiles_in(self, scale: float, x0: float, y0: float, x1: float, y1: float) -> Iterator[Tuple[int, int]]:
+        """Indici (tx, ty) dei tile che intersecano il rettangolo della vista"""
+        view_w, view_h = self.pyramid.view_size(scale)
+        size = self.tile_size
+        tx0, ty0 = max(0, int(x0 // size)), max(0, int(y0 // size))
+        tx1 = min(math.ceil(view_w / size), math.ceil(x1 / size))
+        ty1 = min(math.ceil(view_h / size), math.ceil(y1 / size))
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                yield tx, ty
+
+    def tile(self, scale: float, tx: int, ty: int) -> np.ndarray:
+        """Tile (tx, ty) della vista alla scala (più piccolo sui bordi dell'immagine)"""
+        key = (scale, tx, ty)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+        self.misses += 1
+        tile = self._render_tile(scale, tx, ty)
+        self._tiles[key] = tile
+        self.nbytes += tile.nbytes
+        while self.nbytes > self.max_bytes and len(self._tiles) > 1:
+            _, old = self._tiles.popitem(last=False)
+            self.nbytes -= old.nbytes
+        return tile
+
+    def _render_tile(self, scale: float, tx: int, ty: int) -> np.ndarray:
+        view_w, view_h = self.pyramid.view_size(scale)
+        vx0, vy0 = tx * self.tile_size, ty * self.tile_size
+        vx1, vy1 = min(view_w, vx0 + self.tile_size), min(view_h, vy0 + self.tile_size)
+
+        source = self.pyramid.levels[self.pyramid.level_for(scale)]
+        src_h, src_w = source.shape[:2]
+        rx, ry = view_w / src_w, view_h / src_h  # ingrandimento livello → vista
+
+        # Porzione del livello che copre il tile (centri dei pixel + 1 px per l'interpolazione)
+        sx0 = max(0, int(math.floor((vx0 + 0.5) / rx - 0.5)) - 1)
+        sy0 = max(0, int(math.floor((vy0 + 0.5) / ry - 0.5)) - 1)
+        sx1 = min(src_w, int(math.ceil((vx1 - 0.5) / rx - 0.5)) + 2)
+        sy1 = min(src_h, int(math.ceil((vy1 - 0.5) / ry - 0.5)) + 2)
+        crop = np.ascontiguousarray(source[sy0:sy1, sx0:sx1])
+
+        matrix = np.array([[rx, 0, (sx0 + 0.5) * rx - 0.5 - vx0],
+                           [0, ry, (sy0 + 0.5) * ry - 0.5 - vy0]], dtype=np.float64)
+        tile = cv2.warpAffine(crop, matrix, (vx1 - vx0, vy1 - vy0), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_REPLICATE)
+        if self.convert is not None:
+            tile = cv2.cvtColor(tile, self.convert)
+        return tile
+
+    def render(self, scale: float, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Rettangolo [x0, x1) x [y0, y1) della vista composto dai tile"""
+        view_w, view_h = self.pyramid.view_size(scale)
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(view_w, x1), min(view_h, y1)
+
+        tiles = [(tx, ty, self.tile(scale, tx, ty)) for tx, ty in self.tiles_in(scale, x0, y0, x1, y1)]
+        if not tiles:
+            return np.zeros((max(0, y1 - y0), max(0, x1 - x0), 3), dtype=np.uint8)
+
+        out = np.empty((y1 - y0, x1 - x0) + tiles[0][2].shape[2:], dtype=tiles[0][2].dtype)
+        size = self.tile_size
+        for tx, ty, tile in tiles:
+            tile_x, tile_y = tx * size, ty * size
+            ax0, ay0 = max(x0, tile_x), max(y0, tile_y)
+            ax1, ay1 = min(x1, tile_x + tile.shape[1]), min(y1, tile_y + tile.shape[0])
+            out[ay0 - y0:ay1 - y0, ax0 - x0:ax1 - x0] = tile[ay0 - tile_y:ay1 - tile_y, ax0 - tile_x:ax1 - tile_x]
+        return out
+
+    def clear(self):
+        self._tiles.clear()
+        self.nbytes = 0
@@ -0,0 +1,120 @@
+"""
+Exact Palette - Scorciatoia per mappe a colori piatti
+Se pochi colori esatti coprono quasi tutta l'immagine, la label map si ottiene
+con una lookup table invece che con K-Means
+"""
+
+import numpy as np
+from typing import Optional, Tuple
+
+from .quantization import ColorQuantizer, assign_nearest
+
+
+def pack_rgb(image: np.ndarray) -> np.ndarray:
+    """Impacchetta i 3 canali uint8 in un unico uint32 (c0 << 16 | c1 << 8 | c2)"""
+    packed = image[..., 0].astype(np.uint32) << 16
+    packed |= image[..., 1].astype(np.uint32) << 8
+    packed |= image[..., 2]
+    return packed
+
+
+def unpack_rgb(packed: np.ndarray) -> np.ndarray:
+    """Inverso di pack_rgb: uint32 → Nx3 float32 (stesso ordine di canali)"""
+    return np.column_stack([
+        (packed >> 16) & 0xFF,
+        (packed >> 8) & 0xFF,
+        packed & 0xFF
+    ]).astype(np.float32)
+
+
+def _is_blend(color: np.ndarray, count: int, palette: np.ndarray, palette_counts: np.ndarray,
+              tolerance: float = 6.0, ratio: float = 0.1) -> bool:
+    """True se il colore è un bordo di anti-aliasing di due colori di palette
+
+    Cioè se sta (quasi) sul segmento tra due colori di palette ed è molto meno
+    frequente di entrambi (le vere campiture sono aree, i bordi sono linee).
+    """
+    a = palette[:, None, :]
+    d = palette[None, :, :] - a
+    length_sq = np.maximum(np.sum(d * d, axis=2), 1e-6)
+    t = np.clip(np.sum((color - a) * d, axis=2) / length_sq, 0.0, 1.0)
+    dist = np.linalg.norm(a + t[..., None] * d - color, axis=2)
+
+    rare = count < ratio * np.minimum(palette_counts[:, None], palette_counts[None, :])
+    return bool(np.any((dist <= tolerance) & rare))
+
+
+def exact_palette(image: np.ndarray, max_colors: int, coverage: float = 0.9,
+                  min_share: float = 1e-4, sample_size: int = 50_000, seed: int = 42
+                  ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Label map da palette esatta, oppure None se l'immagine non è a colori piatti
+
+    La palette è formata dai colori più frequenti (al massimo max_colors, ognuno con
+    almeno min_share dei pixel); se coprono almeno `coverage` dell'immagine, i pixel
+    della palette vengono etichettati con una lookup e i rimanenti (bordi anti-aliasing)
+    vengono assegnati al colore di palette più vicino.
+    """
+    height, width = image.shape[:2]
+    packed = pack_rgb(image).ravel()
+    n_pixels = packed.size
+
+    # 1. Preflight su un campione: scarta subito foto/scansioni con migliaia di colori
+    sample = packed
+    if n_pixels > sample_size:
+        rng = np.random.default_rng(seed)
+        sample = packed[rng.integers(0, n_pixels, size=sample_size)]
+    _, sample_counts = np.unique(sample, return_counts=True)
+    sample_counts = np.sort(sample_counts)[::-1][:max_colors]
+    if sample_counts.sum() < coverage * len(sample):
+        return None
+
+    # 2. Istogramma esatto su tutti i pixel (24 bit → bincount)
+    counts = np.bincount(packed, minlength=1 << 24)
+    present = np.flatnonzero(counts >= max(1, min_share * n_pixels))
+    ranked = present[np.argsort(counts[present], kind='stable')[::-1]]
+
+    # I colori di anti-aliasing sono miscele di due colori più frequenti: si saltano
+    top = []
+    for packed_color in ranked:
+        if len(top) == max_colors:
+            break
+        if top and _is_blend(unpack_rgb(packed_color)[0], counts[packed_color],
+                             unpack_rgb(np.array(top, dtype=np.uint32)), counts[top]):
+            continue
+        top.append(packed_color)
+
+    top = np.array(top, dtype=np.int64)
+    if len(top) == 0 or counts[top].sum() < coverage * n_pixels:
+        return None
+    del counts
+
+    # 3. Lookup colore → indice di palette
+    lut = np.full(1 << 24, -1, dtype=np.int32)
+    lut[top] = np.arange(len(top), dtype=np.int32)
+    labels = lut[packed]
+    del lut
+
+    centers = unpack_rgb(top.astype(np.uint32))
+
+    # 4. Pixel fuori palette → colore di palette più vicino
+    rest = np.flatnonzero(labels < 0)
+    if len(rest):
+        pixels = image.reshape((-1, image.shape[2]))[rest]
+        labels[rest] = assign_nearest(pixels, centers)
+
+    return labels.reshape((height, width)), centers
+
+
+def quantize_image(image: np.ndarray, n_colors: int, use_palette: bool = True,
+                   **kwargs) -> Tuple[np.ndarray, np.ndarray, str]:
+    """Label map + centri, provando prima la palette esatta e poi K-Means
+
+    Restituisce (labels HxW, centri Kx3 float32, metodo) con metodo 'palette' o 'kmeans'.
+    """
+    if use_palette:
+        result = exact_palette(image, n_colors)
+        if result is not None:
+            return result[0], result[1], 'palette'
+
+    labels, centers = ColorQuantizer(n_colors, **kwargs).fit_predict(image)
+    return labels, centers, 'kmeans'
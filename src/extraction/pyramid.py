@@ -0,0 +1,90 @@
+"""
+Pyramid - Segmentazione coarse-to-fine
+La label map viene calcolata su un'immagine ridotta; a piena risoluzione si
+riassegnano solo i pixel in una fascia attorno ai confini trovati
+"""
+
+import cv2
+import numpy as np
+from typing import Tuple
+
+from .palette import pack_rgb, quantize_image
+from .quantization import assign_nearest
+
+
+def label_boundaries(labels: np.ndarray) -> np.ndarray:
+    """Maschera bool dei pixel con almeno un vicino (4-connesso) di label diversa"""
+    boundary = np.zeros(labels.shape, dtype=bool)
+    horizontal = labels[:, 1:] != labels[:, :-1]
+    vertical = labels[1:, :] != labels[:-1, :]
+    boundary[:, 1:] |= horizontal
+    boundary[:, :-1] |= horizontal
+    boundary[1:, :] |= vertical
+    boundary[:-1, :] |= vertical
+    return boundary
+
+
+def refine_labels(pixels: np.ndarray, centers: np.ndarray, method: str) -> np.ndarray:
+    """Label a piena risoluzione dei pixel Nx3 della fascia di confine
+
+    Con la palette esatta i colori di palette si trovano con una ricerca binaria sui
+    colori impacchettati; solo gli altri (anti-aliasing) passano da assign_nearest.
+    """
+    if method != 'palette':
+        return assign_nearest(pixels, centers)
+
+    palette = pack_rgb(centers.astype(np.uint8))
+    order = np.argsort(palette)
+    packed = pack_rgb(pixels)
+    pos = np.minimum(np.searchsorted(palette[order], packed), len(palette) - 1)
+    labels = order[pos].astype(np.int32)
+
+    rest = np.flatnonzero(palette[labels] != packed)
+    if len(rest):
+        labels[rest] = assign_nearest(pixels[rest], centers)
+    return labels
+
+
+def _upsample(small: np.ndarray, factor: int, height: int, width: int) -> np.ndarray:
+    """Ingrandimento nearest di un fattore intero, ritagliato a height x width"""
+    return np.repeat(np.repeat(small, factor, axis=0), factor, axis=1)[:height, :width].copy()
+
+
+def quantize_pyramid(image: np.ndarray, n_colors: int, levels: int = 2, band: int = 1,
+                     use_palette: bool = True, **kwargs) -> Tuple[np.ndarray, np.ndarray, str]:
+    """Come quantize_image, ma clustering su un'immagine ridotta di 2**levels
+
+    1. Sottocampionamento a passo fisso (niente interpolazione: i colori piatti restano
+       esatti e la palette esatta continua a funzionare)
+    2. Label map ridotta con quantize_image
+    3. Ingrandimento nearest: gli interni delle regioni restano quelli ridotti
+    4. Fascia di `band` pixel ridotti attorno ai confini → riassegnazione a piena
+       risoluzione al centro più vicino
+
+    I dettagli più piccoli di un pixel ridotto che non toccano un confine vanno persi.
+    Restituisce (labels HxW, centri Kx3 float32, metodo).
+    """
+    if levels <= 0:
+        return quantize_image(image, n_colors, use_palette=use_palette, **kwargs)
+
+    factor = 2 ** levels
+    height, width = image.shape[:2]
+
+    # 1-2. Label map sull'immagine ridotta
+    small = np.ascontiguousarray(image[::factor, ::factor])
+    small_labels, centers, method = quantize_image(small, n_colors, use_palette=use_palette, **kwargs)
+
+    # 3. Fascia di confine (nella risoluzione ridotta, poi ingrandita)
+    boundary = label_boundaries(small_labels).astype(np.uint8)
+    if band > 0:
+        kernel = np.ones((3, 3), dtype=np.uint8)
+        boundary = cv2.dilate(boundary, kernel, iterations=band)
+
+    labels = _upsample(small_labels, factor, height, width)
+
+    # 4. Riassegnazione a piena risoluzione dei soli pixel nella fascia
+    refine = _upsample(boundary, factor, height, width).view(bool)
+    if refine.any():
+        labels[refine] = refine_labels(image[refine], centers, method)
+
+    return labels, centers, method
@@ -0,0 +1,103 @@
+"""
+Color Quantization - Motore K-Means condiviso
+Stima i centri su un campione stratificato di pixel e poi assegna
+tutti i pixel al centro più vicino con un passaggio vettorizzato
+"""
+
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+
+
+def assign_nearest(pixels: np.ndarray, centers: np.ndarray, chunk_size: int = 1 << 18) -> np.ndarray:
+    """Indice del centro più vicino per ogni pixel (Nx3), a blocchi per limitare la memoria"""
+    labels = np.empty(len(pixels), dtype=np.int32)
+    centers = centers.astype(np.float32)
+    # ||x - c||² = ||x||² - 2·x·c + ||c||²  (||x||² è costante per riga, si ignora)
+    centers_sq = np.einsum('ij,ij->i', centers, centers)
+
+    for start in range(0, len(pixels), chunk_size):
+        chunk = pixels[start:start + chunk_size].astype(np.float32)
+        dist = centers_sq - 2.0 * (chunk @ centers.T)
+        labels[start:start + len(chunk)] = np.argmin(dist, axis=1)
+
+    return labels
+
+
+class ColorQuantizer:
+    """Quantizzazione colori in due fasi: fit su campione → assegnazione completa"""
+
+    def __init__(self, n_colors: int, sample_size: int = 50_000, attempts: int = 10,
+                 max_iter: int = 100, epsilon: float = 0.2, chunk_size: int = 1 << 18,
+                 seed: int = 42):
+        self.n_colors = n_colors
+        self.sample_size = sample_size
+        self.attempts = attempts
+        self.max_iter = max_iter
+        self.epsilon = epsilon
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.centers: Optional[np.ndarray] = None
+
+    def sample_pixels(self, image: np.ndarray) -> np.ndarray:
+        """Campione stratificato: un pixel casuale per ogni cella di una griglia regolare"""
+        height, width = image.shape[:2]
+        pixels = image.reshape((-1, image.shape[2]))
+
+        if height * width <= self.sample_size:
+            return pixels.astype(np.float32)
+
+        rng = np.random.default_rng(self.seed)
+
+        # Celle quadrate in modo che il numero di celle ≈ sample_size
+        cell = max(1, int(np.sqrt(height * width / self.sample_size)))
+        ys = np.arange(0, height, cell)
+        xs = np.arange(0, width, cell)
+        grid_y, grid_x = np.meshgrid(ys, xs, indexing='ij')
+
+        # Offset casuale dentro ogni cella (troncato ai bordi dell'immagine)
+        off_y = rng.integers(0, cell, size=grid_y.shape)
+        off_x = rng.integers(0, cell, size=grid_x.shape)
+        sy = np.minimum(grid_y + off_y, height - 1).ravel()
+        sx = np.minimum(grid_x + off_x, width - 1).ravel()
+
+        return pixels[sy * width + sx].astype(np.float32)
+
+    def fit(self, image: np.ndarray) -> np.ndarray:
+        """Stima i centri K-Means sul campione di pixel"""
+        sample = self.sample_pixels(image)
+        n_colors = min(self.n_colors, len(sample))
+
+        cv2.setRNGSeed(self.seed)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, self.max_iter, self.epsilon)
+        _, _, centers = cv2.kmeans(
+            sample,
+            n_colors,
+            None,
+            criteria,
+            self.attempts,
+            cv2.KMEANS_PP_CENTERS
+        )
+
+        self.centers = centers.astype(np.float32)
+        return self.centers
+
+    def predict(self, image: np.ndarray) -> np.ndarray:
+        """Assegna ogni pixel al centro più vicino (label map HxW int32)"""
+        if self.centers is None:
+            raise ValueError("Centri non stimati: chiama prima fit()")
+
+        height, width = image.shape[:2]
+        pixels = image.reshape((-1, image.shape[2]))
+        labels = assign_nearest(pixels, self.centers, self.chunk_size)
+        return labels.reshape((height, width))
+
+    def fit_predict(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Fit + assegnazione: restituisce (labels HxW, centri Kx3 float32)"""
+        self.fit(image)
+        return self.predict(image), self.centers
+
+
+def quantize_colors(image: np.ndarray, n_colors: int, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+    """Scorciatoia per ColorQuantizer(n_colors).fit_predict(image)"""
+    return ColorQuantizer(n_colors, **kwargs).fit_predict(image)
@@ -0,0 +1,75 @@
+"""
+Region Stats - Statistiche colore per regione con riduzioni vettorizzate
+Un solo passaggio di np.bincount sulla mappa id-regione sostituisce una maschera
+HxW + cv2.mean per ogni contorno
+"""
+
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+@dataclass
+class RegionStats:
+    """Statistiche per regione (indicizzate per id regione)"""
+    counts: np.ndarray     # (R,) numero di pixel
+    means: np.ndarray      # (R, C) colore medio per canale
+    variances: np.ndarray  # (R, C) varianza per canale
+
+
+def region_stats(region_map: np.ndarray, image: np.ndarray,
+                 n_regions: Optional[int] = None) -> RegionStats:
+    """Numero di pixel, colore medio e varianza di ogni regione in un solo passaggio
+
+    region_map: HxW con id regione >= 0 (es. ComponentTable.component_map)
+    image: HxWxC con lo stesso ordine di canali restituito nelle medie
+    """
+    ids = region_map.ravel()
+    if n_regions is None:
+        n_regions = int(ids.max()) + 1 if ids.size else 0
+
+    pixels = image.reshape((ids.size, -1))
+    counts = np.bincount(ids, minlength=n_regions)
+    safe = np.maximum(counts, 1)[:, None]
+
+    sums = np.empty((n_regions, pixels.shape[1]), dtype=np.float64)
+    sq_sums = np.empty_like(sums)
+    for ch in range(pixels.shape[1]):
+        channel = pixels[:, ch].astype(np.float64)
+        sums[:, ch] = np.bincount(ids, weights=channel, minlength=n_regions)
+        sq_sums[:, ch] = np.bincount(ids, weights=channel * channel, minlength=n_regions)
+
+    means = sums / safe
+    variances = np.maximum(sq_sums / safe - means * means, 0.0)
+
+    return RegionStats(counts=counts, means=means, variances=variances)
+
+
+def filled_contour_stats(stats: RegionStats, component_map: np.ndarray, image: np.ndarray,
+                         cid: int, contour: np.ndarray, bbox) -> Tuple[int, np.ndarray, np.ndarray]:
+    """Statistiche dell'area racchiusa dal contorno esterno della componente cid
+
+    Come cv2.mean su una maschera con il contorno riempito: ai pixel propri della
+    componente (già ridotti in `stats`) si aggiungono quelli dei buchi, cercati solo
+    nel bounding box invece che su una maschera HxW.
+    """
+    x, y, w, h = (int(v) for v in bbox)
+    filled = np.zeros((h, w), dtype=np.uint8)
+    cv2.drawContours(filled, [contour], 0, 1, -1, offset=(-x, -y))
+    holes = (filled > 0) & (component_map[y:y + h, x:x + w] != cid)
+
+    count = int(stats.counts[cid])
+    mean = stats.means[cid]
+    variance = stats.variances[cid]
+    if not holes.any():
+        return count, mean, variance
+
+    hole_pixels = image[y:y + h, x:x + w][holes].astype(np.float64)
+    total = count + len(hole_pixels)
+    sums = mean * count + hole_pixels.sum(axis=0)
+    sq_sums = (variance + mean * mean) * count + (hole_pixels * hole_pixels).sum(axis=0)
+
+    mean = sums / total
+    variance = np.maximum(sq_sums / total - mean * mean, 0.0)
+    return total, mean, variance
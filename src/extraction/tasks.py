@@ -0,0 +1,104 @@
+"""
+Tasks - Operazioni lunghe delle GUI in un thread di lavoro
+Il worker invia eventi di avanzamento su una coda; il thread Tk li raccoglie con
+root.after (nessuna chiamata Tk dal worker) e può annullare l'operazione
+"""
+
+import queue
+import threading
+from typing import Any, Callable, List, Optional
+
+
+POLL_MS = 50
+
+
+class TaskCancelled(Exception):
+    """Sollevata nel worker da BackgroundTask.check() dopo cancel()"""
+
+
+class BackgroundTask:
+    """Esegue work(task) in un thread e riporta gli eventi nel thread Tk
+
+    Nel worker: task.report(evento) per l'avanzamento, task.check() nei punti in cui
+    l'operazione può fermarsi. Nel thread Tk: on_progress(eventi) riceve gli eventi
+    arrivati dall'ultimo controllo (uno ogni POLL_MS al massimo), poi una sola tra
+    on_done(risultato), on_cancel() e on_error(eccezione). Dopo cancel() il risultato
+    non viene mai consegnato, anche se il worker aveva già finito.
+    """
+
+    def __init__(self, root, work: Callable[['BackgroundTask'], Any],
+                 on_progress: Optional[Callable[[List[Any]], None]] = None,
+                 on_done: Optional[Callable[[Any], None]] = None,
+                 on_cancel: Optional[Callable[[], None]] = None,
+                 on_error: Optional[Callable[[BaseException], None]] = None):
+        self.root = root
+        self.work = work
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_cancel = on_cancel
+        self.on_error = on_error
+        self._events: queue.Queue = queue.Queue()
+        self._cancel = threading.Event()
+        self.running = False
+
+    def start(self) -> 'BackgroundTask':
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+        self.root.after(POLL_MS, self._poll)
+        return self
+
+    def cancel(self):
+        """Richiede l'annullamento (effettivo al prossimo check() del worker)"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise TaskCancelled()
+
+    def report(self, event: Any):
+        self._events.put(('progress', event))
+
+    def _run(self):
+        try:
+            result = self.work(self)
+            self.check()
+            self._events.put(('done', result))
+        except TaskCancelled:
+            self._events.put(('cancelled', None))
+        except Exception as e:
+            self._events.put(('error', e))
+
+    def _poll(self):
+        progress = []
+        outcome = None
+        while outcome is None:
+            try:
+                kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                progress.append(payload)
+            else:
+                outcome = (kind, payload)
+
+        if progress and self.on_progress is not None and not self.cancelled:
+            self.on_progress(progress)
+
+        if outcome is None:
+            self.root.after(POLL_MS, self._poll)
+            return
+
+        self.running = False
+        kind, payload = outcome
+        if self.cancelled and kind != 'error':
+            kind = 'cancelled'  # risultato arrivato dopo cancel(): scartato come l'avanzamento
+        if kind == 'done' and self.on_done is not None:
+            self.on_done(payload)
+        elif kind == 'cancelled' and self.on_cancel is not None:
+            self.on_cancel()
+        elif kind == 'error' and self.on_error is not None:
+            self.on_error(payload)
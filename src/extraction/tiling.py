@@ -0,0 +1,181 @@
+"""
+Tiling - Segmentazione out-of-core per scansioni molto grandi
+L'immagine viene letta a bande di righe (da un np.memmap su disco), le label sono
+assegnate banda per banda con centri stimati globalmente e le componenti vengono
+unite attraverso i bordi delle bande; la memoria dipende dal budget, non dall'immagine
+"""
+
+import shutil
+import tempfile
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from .components import ComponentBuilder, ComponentTable
+from .quantization import ColorQuantizer
+from .region_stats import RegionStats
+
+
+# Byte di lavoro stimati per pixel di una banda (pixel uint8, float32 per l'assegnazione,
+# label, run e maschere temporanee)
+BYTES_PER_PIXEL = 48
+
+
+def open_image(image_path, work_dir: Optional[Path] = None) -> np.ndarray:
+    """Apre l'immagine come array HxWx3 uint8 mappato su disco (sola lettura)
+
+    I file .npy vengono mappati direttamente; gli altri formati vengono decodificati
+    una volta (solo uint8, senza copie float) e salvati come .npy nella work_dir.
+    """
+    image_path = Path(image_path)
+    if image_path.suffix.lower() == '.npy':
+        return np.load(str(image_path), mmap_mode='r')
+
+    image = cv2.imread(str(image_path))
+    if image is None:
+        raise ValueError(f"Impossibile caricare: {image_path}")
+
+    work_dir = Path(work_dir or tempfile.mkdtemp(prefix='map_tiles_'))
+    cache_path = work_dir / (image_path.stem + '.npy')
+    mapped = np.lib.format.open_memmap(str(cache_path), mode='w+', dtype=np.uint8, shape=image.shape)
+    mapped[:] = image
+    mapped.flush()
+    del image, mapped
+
+    return np.load(str(cache_path), mmap_mode='r')
+
+
+def strip_rows(width: int, memory_budget_mb: float) -> int:
+    """Numero di righe per banda che rispetta il budget di memoria"""
+    return max(1, int(memory_budget_mb * 1024 * 1024 // (width * BYTES_PER_PIXEL)))
+
+
+def iter_strips(height: int, rows: int, halo: int = 0) -> Iterator[Tuple[int, int, int, int]]:
+    """Bande (y0, y1) con alone: restituisce (y0, y1, inizio letto, fine letta)
+
+    L'alone serve ai filtri di vicinato (blur e soglia adattiva di MapExtractor);
+    la quantizzazione di TiledSegmenter è per pixel e usa halo=0.
+    """
+    for y0 in range(0, height, rows):
+        y1 = min(height, y0 + rows)
+        yield y0, y1, max(0, y0 - halo), min(height, y1 + halo)
+
+
+def downscale(image: np.ndarray, max_side: int = 4096, rows: int = 1024) -> Tuple[np.ndarray, float]:
+    """Copia ridotta (lato massimo max_side) letta a bande: restituisce (immagine, scala)
+
+    Con un memmap non carica mai l'immagine intera; se sta già nel limite è una copia.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    if scale == 1.0:
+        return np.array(image), scale
+
+    out_w = max(1, int(round(width * scale)))
+    bands = []
+    for y0, y1, _, _ in iter_strips(height, rows):
+        out_h = int(round(y1 * scale)) - int(round(y0 * scale))
+        if out_h > 0:
+            bands.append(cv2.resize(np.asarray(image[y0:y1]), (out_w, out_h), interpolation=cv2.INTER_AREA))
+    return np.vstack(bands), scale
+
+
+class TiledSegmenter:
+    """Quantizzazione + componenti connesse a bande su un'immagine HxWx3 (anche memmap)
+
+    memory_budget_mb limita solo i pixel di una banda. Le run e le adiacenze del
+    ComponentBuilder crescono con i confini dell'intera immagine (run_bytes dopo
+    segment()): una scansione enorme con moltissime regioni minute può superare il budget.
+    """
+
+    def __init__(self, image: np.ndarray, n_colors: int, memory_budget_mb: float = 1024,
+                 sample_size: int = 50_000, work_dir: Optional[Path] = None, seed: int = 42):
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self.rows = strip_rows(self.width, memory_budget_mb)
+        self.quantizer = ColorQuantizer(n_colors, sample_size=sample_size, seed=seed)
+        self.work_dir = Path(work_dir or tempfile.mkdtemp(prefix='map_tiles_'))
+        self.seed = seed
+        self.run_bytes = 0
+
+    def sample_pixels(self) -> np.ndarray:
+        """Campione stratificato: in ogni banda, pixel in proporzione alle sue righe"""
+        rng = np.random.default_rng(self.seed)
+        per_row = self.quantizer.sample_size / self.height
+        samples = []
+
+        for y0, y1, _, _ in iter_strips(self.height, self.rows):
+            n = max(1, int(round(per_row * (y1 - y0))))
+            ys = rng.integers(y0, y1, size=n)
+            xs = rng.integers(0, self.width, size=n)
+            order = np.argsort(ys)  # lettura sequenziale del memmap
+            samples.append(np.asarray(self.image[ys[order], xs[order]]))
+
+        return np.concatenate(samples).astype(np.float32)
+
+    def fit(self) -> np.ndarray:
+        """Stima i centri globali dal campione di tutte le bande"""
+        sample = self.sample_pixels()
+        return self.quantizer.fit(sample.reshape((-1, 1, 3)))
+
+    def segment(self, connectivity: int = 8) -> Tuple[ComponentTable, np.ndarray]:
+        """Label per banda + componenti unite tra le bande
+
+        Restituisce (ComponentTable con component_map su disco, centri Kx3).
+        """
+        if self.quantizer.centers is None:
+            self.fit()
+
+        builder = ComponentBuilder(self.width, connectivity)
+        for y0, y1, _, _ in iter_strips(self.height, self.rows):
+            labels = self.quantizer.predict(np.asarray(self.image[y0:y1]))
+            builder.add_rows(labels)
+        self.run_bytes = builder.nbytes
+
+        component_map = np.lib.format.open_memmap(
+            str(self.work_dir / 'components.npy'), mode='w+', dtype=np.int32,
+            shape=(self.height, self.width)
+        )
+        table = builder.build(component_map=component_map, rows_per_chunk=self.rows)
+        return table, self.quantizer.centers
+
+    def region_stats(self, table: ComponentTable) -> RegionStats:
+        """Come region_stats, accumulando le somme banda per banda"""
+        n = len(table)
+        channels = self.image.shape[2]
+        counts = np.zeros(n, dtype=np.int64)
+        sums = np.zeros((n, channels), dtype=np.float64)
+        sq_sums = np.zeros((n, channels), dtype=np.float64)
+
+        for y0, y1, _, _ in iter_strips(self.height, self.rows):
+            ids = np.asarray(table.component_map[y0:y1]).ravel()
+            pixels = np.asarray(self.image[y0:y1]).reshape((ids.size, channels))
+            counts += np.bincount(ids, minlength=n)
+            for ch in range(channels):
+                channel = pixels[:, ch].astype(np.float64)
+                sums[:, ch] += np.bincount(ids, weights=channel, minlength=n)
+                sq_sums[:, ch] += np.bincount(ids, weights=channel * channel, minlength=n)
+
+        safe = np.maximum(counts, 1)[:, None]
+        means = sums / safe
+        variances = np.maximum(sq_sums / safe - means * means, 0.0)
+        return RegionStats(counts=counts, means=means, variances=variances)
+
+    def preview(self, table: ComponentTable, centers: np.ndarray, max_side: int = 4096) -> np.ndarray:
+        """Immagine segmentata ridotta (lato massimo max_side) costruita a bande"""
+        scale = min(1.0, max_side / max(self.height, self.width))
+        out_w = max(1, int(round(self.width * scale)))
+        colors = np.uint8(centers)[table.labels]
+        bands = []
+
+        for y0, y1, _, _ in iter_strips(self.height, self.rows):
+            band = colors[np.asarray(table.component_map[y0:y1])]
+            out_h = max(1, int(round(y1 * scale)) - int(round(y0 * scale)))
+            bands.append(cv2.resize(band, (out_w, out_h), interpolation=cv2.INTER_NEAREST))
+
+        return np.vstack(bands)
+
+    def close(self):
+        """Rimuove i file temporanei (component_map su disco)"""
+        shutil.rmtree(self.work_dir, ignore_errors=True)
@@ -0,0 +1,109 @@
+"""
+Benchmark Identificazione - Ciclo iterrows/contains vs indice STRtree
+Per i livelli GADM 1, 2, 3 (regioni, province, comuni) misura il tempo di
+identificazione dei centroidi con i due metodi e verifica che coincidano
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import MultiPoint, Point, box
+from shapely.ops import voronoi_diagram
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from spatial_index import ReferenceIndex, deepest_name_field
+
+
+GADM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geodata", "gadm_italy")
+ITALY_BOUNDS = (6.5, 36.0, 18.5, 47.5)
+
+# Numero di unità per livello GADM Italy (per il layer sintetico se mancano gli shapefile)
+GADM_COUNTS = {1: 20, 2: 107, 3: 7904}
+
+
+def load_layer(level: int, seed: int = 0) -> gpd.GeoDataFrame:
+    """Shapefile GADM del livello, oppure celle di Voronoi con lo stesso numero di unità"""
+    shapefile = os.path.join(GADM_DIR, f"gadm41_ITA_{level}.shp")
+    if os.path.exists(shapefile):
+        return gpd.read_file(shapefile)
+
+    rng = np.random.default_rng(seed)
+    lon_min, lat_min, lon_max, lat_max = ITALY_BOUNDS
+    n = GADM_COUNTS[level]
+    seeds = np.column_stack([rng.uniform(lon_min, lon_max, n), rng.uniform(lat_min, lat_max, n)])
+    cells = voronoi_diagram(MultiPoint(seeds), envelope=box(*ITALY_BOUNDS))
+    cells = [cell.intersection(box(*ITALY_BOUNDS)) for cell in cells.geoms]
+    return gpd.GeoDataFrame({f"NAME_{level}": [f"Unità {i}" for i in range(len(cells))]},
+                            geometry=cells, crs="EPSG:4326")
+
+
+def identify_loop(gdf: gpd.GeoDataFrame, lons: np.ndarray, lats: np.ndarray, name_field: str):
+    """Metodo originale: per ogni punto, scansione di tutte le feature"""
+    names = []
+    for lon, lat in zip(lons, lats):
+        point = Point(lon, lat)
+        name = None
+        for idx, row in gdf.iterrows():
+            if row.geometry and row.geometry.contains(point):
+                name = row.get(name_field, f"Region {idx}")
+                break
+        names.append(name)
+    return names
+
+
+def identify_index(index: ReferenceIndex, lons: np.ndarray, lats: np.ndarray):
+    found = index.locate(lons, lats)
+    return [index.name(i) if i >= 0 else None for i in found]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark identificazione regioni (point-in-polygon)')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 3], help='Livelli GADM')
+    parser.add_argument('--points', type=int, default=200, help='Centroidi da identificare')
+    parser.add_argument('--loop-points', type=int, default=50,
+                        help='Centroidi per il ciclo originale (lento: tempo estrapolato)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    lon_min, lat_min, lon_max, lat_max = ITALY_BOUNDS
+
+    print(f"\n⏱️  BENCHMARK IDENTIFICAZIONE - {args.points} centroidi")
+    print("="*72)
+
+    for level in args.levels:
+        gdf = load_layer(level)
+        source = "GADM" if os.path.exists(os.path.join(GADM_DIR, f"gadm41_ITA_{level}.shp")) else "sintetico"
+        name_field = deepest_name_field(gdf)
+
+        lons = rng.uniform(lon_min, lon_max, args.points)
+        lats = rng.uniform(lat_min, lat_max, args.points)
+
+        t0 = time.perf_counter()
+        index = ReferenceIndex(gdf, name_field)
+        t_build = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        names_index = identify_index(index, lons, lats)
+        t_query = time.perf_counter() - t0
+
+        n_loop = min(args.loop_points, args.points)
+        t0 = time.perf_counter()
+        names_loop = identify_loop(gdf, lons[:n_loop], lats[:n_loop], name_field)
+        t_loop = (time.perf_counter() - t0) * args.points / n_loop
+
+        same = names_loop == names_index[:n_loop]
+        matched = sum(name is not None for name in names_index)
+
+        print(f"   Livello {level} ({source}, {len(gdf)} feature) - {matched}/{args.points} identificati")
+        print(f"      Ciclo iterrows:  {t_loop:9.3f}s" + (" (stimato)" if n_loop < args.points else ""))
+        print(f"      STRtree:         {t_build + t_query:9.3f}s (indice {t_build:.3f}s + query {t_query:.4f}s)")
+        print(f"      Speedup: {t_loop / (t_build + t_query):.0f}x (solo query: {t_loop / max(t_query, 1e-9):.0f}x)"
+              f" - risultati {'identici' if same else 'DIVERSI'}")
+
+
+if __name__ == "__main__":
+    main()
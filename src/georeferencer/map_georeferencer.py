@@ -12,15 +12,28 @@ Autore: Map to GeoJSON Converter Project
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk, ImageDraw
+from PIL import Image, ImageTk
 import numpy as np
 import cv2
 import geopandas as gpd
-from shapely.geometry import Point, Polygon, mapping
+from shapely.geometry import Polygon, mapping
 import json
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 import os
+import queue
+import sys
+import threading
+
+# src/ per il pacchetto extraction, la cartella dello script per spatial_index
+# (così funziona anche se importato o lanciato da un'altra cartella)
+GEOREFERENCER_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(GEOREFERENCER_DIR))
+sys.path.insert(0, GEOREFERENCER_DIR)
+
+from extraction import (BackgroundTask, ImagePyramid, SegmentationCache, TileCache, read_reference,
+                        segment_image)
+from spatial_index import ReferenceIndex
 
 
 # Database dei paesi con bounding box predefiniti
@@ -37,6 +50,16 @@ COUNTRY_BOUNDS = {
     "Grecia": {"bounds": (19.0, 34.5, 30.0, 42.0), "gadm_code": "GRC"},
 }
 
+# Stile dell'overlay regioni (item del canvas)
+ENABLED_OUTLINE = '#00ff00'
+DISABLED_OUTLINE = '#ff0000'
+DISABLED_DASH = (4, 4)
+CENTROID_FILL = '#ffff00'
+CENTROID_RADIUS = 5
+
+# Centroidi per query durante l'identificazione (granularità di avanzamento/annullamento)
+IDENTIFY_CHUNK = 256
+
 
 @dataclass
 class Region:
@@ -285,9 +308,16 @@ class MapGeoreferencer:
         # Stato
         self.image: Optional[Image.Image] = None
         self.image_array: Optional[np.ndarray] = None
-        self.tk_image: Optional[ImageTk.PhotoImage] = None
+        self.tiles: Optional[TileCache] = None  # mipmap dell'immagine per zoom e pan
+        self.tile_items: Dict[Tuple[int, int], Tuple[int, ImageTk.PhotoImage]] = {}  # tile visibili sul canvas
+        self.tile_view: Tuple[float, int, int] = (0.0, 0, 0)  # scala e offset dei tile visibili
         self.regions: List[Region] = []
         self.gadm_gdf: Optional[gpd.GeoDataFrame] = None
+        self.gadm_index: Optional[ReferenceIndex] = None
+        self.gadm_loading = False
+        self.cache = SegmentationCache()
+        self.task: Optional[BackgroundTask] = None  # estrazione/identificazione in corso
+        self.image_generation = 0  # incrementato a ogni immagine aperta: i risultati vecchi vengono ignorati
         
         # Calibrazione
         self.geo_bounds: Optional[Tuple[float, float, float, float]] = None
@@ -299,6 +329,11 @@ class MapGeoreferencer:
         self.offset_x = 0
         self.offset_y = 0
         
+        # Overlay: (contorno, centroide) per regione come item del canvas, e la vista
+        # (scala, offset) con cui sono stati disegnati
+        self.overlay_items: List[Tuple[Optional[int], Optional[int]]] = []
+        self.overlay_view: Tuple[float, float, float] = (1.0, 0, 0)
+        
         self._setup_ui()
         self._load_gadm_database()
     
@@ -340,13 +375,14 @@ class MapGeoreferencer:
         self.canvas = tk.Canvas(canvas_frame, bg='#2b2b2b', highlightthickness=0)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        v_scroll = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        v_scroll = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self._on_yview)
         v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-        h_scroll = ttk.Scrollbar(left_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        h_scroll = ttk.Scrollbar(left_frame, orient=tk.HORIZONTAL, command=self._on_xview)
         h_scroll.pack(side=tk.BOTTOM, fill=tk.X)
         
         self.canvas.configure(xscrollcommand=h_scroll.set, yscrollcommand=v_scroll.set)
         self.canvas.bind("<MouseWheel>", self._on_scroll)
+        self.canvas.bind("<Configure>", self._on_canvas_resize)
         
         # Pannello destro
         right_frame = ttk.Frame(main_pane)
@@ -363,27 +399,30 @@ class MapGeoreferencer:
         regions_frame = ttk.LabelFrame(right_frame, text="📋 Regioni Estratte (clicca per selezionare/deselezionare)")
         regions_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # Scrollable frame per checkbox
-        canvas_scroll = tk.Canvas(regions_frame, highlightthickness=0)
-        scrollbar = ttk.Scrollbar(regions_frame, orient=tk.VERTICAL, command=canvas_scroll.yview)
-        self.regions_container = ttk.Frame(canvas_scroll)
-        
-        self.regions_container.bind(
-            "<Configure>",
-            lambda e: canvas_scroll.configure(scrollregion=canvas_scroll.bbox("all"))
-        )
-        
-        canvas_scroll.create_window((0, 0), window=self.regions_container, anchor="nw")
-        canvas_scroll.configure(yscrollcommand=scrollbar.set)
-        
-        canvas_scroll.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        # Lista virtualizzata (Treeview: Tk disegna solo le righe visibili). Colore della
+        # regione come immagine della riga, abilitata/disabilitata come tag della riga:
+        # seleziona/deseleziona tutto sono due chiamate indipendentemente dal numero di righe
+        self.regions_tree = ttk.Treeview(regions_frame, show='tree', selectmode='none')
+        scrollbar = ttk.Scrollbar(regions_frame, orient=tk.VERTICAL, command=self.regions_tree.yview)
+        self.regions_tree.configure(yscrollcommand=scrollbar.set)
+        self.regions_tree.tag_configure('enabled', background='#d4edda')
+        self.regions_tree.tag_configure('disabled', background='#f8d7da', foreground='#777777')
+        self.regions_tree.bind('<Button-1>', self._on_regions_tree_click)
+        
+        self.regions_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        self.region_checkboxes = []
+        self.swatches: Dict[Tuple[int, int, int], ImageTk.PhotoImage] = {}  # quadratini colore per riga
         
-        # Status bar
+        # Status bar con avanzamento e annullamento delle operazioni in background
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
         self.status_var = tk.StringVar(value="Pronto. Carica un'immagine e seleziona l'area geografica.")
-        ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN).pack(side=tk.BOTTOM, fill=tk.X)
+        ttk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = ttk.Button(status_frame, text="⏹ Annulla", command=self._cancel_task, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=2)
+        self.progress = ttk.Progressbar(status_frame, length=160, maximum=1.0)
+        self.progress.pack(side=tk.RIGHT, padx=2)
     
     def _open_world_map(self):
         """Apre finestra selezione mappa mondiale"""
@@ -399,18 +438,43 @@ class MapGeoreferencer:
         self.status_var.set(f"✓ Area selezionata: {bounds}")
     
     def _load_gadm_database(self):
-        """Carica database GADM"""
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        gadm_path = os.path.join(script_dir, "geodata", "gadm_italy", "gadm41_ITA_1.shp")
+        """Avvia il caricamento del database GADM (e del suo indice) in un thread
+        
+        La finestra compare subito; _poll_gadm_database applica il risultato nel thread Tk.
+        """
+        gadm_path = os.path.join(GEOREFERENCER_DIR, "geodata", "gadm_italy", "gadm41_ITA_1.shp")
+        
+        if not os.path.exists(gadm_path):
+            self.gadm_gdf = None
+            self.gadm_index = None
+            return
         
-        if os.path.exists(gadm_path):
+        def read():
             try:
-                self.gadm_gdf = gpd.read_file(gadm_path)
-                self.status_var.set(f"✓ Database GADM: {len(self.gadm_gdf)} regioni italiane")
-            except Exception as e:
-                self.gadm_gdf = None
+                gdf = read_reference(gadm_path)
+                self._gadm_queue.put((gdf, ReferenceIndex(gdf)))
+            except Exception:
+                self._gadm_queue.put((None, None))
+        
+        self.gadm_loading = True
+        self.status_var.set("⏳ Caricamento database GADM in corso...")
+        self._gadm_queue: queue.Queue = queue.Queue()
+        threading.Thread(target=read, daemon=True).start()
+        self.root.after(100, self._poll_gadm_database)
+    
+    def _poll_gadm_database(self):
+        """Applica il database letto dal thread, altrimenti ricontrolla tra 100 ms"""
+        try:
+            self.gadm_gdf, self.gadm_index = self._gadm_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self._poll_gadm_database)
+            return
+        
+        self.gadm_loading = False
+        if self.gadm_gdf is not None:
+            self.status_var.set(f"✓ Database GADM: {len(self.gadm_gdf)} regioni italiane")
         else:
-            self.gadm_gdf = None
+            self.status_var.set("⚠️ Database GADM non caricato")
     
     def _load_image(self):
         """Carica immagine"""
@@ -418,9 +482,13 @@ class MapGeoreferencer:
         filepath = filedialog.askopenfilename(title="Seleziona immagine mappa", filetypes=filetypes)
         
         if filepath:
+            if self.task is not None and self.task.running:
+                self.task.cancel()
+            self.image_generation += 1
             try:
                 self.image = Image.open(filepath)
                 self.image_array = np.array(self.image)
+                self.tiles = TileCache(ImagePyramid(np.array(self.image.convert('RGB'))))
                 self._display_image()
                 self.status_var.set(f"✓ Immagine: {self.image.width}x{self.image.height} px")
                 self.regions = []
@@ -429,7 +497,7 @@ class MapGeoreferencer:
                 messagebox.showerror("Errore", f"Errore caricamento:\n{e}")
     
     def _display_image(self):
-        """Mostra immagine"""
+        """Mostra immagine adattata al canvas (nuova immagine: overlay azzerato)"""
         if self.image is None:
             return
         
@@ -441,184 +509,362 @@ class MapGeoreferencer:
         scale_h = canvas_h / img_h
         self.scale = min(scale_w, scale_h, 1.0)
         
-        new_w = int(img_w * self.scale)
-        new_h = int(img_h * self.scale)
-        
-        resized = self.image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        self.tk_image = ImageTk.PhotoImage(resized)
+        self.canvas.delete("all")
+        self.overlay_items = []
+        self.tile_items = {}
+        self._render_image()
+    
+    def _render_image(self):
+        """Mostra i tile visibili alla scala corrente (gli item dell'overlay restano)
         
-        self.offset_x = (canvas_w - new_w) // 2
-        self.offset_y = (canvas_h - new_h) // 2
+        I tile vengono dal livello più vicino della piramide: zoom e pan ricampionano
+        solo la porzione visibile, i tile già sul canvas vengono riusati.
+        """
+        if self.tiles is None:
+            return
+        canvas_w = self.canvas.winfo_width() or 800
+        canvas_h = self.canvas.winfo_height() or 600
         
-        self.canvas.delete("all")
-        self.canvas.create_image(self.offset_x, self.offset_y, anchor=tk.NW, 
-                                image=self.tk_image, tags="image")
+        new_w, new_h = self.tiles.pyramid.view_size(self.scale)
+        self.offset_x = max(0, (canvas_w - new_w) // 2)
+        self.offset_y = max(0, (canvas_h - new_h) // 2)
+        self.canvas.configure(scrollregion=(0, 0, max(canvas_w, new_w), max(canvas_h, new_h)))
+        
+        # Nuova scala: i tile sul canvas non valgono più; stesso zoom, offset diverso: si spostano
+        tile_scale, tile_x, tile_y = self.tile_view
+        if tile_scale != self.scale:
+            self.canvas.delete("tile")
+            self.tile_items = {}
+        elif (tile_x, tile_y) != (self.offset_x, self.offset_y):
+            self.canvas.move("tile", self.offset_x - tile_x, self.offset_y - tile_y)
+        self.tile_view = (self.scale, self.offset_x, self.offset_y)
+        
+        # Porzione visibile in coordinate della vista
+        x0 = self.canvas.canvasx(0) - self.offset_x
+        y0 = self.canvas.canvasy(0) - self.offset_y
+        visible = set(self.tiles.tiles_in(self.scale, x0, y0, x0 + canvas_w, y0 + canvas_h))
+        
+        for key in set(self.tile_items) - visible:
+            self.canvas.delete(self.tile_items.pop(key)[0])
+        
+        size = self.tiles.tile_size
+        for tx, ty in visible - set(self.tile_items):
+            photo = ImageTk.PhotoImage(Image.fromarray(self.tiles.tile(self.scale, tx, ty)))
+            item = self.canvas.create_image(self.offset_x + tx * size, self.offset_y + ty * size,
+                                            anchor=tk.NW, image=photo, tags=("image", "tile"))
+            self.canvas.tag_lower(item)
+            self.tile_items[(tx, ty)] = (item, photo)
+    
+    def _on_canvas_resize(self, event):
+        """Nuova dimensione: l'immagine viene ricentrata, i tile scoperti aggiunti"""
+        self._render_image()
+        self._transform_overlay()
+    
+    def _on_xview(self, *args):
+        self.canvas.xview(*args)
+        self._render_image()
+    
+    def _on_yview(self, *args):
+        self.canvas.yview(*args)
+        self._render_image()
     
     def _on_scroll(self, event):
-        """Zoom"""
+        """Zoom (l'overlay viene trasformato, non ridisegnato)"""
+        if self.image is None:
+            return
         if event.delta > 0:
             self.scale *= 1.1
         else:
             self.scale /= 1.1
         self.scale = max(0.1, min(5.0, self.scale))
-        self._display_image()
-        self._draw_regions_overlay()
+        self._render_image()
+        self._transform_overlay()
+    
+    def _start_task(self, work, name: str, on_progress=None, on_done=None, on_cancel=None) -> bool:
+        """Avvia work(task) in background (una operazione alla volta, name: "estrazione", ...)"""
+        if self.task is not None and self.task.running:
+            messagebox.showinfo("Attendere", "Operazione in corso: attendi o annullala.")
+            return False
+        
+        # Callback dell'operazione solo se nel frattempo non è stata aperta un'altra immagine
+        generation = self.image_generation
+        
+        def current(callback):
+            if callback is None:
+                return None
+            def wrapped(*args):
+                if generation == self.image_generation:
+                    callback(*args)
+            return wrapped
+        
+        on_progress, on_done, on_cancel = current(on_progress), current(on_done), current(on_cancel)
+        
+        def finish(callback):
+            def wrapped(*args):
+                self.cancel_button.configure(state=tk.DISABLED)
+                self.progress.stop()
+                self.progress.configure(mode='determinate', value=0)
+                if callback is not None:
+                    callback(*args)
+            return wrapped
+        
+        def on_error(error):
+            self.status_var.set("❌ Operazione fallita")
+            messagebox.showerror("Errore", f"Errore {name}:\n{error}")
+        
+        def on_cancelled():
+            self.status_var.set("⏹ Operazione annullata")
+            if on_cancel is not None:
+                on_cancel()
+        
+        self.status_var.set(f"⏳ {name.capitalize()} in corso...")
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.progress.configure(mode='indeterminate')
+        self.progress.start(15)
+        self.task = BackgroundTask(self.root, work, on_progress=on_progress, on_done=finish(on_done),
+                                   on_cancel=finish(on_cancelled), on_error=finish(on_error)).start()
+        return True
+    
+    def _cancel_task(self):
+        if self.task is not None and self.task.running:
+            self.task.cancel()
+            self.status_var.set("⏳ Annullamento...")
+    
+    def _set_progress(self, fraction: float):
+        if str(self.progress['mode']) != 'determinate':
+            self.progress.stop()
+            self.progress.configure(mode='determinate')
+        self.progress.configure(value=fraction)
     
     def _extract_regions(self):
-        """Estrai regioni con K-Means"""
+        """Estrai regioni con K-Means (in background, regioni mostrate man mano)"""
         if self.image_array is None:
             messagebox.showwarning("Attenzione", "Carica prima un'immagine!")
             return
         
-        self.status_var.set("⏳ Estrazione in corso...")
-        self.root.update()
+        n_clusters = self.n_regions_var.get()
         
-        try:
-            n_clusters = self.n_regions_var.get()
-            
-            # Prepara immagine
-            if len(self.image_array.shape) == 2:
-                img_rgb = cv2.cvtColor(self.image_array, cv2.COLOR_GRAY2RGB)
-            elif self.image_array.shape[2] == 4:
-                img_rgb = cv2.cvtColor(self.image_array, cv2.COLOR_RGBA2RGB)
-            else:
-                img_rgb = self.image_array.copy()
-            
-            # K-Means
-            pixels = img_rgb.reshape(-1, 3).astype(np.float32)
-            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
-            _, labels, centers = cv2.kmeans(pixels, n_clusters, None, criteria, 10, cv2.KMEANS_PP_CENTERS)
-            
-            centers = centers.astype(np.uint8)
-            labels = labels.flatten()
-            segmented = centers[labels].reshape(img_rgb.shape)
+        # Prepara immagine
+        if len(self.image_array.shape) == 2:
+            img_rgb = cv2.cvtColor(self.image_array, cv2.COLOR_GRAY2RGB)
+        elif self.image_array.shape[2] == 4:
+            img_rgb = cv2.cvtColor(self.image_array, cv2.COLOR_RGBA2RGB)
+        else:
+            img_rgb = self.image_array.copy()
+        
+        def work(task: BackgroundTask) -> str:
+            # Palette esatta oppure K-Means (campione stratificato + assegnazione vettorizzata)
+            # Componenti connesse di tutti i cluster in un solo passaggio (dalla cache se possibile)
+            segmentation = segment_image(img_rgb, n_clusters, cache=self.cache)
+            task.check()
+            centers = segmentation.centers.astype(np.uint8)
+            components = segmentation.components
             
-            # Estrai contorni
-            self.regions = []
+            # Componente più grande (in pixel) di ogni cluster
+            order = np.lexsort((-components.areas, components.labels))
+            first = np.r_[True, components.labels[order][1:] != components.labels[order][:-1]]
+            largest_ids = order[first]
             
-            for i, center in enumerate(centers):
-                mask = np.all(segmented == center, axis=2).astype(np.uint8) * 255
-                contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            # Estrai contorni: ogni regione viene inviata appena pronta
+            for n, cid in enumerate(largest_ids):
+                task.check()
+                center = centers[components.labels[cid]]
+                largest = components.contour(cid)
+                area = cv2.contourArea(largest)
                 
-                if contours:
-                    largest = max(contours, key=cv2.contourArea)
-                    area = cv2.contourArea(largest)
-                    
-                    if area > 100:
-                        M = cv2.moments(largest)
-                        if M["m00"] > 0:
-                            cx = M["m10"] / M["m00"]
-                            cy = M["m01"] / M["m00"]
-                            
-                            self.regions.append(Region(
-                                contour=largest,
-                                color=tuple(int(c) for c in center),
-                                centroid_pixel=(cx, cy),
-                                area_pixels=area,
-                                enabled=True
-                            ))
+                region = None
+                if area > 100:
+                    M = cv2.moments(largest)
+                    if M["m00"] > 0:
+                        cx = M["m10"] / M["m00"]
+                        cy = M["m01"] / M["m00"]
+                        
+                        region = Region(
+                            contour=largest,
+                            color=tuple(int(c) for c in center),
+                            centroid_pixel=(cx, cy),
+                            area_pixels=area,
+                            enabled=True
+                        )
+                task.report((region, n + 1, len(largest_ids)))
             
+            return segmentation.method
+        
+        def on_progress(events):
+            for region, done, total in events:
+                if region is not None:
+                    self.regions.append(region)
+                    self._add_region_overlay(len(self.regions) - 1)
+            self._append_region_rows()
+            self._set_progress(done / total)
+            self.status_var.set(f"⏳ Estrazione: {len(self.regions)} regioni ({done}/{total} cluster)")
+        
+        def on_done(method: str):
             self.regions.sort(key=lambda r: r.area_pixels, reverse=True)
             self._update_regions_list()
             self._draw_regions_overlay()
-            
-            self.status_var.set(f"✓ Estratte {len(self.regions)} regioni")
-            
-        except Exception as e:
-            messagebox.showerror("Errore", f"Errore estrazione:\n{e}")
+            self.status_var.set(f"✓ Estratte {len(self.regions)} regioni ({method})")
+        
+        def on_cancel():
+            self.regions = []
+            self._update_regions_list()
+            self._draw_regions_overlay()
+        
+        if self._start_task(work, "estrazione", on_progress, on_done, on_cancel):
+            self.regions = []
+            self._update_regions_list()
+            self._draw_regions_overlay()
     
     def _update_regions_list(self):
-        """Aggiorna lista checkbox regioni"""
-        # Pulisci
-        for widget in self.regions_container.winfo_children():
-            widget.destroy()
-        self.region_checkboxes = []
-        
-        for i, region in enumerate(self.regions):
-            frame = ttk.Frame(self.regions_container)
-            frame.pack(fill=tk.X, pady=1)
-            
-            # Checkbox
-            var = tk.BooleanVar(value=region.enabled)
-            cb = ttk.Checkbutton(frame, variable=var,
-                                command=lambda idx=i, v=var: self._toggle_region(idx, v))
-            cb.pack(side=tk.LEFT)
-            
-            # Colore
-            color_hex = f"#{region.color[0]:02x}{region.color[1]:02x}{region.color[2]:02x}"
-            color_label = tk.Label(frame, text="■", fg=color_hex, font=('Arial', 14))
-            color_label.pack(side=tk.LEFT, padx=2)
-            
-            # Nome
-            name = region.name or f"Regione {i+1}"
-            status = "✓" if region.name else "?"
-            ttk.Label(frame, text=f"{name} {status}").pack(side=tk.LEFT, padx=5)
-            
-            self.region_checkboxes.append((var, region))
+        """Ricostruisce la lista regioni (solo quando cambia l'insieme delle regioni)"""
+        self.regions_tree.delete(*self.regions_tree.get_children())
+        self._append_region_rows()
+    
+    def _swatch(self, color: Tuple[int, int, int]) -> ImageTk.PhotoImage:
+        """Quadratino 14x14 del colore della regione (uno per colore)"""
+        if color not in self.swatches:
+            self.swatches[color] = ImageTk.PhotoImage(Image.new('RGB', (14, 14), color))
+        return self.swatches[color]
+    
+    def _region_row(self, idx: int) -> Tuple[str, Tuple[str]]:
+        """Testo e tag della riga di una regione"""
+        region = self.regions[idx]
+        name = region.name or f"Regione {idx+1}"
+        status = "✓" if region.name else "?"
+        return f"{name} {status}", ('enabled' if region.enabled else 'disabled',)
+    
+    def _append_region_rows(self):
+        """Aggiunge le righe delle regioni non ancora in lista (estrazione in corso)"""
+        for idx in range(len(self.regions_tree.get_children()), len(self.regions)):
+            text, tags = self._region_row(idx)
+            self.regions_tree.insert('', tk.END, iid=str(idx), text=text, tags=tags,
+                                     image=self._swatch(self.regions[idx].color))
+    
+    def _refresh_region_rows(self, indices):
+        """Aggiorna solo le righe indicate (nome o stato cambiati)"""
+        for idx in indices:
+            text, tags = self._region_row(idx)
+            self.regions_tree.item(str(idx), text=text, tags=tags)
+    
+    def _on_regions_tree_click(self, event):
+        """Click su una riga: abilita/disabilita la regione"""
+        row = self.regions_tree.identify_row(event.y)
+        if row:
+            self._toggle_region(int(row))
     
-    def _toggle_region(self, idx: int, var: tk.BooleanVar):
+    def _toggle_region(self, idx: int):
         """Toggle selezione regione"""
         if idx < len(self.regions):
-            self.regions[idx].enabled = var.get()
-            self._draw_regions_overlay()
+            self.regions[idx].enabled = not self.regions[idx].enabled
+            self._refresh_region_rows([idx])
+            self._style_region(idx)
+    
+    def _set_all_regions(self, enabled: bool):
+        """Stesso stato per tutte le regioni: comandi sui tag di lista e overlay, non per riga"""
+        for region in self.regions:
+            region.enabled = enabled
+        
+        items = self.regions_tree.get_children()
+        if items:
+            on, off = ('enabled', 'disabled') if enabled else ('disabled', 'enabled')
+            self.regions_tree.tk.call(self.regions_tree, 'tag', 'remove', off, items)
+            self.regions_tree.tk.call(self.regions_tree, 'tag', 'add', on, items)
+        
+        if enabled:
+            self.canvas.itemconfigure("outline", outline=ENABLED_OUTLINE, dash=())
+            self.canvas.itemconfigure("centroid", state=tk.NORMAL)
+        else:
+            self.canvas.itemconfigure("outline", outline=DISABLED_OUTLINE, dash=DISABLED_DASH)
+            self.canvas.itemconfigure("centroid", state=tk.HIDDEN)
     
     def _select_all_regions(self):
         """Seleziona tutte le regioni"""
-        for i, region in enumerate(self.regions):
-            region.enabled = True
-        for var, _ in self.region_checkboxes:
-            var.set(True)
-        self._draw_regions_overlay()
+        self._set_all_regions(True)
     
     def _deselect_all_regions(self):
         """Deseleziona tutte le regioni"""
-        for i, region in enumerate(self.regions):
-            region.enabled = False
-        for var, _ in self.region_checkboxes:
-            var.set(False)
-        self._draw_regions_overlay()
+        self._set_all_regions(False)
+    
+    def _centroid_box(self, region: Region) -> Tuple[float, float, float, float]:
+        cx = region.centroid_pixel[0] * self.scale + self.offset_x
+        cy = region.centroid_pixel[1] * self.scale + self.offset_y
+        r = CENTROID_RADIUS
+        return (cx - r, cy - r, cx + r, cy + r)
     
     def _draw_regions_overlay(self):
-        """Disegna overlay regioni"""
-        if self.image is None or not self.regions:
+        """Crea l'overlay regioni come item del canvas (tag "overlay", "region<i>")
+        
+        Chiamato solo quando cambiano le regioni: toggle e zoom modificano gli item
+        esistenti (_style_region, _transform_overlay) senza ridisegnare l'immagine.
+        """
+        self.canvas.delete("overlay")
+        self.overlay_items = []
+        if self.image is None:
+            return
+        for i in range(len(self.regions)):
+            self._add_region_overlay(i)
+    
+    def _add_region_overlay(self, idx: int):
+        """Crea gli item della regione idx (le precedenti hanno già i loro) nella vista corrente"""
+        region = self.regions[idx]
+        points = region.contour.reshape(-1, 2)
+        self.overlay_view = (self.scale, self.offset_x, self.offset_y)
+        if len(points) <= 2:
+            self.overlay_items.append((None, None))
             return
         
-        overlay = self.image.copy()
-        draw = ImageDraw.Draw(overlay, 'RGBA')
+        tags = ("overlay", f"region{idx}")
+        offset = np.array([self.offset_x, self.offset_y], dtype=float)
+        coords = (points * self.scale + offset).ravel().tolist()
+        outline = self.canvas.create_polygon(coords, fill='', tags=tags + ("outline",))
+        centroid = self.canvas.create_oval(*self._centroid_box(region), fill=CENTROID_FILL,
+                                           outline='', tags=tags + ("centroid",))
+        self.overlay_items.append((outline, centroid))
+        self._style_region(idx)
+    
+    def _style_region(self, idx: int):
+        """Aggiorna lo stile di una regione: verde con centroide se abilitata, rossa tratteggiata se no"""
+        if idx >= len(self.overlay_items) or self.overlay_items[idx][0] is None:
+            return
+        outline, centroid = self.overlay_items[idx]
+        if self.regions[idx].enabled:
+            self.canvas.itemconfigure(outline, outline=ENABLED_OUTLINE, dash=())
+            self.canvas.itemconfigure(centroid, state=tk.NORMAL)
+        else:
+            self.canvas.itemconfigure(outline, outline=DISABLED_OUTLINE, dash=DISABLED_DASH)
+            self.canvas.itemconfigure(centroid, state=tk.HIDDEN)
+    
+    def _transform_overlay(self):
+        """Porta gli item dell'overlay dalla vista in cui sono stati disegnati a quella corrente"""
+        if not self.overlay_items:
+            return
+        old_scale, old_x, old_y = self.overlay_view
         
-        for region in self.regions:
-            points = [(int(p[0][0] * self.scale + self.offset_x), 
-                      int(p[0][1] * self.scale + self.offset_y)) 
-                     for p in region.contour]
-            
-            if len(points) > 2:
-                if region.enabled:
-                    # Verde se abilitata
-                    draw.polygon(points, outline=(0, 255, 0, 200), fill=None)
-                    
-                    # Centroide
-                    cx, cy = region.centroid_pixel
-                    cx_s = int(cx * self.scale + self.offset_x)
-                    cy_s = int(cy * self.scale + self.offset_y)
-                    r = 5
-                    draw.ellipse([cx_s-r, cy_s-r, cx_s+r, cy_s+r], fill=(255, 255, 0, 200))
-                else:
-                    # Rosso tratteggiato se disabilitata
-                    draw.polygon(points, outline=(255, 0, 0, 100), fill=None)
-        
-        self.tk_image = ImageTk.PhotoImage(overlay)
-        self.canvas.delete("all")
-        self.canvas.create_image(self.offset_x, self.offset_y, anchor=tk.NW, 
-                                image=self.tk_image, tags="image")
+        # Contorni: una trasformazione affine sul tag (nessuna ricostruzione dei punti)
+        factor = self.scale / old_scale
+        self.canvas.scale("outline", old_x, old_y, factor, factor)
+        self.canvas.move("outline", self.offset_x - old_x, self.offset_y - old_y)
+        
+        # Centroidi: riposizionati a raggio costante
+        for region, (_, centroid) in zip(self.regions, self.overlay_items):
+            if centroid is not None:
+                self.canvas.coords(centroid, *self._centroid_box(region))
+        
+        self.overlay_view = (self.scale, self.offset_x, self.offset_y)
     
     def _identify_regions(self):
         """Identifica regioni con Point-in-Polygon"""
-        enabled_regions = [r for r in self.regions if r.enabled]
+        enabled_indices = [i for i, r in enumerate(self.regions) if r.enabled]
+        enabled_regions = [self.regions[i] for i in enabled_indices]
         
         if not enabled_regions:
             messagebox.showwarning("Attenzione", "Nessuna regione selezionata!")
             return
         
+        if self.gadm_loading:
+            messagebox.showinfo("Attendere", "Database GADM in caricamento, riprova tra qualche secondo.")
+            return
+        
         if self.gadm_gdf is None:
             messagebox.showwarning("Attenzione", "Database GADM non disponibile!")
             return
@@ -627,41 +873,47 @@ class MapGeoreferencer:
             messagebox.showwarning("Attenzione", "Seleziona prima l'area geografica!")
             return
         
-        self.status_var.set("⏳ Identificazione in corso...")
-        self.root.update()
+        min_lon, min_lat, max_lon, max_lat = self.geo_bounds
+        img_w, img_h = self.image.size
+        gadm_gdf, gadm_index = self.gadm_gdf, self.gadm_index
         
-        try:
-            min_lon, min_lat, max_lon, max_lat = self.geo_bounds
-            img_w, img_h = self.image.size
+        # Pixel -> Coordinate geografiche (tutti i centroidi insieme)
+        centroids = np.array([r.centroid_pixel for r in enabled_regions], dtype=float)
+        lons = min_lon + (centroids[:, 0] / img_w) * (max_lon - min_lon)
+        lats = max_lat - (centroids[:, 1] / img_h) * (max_lat - min_lat)
+        
+        def work(task: BackgroundTask):
+            index = gadm_index if gadm_index is not None else ReferenceIndex(gadm_gdf)
             
-            matched = 0
+            # Cerca regioni GADM: query sull'indice STRtree a blocchi di punti
+            found = np.empty(len(lons), dtype=np.int64)
+            for start in range(0, len(lons), IDENTIFY_CHUNK):
+                task.check()
+                stop = start + IDENTIFY_CHUNK
+                found[start:stop] = index.locate(lons[start:stop], lats[start:stop])
+                task.report(min(stop, len(lons)) / len(lons))
+            return index, found
+        
+        def on_progress(events):
+            self._set_progress(events[-1])
+        
+        def on_done(result):
+            self.gadm_index, found = result
             
-            for region in enabled_regions:
-                cx, cy = region.centroid_pixel
-                
-                # Pixel -> Coordinate geografiche
-                lon = min_lon + (cx / img_w) * (max_lon - min_lon)
-                lat = max_lat - (cy / img_h) * (max_lat - min_lat)
-                
-                region.centroid_geo = (lon, lat)
-                
-                # Cerca regione GADM
-                point = Point(lon, lat)
+            matched = 0
+            for region, lon, lat, idx in zip(enabled_regions, lons, lats, found):
+                region.centroid_geo = (float(lon), float(lat))
                 
-                for idx, row in self.gadm_gdf.iterrows():
-                    if row.geometry and row.geometry.contains(point):
-                        region.name = row.get('NAME_1', f"Region {idx}")
-                        region.gadm_geometry = row.geometry
-                        matched += 1
-                        break
+                if idx >= 0:
+                    region.name = self.gadm_index.name(idx)
+                    region.gadm_geometry = self.gadm_index.geometries[idx]
+                    matched += 1
             
-            self._update_regions_list()
-            self._draw_regions_overlay()
+            self._refresh_region_rows(enabled_indices)
             
             self.status_var.set(f"✓ Identificate {matched}/{len(enabled_regions)} regioni")
-            
-        except Exception as e:
-            messagebox.showerror("Errore", f"Errore identificazione:\n{e}")
+        
+        self._start_task(work, "identificazione", on_progress, on_done)
     
     def _export_geojson(self):
         """Esporta GeoJSON"""
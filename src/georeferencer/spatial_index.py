@@ -0,0 +1,53 @@
+"""
+Spatial Index - Point-in-Polygon vettorizzato sul layer di riferimento (GADM)
+Un STRtree sulle geometrie viene costruito una volta; tutti i centroidi vengono
+risolti con una sola query invece di un ciclo regioni × feature
+"""
+
+import re
+import numpy as np
+import geopandas as gpd
+import shapely
+from typing import Optional
+
+
+def deepest_name_field(gdf: gpd.GeoDataFrame) -> Optional[str]:
+    """Colonna NAME_<n> del livello più profondo (es. NAME_3 per i comuni GADM)"""
+    levels = [(int(m.group(1)), col) for col in gdf.columns
+              if (m := re.fullmatch(r'NAME_(\d+)', str(col)))]
+    return max(levels)[1] if levels else None
+
+
+class ReferenceIndex:
+    """Indice STRtree di un GeoDataFrame di riferimento"""
+
+    def __init__(self, gdf: gpd.GeoDataFrame, name_field: Optional[str] = None):
+        self.gdf = gdf
+        self.name_field = name_field or deepest_name_field(gdf)
+        self.geometries = np.asarray(gdf.geometry.values, dtype=object)
+        self.names = gdf[self.name_field].to_numpy() if self.name_field in gdf.columns else None
+        # STRtree prepara le geometrie alla prima query con predicato
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self) -> int:
+        return len(self.geometries)
+
+    def locate(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """Indice (posizionale) della feature che contiene ogni punto, -1 se nessuna
+
+        Come il ciclo su iterrows con geometry.contains(point): se più feature
+        contengono il punto vince la prima nell'ordine del GeoDataFrame.
+        """
+        points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        point_idx, feature_idx = self.tree.query(points, predicate='within')
+
+        result = np.full(len(points), len(self), dtype=np.int64)
+        np.minimum.at(result, point_idx, feature_idx)
+        result[result == len(self)] = -1
+        return result
+
+    def name(self, index: int) -> str:
+        """Nome della feature (come row.get(name_field, 'Region <idx>'))"""
+        if self.names is None:
+            return f"Region {self.gdf.index[index]}"
+        return self.names[index]
@@ -6,12 +6,32 @@ Estrae regioni da immagini e permette selezione interattiva
 import cv2
 import numpy as np
 import json
+import queue
+import threading
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
+from PIL import Image, ImageDraw, ImageTk
 import geopandas as gpd
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from extraction import (BackgroundTask, ImagePyramid, SegmentationCache, TileCache, filled_contour_stats,
+                        rasterize_contours, read_reference, region_stats, segment_image)
+from region_search import RegionSearchIndex
+from shape_index import contour_hu_moments, match_shapes_matrix
+
+
+# Distanza massima (min di I1/I2/I3 di cv2.matchShapes) per accettare un abbinamento
+MAX_SHAPE_DISTANCE = 2.0
+
+# Attesa dopo l'ultimo tasto prima di aggiornare il dropdown di ricerca
+SEARCH_DEBOUNCE_MS = 120
+SEARCH_LIMIT = 100
 
 
 class Region:
@@ -45,9 +65,18 @@ class MapSelectorApp:
         self.image_path: Optional[Path] = None
         self.original_image: Optional[np.ndarray] = None
         self.display_image: Optional[np.ndarray] = None
+        self.tiles: Optional[TileCache] = None  # mipmap dell'immagine per la visualizzazione
         self.regions: List[Region] = []
+        self.region_ids: Optional[np.ndarray] = None  # raster HxW: id regione + 1 (0 = nessuna)
+        self._hover_id = 0
         self.scale_factor = 1.0
         self.italy_regions: Optional[gpd.GeoDataFrame] = None
+        self.world_regions: Optional[gpd.GeoDataFrame] = None
+        self.db_loading = False
+        self.italy_shapes: Optional[Tuple[List[str], np.ndarray]] = None  # nomi + momenti di Hu GADM
+        self.cache = SegmentationCache()
+        self.task: Optional[BackgroundTask] = None  # estrazione/abbinamento in corso
+        self.image_generation = 0  # incrementato a ogni immagine aperta: i risultati vecchi vengono ignorati
         
         # Calibrazione
         self.calibration = {
@@ -97,30 +126,38 @@ class MapSelectorApp:
         self.canvas = tk.Canvas(canvas_frame, bg='#2b2b2b', cursor="hand2")
         self.canvas.pack(fill=tk.BOTH, expand=True)
         self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Motion>", self._on_motion)
+        self.canvas.bind("<Leave>", lambda e: self._hide_tooltip())
         self.canvas.bind("<Configure>", self._on_resize)
         
         # Lista regioni
         list_frame = ttk.LabelFrame(paned, text="Regioni Estratte", padding="5")
         paned.add(list_frame, weight=1)
         
-        # Listbox con scrollbar
+        # Lista virtualizzata (Treeview: Tk disegna solo le righe visibili) con scrollbar.
+        # Lo stato di selezione è un tag della riga (sfondo + casella), quindi
+        # seleziona/deseleziona tutto sono due chiamate indipendentemente dal numero di righe
         list_container = ttk.Frame(list_frame)
         list_container.pack(fill=tk.BOTH, expand=True)
         
         scrollbar = ttk.Scrollbar(list_container)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        self.region_listbox = tk.Listbox(
-            list_container, 
-            yscrollcommand=scrollbar.set,
-            selectmode=tk.SINGLE,
-            font=('Consolas', 10)
+        self.region_tree = ttk.Treeview(
+            list_container,
+            show='tree',
+            selectmode='browse',
+            yscrollcommand=scrollbar.set
         )
-        self.region_listbox.pack(fill=tk.BOTH, expand=True)
-        scrollbar.config(command=self.region_listbox.yview)
+        self.region_tree.pack(fill=tk.BOTH, expand=True)
+        scrollbar.config(command=self.region_tree.yview)
+        
+        self._check_images = (self._checkbox_image(True), self._checkbox_image(False))
+        self.region_tree.tag_configure('selected', background='#d4edda', image=self._check_images[0])
+        self.region_tree.tag_configure('deselected', background='#f8d7da', image=self._check_images[1])
         
-        self.region_listbox.bind('<<ListboxSelect>>', self._on_list_select)
-        self.region_listbox.bind('<Double-Button-1>', self._on_list_double_click)
+        self.region_tree.bind('<<TreeviewSelect>>', self._on_list_select)
+        self.region_tree.bind('<Double-Button-1>', self._on_list_double_click)
         
         # Frame per modifica nome
         edit_frame = ttk.Frame(list_frame)
@@ -140,7 +177,7 @@ class MapSelectorApp:
         self.search_var = tk.StringVar()
         self.search_entry = ttk.Entry(db_frame, textvariable=self.search_var, width=15)
         self.search_entry.pack(side=tk.LEFT, padx=2)
-        self.search_entry.bind('<KeyRelease>', self._filter_db_regions)
+        self.search_entry.bind('<KeyRelease>', self._on_search_key)
         
         self.db_region_var = tk.StringVar()
         self.db_combo = ttk.Combobox(db_frame, textvariable=self.db_region_var, state="readonly", width=25)
@@ -155,54 +192,93 @@ class MapSelectorApp:
         # Memorizza lista completa per filtro
         self.all_db_regions = []
         self.italian_regions_list = []  # Lista regioni italiane da GADM
+        self.search_index: Optional[RegionSearchIndex] = None
+        self._search_job = None
         
-        # --- Status bar ---
+        # --- Status bar (con avanzamento e annullamento delle operazioni in background) ---
+        status_frame = ttk.Frame(main_frame)
+        status_frame.pack(fill=tk.X, pady=2)
         self.status_var = tk.StringVar(value="Pronto. Apri un'immagine per iniziare.")
-        status_bar = ttk.Label(main_frame, textvariable=self.status_var, relief=tk.SUNKEN)
-        status_bar.pack(fill=tk.X, pady=2)
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN)
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = ttk.Button(status_frame, text="⏹ Annulla", command=self._cancel_task, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=2)
+        self.progress = ttk.Progressbar(status_frame, length=160, maximum=1.0)
+        self.progress.pack(side=tk.RIGHT, padx=2)
     
     def _load_gadm_database(self):
-        """Carica database regioni mondiali (Natural Earth + GADM Italy)"""
-        region_list = []
+        """Avvia il caricamento dei database (GADM Italy + Natural Earth) in un thread
+        
+        La finestra compare subito; _poll_database applica i risultati nel thread Tk.
+        """
+        self.db_loading = True
+        self.db_combo.configure(state="disabled")
+        self.status_var.set("⏳ Caricamento database regioni in corso...")
+        
+        self._db_queue: queue.Queue = queue.Queue()
+        threading.Thread(target=lambda: self._db_queue.put(self._read_databases()), daemon=True).start()
+        self.root.after(100, self._poll_database)
+    
+    @staticmethod
+    def _read_databases() -> Dict:
+        """Legge i database e prepara la lista del dropdown (nessuna chiamata Tk)"""
+        result = {'italy_regions': None, 'italian_regions_list': [], 'world_regions': None, 'labels': []}
+        base_dir = Path(__file__).parent / "geodata"
         
         # 1. GADM Italy - Regioni italiane (priorità)
-        gadm_path = Path(__file__).parent / "geodata" / "gadm_italy" / "gadm41_ITA_1.shp"
+        gadm_path = base_dir / "gadm_italy" / "gadm41_ITA_1.shp"
         if gadm_path.exists():
             try:
-                self.italy_regions = gpd.read_file(str(gadm_path))
-                self.italian_regions_list = sorted(self.italy_regions['NAME_1'].unique())
-                # Aggiungi regioni italiane in cima alla lista
-                for r in self.italian_regions_list:
-                    region_list.append(f"{r} (Italia - Regione)")
-                print(f"Caricate {len(self.italian_regions_list)} regioni italiane da GADM")
+                italy_regions = read_reference(gadm_path)
+                result['italy_regions'] = italy_regions
+                result['italian_regions_list'] = sorted(italy_regions['NAME_1'].unique())
+                result['labels'] += [f"{r} (Italia - Regione)" for r in result['italian_regions_list']]
+                print(f"Caricate {len(result['italian_regions_list'])} regioni italiane da GADM")
             except Exception as e:
                 print(f"Errore caricamento GADM Italy: {e}")
-                self.italian_regions_list = []
         
         # 2. Natural Earth - Database mondiale
-        ne_path = Path(__file__).parent / "geodata" / "ne_10m_admin_1_states_provinces" / "ne_10m_admin_1_states_provinces.shp"
+        ne_path = base_dir / "ne_10m_admin_1_states_provinces" / "ne_10m_admin_1_states_provinces.shp"
         if ne_path.exists():
             try:
-                self.world_regions = gpd.read_file(str(ne_path))
-                
-                # Crea lista formattata: "Regione (Paese)"
-                for _, row in self.world_regions.iterrows():
-                    name = row.get('name', 'Unknown')
-                    admin = row.get('admin', 'Unknown')
-                    if name and admin and admin != 'Italy':  # Escludi Italia (già da GADM)
-                        region_list.append(f"{name} ({admin})")
+                world_regions = read_reference(ne_path)
+                result['world_regions'] = world_regions
                 
+                # Crea lista formattata: "Regione (Paese)", Italia esclusa (già da GADM)
+                names = world_regions.get('name', pd.Series('Unknown', index=world_regions.index))
+                admins = world_regions.get('admin', pd.Series('Unknown', index=world_regions.index))
+                names, admins = names.fillna('').astype(str), admins.fillna('').astype(str)
+                keep = (names != '') & (admins != '') & (admins != 'Italy')
+                result['labels'] += (names[keep] + ' (' + admins[keep] + ')').tolist()
             except Exception as e:
                 print(f"Errore caricamento Natural Earth: {e}")
-                self.world_regions = None
         
-        # Ordina e salva
-        region_list = sorted(set(region_list))
-        self.all_db_regions = region_list
-        self.db_combo['values'] = [''] + region_list
+        # Ordina
+        result['labels'] = sorted(set(result['labels']))
+        result['search_index'] = RegionSearchIndex(result['labels'])
+        return result
+    
+    def _poll_database(self):
+        """Applica i database letti dal thread, altrimenti ricontrolla tra 100 ms"""
+        try:
+            result = self._db_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self._poll_database)
+            return
+        
+        self.italy_regions = result['italy_regions']
+        self.italy_shapes = None
+        self.italian_regions_list = result['italian_regions_list']
+        self.world_regions = result['world_regions']
+        self.all_db_regions = result['labels']
+        self.search_index = result['search_index']
+        self.db_loading = False
+        
+        self.db_combo.configure(state="readonly")
+        self._filter_db_regions()
         
-        n_italy = len(self.italian_regions_list) if hasattr(self, 'italian_regions_list') else 0
-        self.status_var.set(f"Database: {n_italy} regioni italiane + {len(region_list) - n_italy} mondiali")
+        n_italy = len(self.italian_regions_list)
+        self.status_var.set(f"Database: {n_italy} regioni italiane + {len(self.all_db_regions) - n_italy} mondiali")
     
     def _open_image(self):
         """Apri dialog per selezionare immagine"""
@@ -215,11 +291,16 @@ class MapSelectorApp:
         )
         
         if file_path:
+            if self.task is not None and self.task.running:
+                self.task.cancel()
+            self.image_generation += 1
             self.image_path = Path(file_path)
             self.original_image = cv2.imread(str(self.image_path))
             
             if self.original_image is not None:
                 self.regions = []
+                self.region_ids = None
+                self.tiles = TileCache(ImagePyramid(self.original_image), convert=cv2.COLOR_BGR2RGB)
                 self._update_display()
                 self._update_region_list()
                 self.status_var.set(f"Immagine caricata: {self.image_path.name} ({self.original_image.shape[1]}x{self.original_image.shape[0]})")
@@ -227,7 +308,7 @@ class MapSelectorApp:
                 messagebox.showerror("Errore", "Impossibile caricare l'immagine")
     
     def _extract_regions(self):
-        """Estrai regioni usando K-Means"""
+        """Estrai regioni usando K-Means (in background, regioni mostrate man mano)"""
         if self.original_image is None:
             messagebox.showwarning("Attenzione", "Prima carica un'immagine!")
             return
@@ -239,146 +320,290 @@ class MapSelectorApp:
             messagebox.showerror("Errore", "Parametri non validi")
             return
         
-        self.status_var.set("Estrazione in corso...")
-        self.root.update()
-        
-        # K-Means clustering
         image = self.original_image
-        height, width = image.shape[:2]
-        
-        pixels = image.reshape((-1, 3)).astype(np.float32)
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
-        _, labels, centers = cv2.kmeans(pixels, n_colors, None, criteria, 10, cv2.KMEANS_PP_CENTERS)
         
-        self.regions = []
-        region_id = 0
-        
-        for color_idx in range(n_colors):
-            mask = (labels.flatten() == color_idx).reshape((height, width)).astype(np.uint8) * 255
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        def work(task: BackgroundTask) -> Tuple[str, List[Region], np.ndarray]:
+            # K-Means clustering
+            # Componenti connesse di tutti i colori in un solo passaggio (dalla cache se possibile)
+            segmentation = segment_image(image, n_colors, cache=self.cache)
+            task.check()
+            components = segmentation.components
+            stats = region_stats(components.component_map, image, len(components))
+            candidates = components.select(min_area)
             
-            for contour in contours:
+            regions = []
+            region_id = 0
+            for n, cid in enumerate(candidates):
+                task.check()
+                contour = components.contour(cid)
                 area = cv2.contourArea(contour)
                 
-                if area < min_area:
-                    continue
-                
-                # Colore medio
-                mask_single = np.zeros((height, width), dtype=np.uint8)
-                cv2.drawContours(mask_single, [contour], 0, 255, -1)
-                mean_color = cv2.mean(image, mask=mask_single)[:3]
-                b, g, r = int(mean_color[0]), int(mean_color[1]), int(mean_color[2])
-                
-                # Filtra bianco/nero puro
-                if min(r, g, b) > 240 or max(r, g, b) < 30:
-                    continue
-                
-                # Semplifica contorno
-                epsilon = 0.001 * cv2.arcLength(contour, True)
-                approx = cv2.approxPolyDP(contour, epsilon, True)
+                region = None
+                if area >= min_area:
+                    # Colore medio (riduzione per regione, buchi racchiusi dal contorno inclusi)
+                    _, mean_color, _ = filled_contour_stats(
+                        stats, components.component_map, image, cid, contour, components.bboxes[cid]
+                    )
+                    b, g, r = int(mean_color[0]), int(mean_color[1]), int(mean_color[2])
+                    
+                    # Filtra bianco/nero puro
+                    if not (min(r, g, b) > 240 or max(r, g, b) < 30):
+                        # Semplifica contorno
+                        epsilon = 0.001 * cv2.arcLength(contour, True)
+                        approx = cv2.approxPolyDP(contour, epsilon, True)
+                        
+                        region = Region(region_id, approx, (r, g, b), area)
+                        regions.append(region)
+                        region_id += 1
                 
-                region = Region(region_id, approx, (r, g, b), area)
-                self.regions.append(region)
-                region_id += 1
-        
-        # Ordina per area (più grandi prima)
-        self.regions.sort(key=lambda r: r.area, reverse=True)
-        
-        # Riassegna ID
-        for i, region in enumerate(self.regions):
-            region.id = i
-            region.name = f"Regione {i}"
+                # Ogni regione viene inviata appena pronta
+                task.report((region, n + 1, len(candidates)))
+            
+            # Ordina per area (più grandi prima) e rasterizza nello stesso ordine del
+            # disegno: dove i contorni si sovrappongono il raster ha la regione sopra
+            regions.sort(key=lambda r: r.area, reverse=True)
+            task.check()
+            region_ids = rasterize_contours([r.contour for r in regions], image.shape)
+            return segmentation.method, regions, region_ids
+        
+        def on_progress(events):
+            self.regions.extend(region for region, _, _ in events if region is not None)
+            _, done, total = events[-1]
+            self._set_progress(done / total)
+            self._update_display()
+            self._append_region_rows()
+            self.status_var.set(f"Estrazione: {len(self.regions)} regioni ({done}/{total} componenti)")
+        
+        def on_done(result):
+            method, self.regions, self.region_ids = result
+            
+            # Riassegna ID (= valore nel raster - 1)
+            for i, region in enumerate(self.regions):
+                region.id = i
+                region.name = f"Regione {i}"
+            
+            self._update_display()
+            self._update_region_list()
+            self.status_var.set(f"Estratte {len(self.regions)} regioni ({method}). Clicca per selezionare/deselezionare.")
         
-        self._update_display()
-        self._update_region_list()
-        self.status_var.set(f"Estratte {len(self.regions)} regioni. Clicca per selezionare/deselezionare.")
+        def on_cancel():
+            self.regions = []
+            self._update_display()
+            self._update_region_list()
+        
+        if self._start_task(work, "estrazione", on_progress, on_done, on_cancel):
+            self.regions = []
+            self.region_ids = None
+            self._update_display()
+            self._update_region_list()
+    
+    def _start_task(self, work, name: str, on_progress=None, on_done=None, on_cancel=None) -> bool:
+        """Avvia work(task) in background (una operazione alla volta, name: "estrazione", ...)"""
+        if self.task is not None and self.task.running:
+            messagebox.showinfo("Attendere", "Operazione in corso: attendi o annullala.")
+            return False
+        
+        # Callback dell'operazione solo se nel frattempo non è stata aperta un'altra immagine
+        generation = self.image_generation
+        
+        def current(callback):
+            if callback is None:
+                return None
+            def wrapped(*args):
+                if generation == self.image_generation:
+                    callback(*args)
+            return wrapped
+        
+        on_progress, on_done, on_cancel = current(on_progress), current(on_done), current(on_cancel)
+        
+        def finish(callback):
+            def wrapped(*args):
+                self.cancel_button.configure(state=tk.DISABLED)
+                self.progress.stop()
+                self.progress.configure(mode='determinate', value=0)
+                if callback is not None:
+                    callback(*args)
+            return wrapped
+        
+        def on_error(error):
+            self.status_var.set("Operazione fallita")
+            messagebox.showerror("Errore", f"Errore {name}:\n{error}")
+        
+        def on_cancelled():
+            self.status_var.set("Operazione annullata")
+            if on_cancel is not None:
+                on_cancel()
+        
+        self.status_var.set(f"{name.capitalize()} in corso...")
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.progress.configure(mode='indeterminate')
+        self.progress.start(15)
+        self.task = BackgroundTask(self.root, work, on_progress=on_progress, on_done=finish(on_done),
+                                   on_cancel=finish(on_cancelled), on_error=finish(on_error)).start()
+        return True
+    
+    def _cancel_task(self):
+        if self.task is not None and self.task.running:
+            self.task.cancel()
+            self.status_var.set("Annullamento...")
+    
+    def _set_progress(self, fraction: float):
+        if str(self.progress['mode']) != 'determinate':
+            self.progress.stop()
+            self.progress.configure(mode='determinate')
+        self.progress.configure(value=fraction)
     
     def _update_display(self):
         """Aggiorna visualizzazione canvas"""
         if self.original_image is None:
             return
         
-        # Crea copia per disegno
-        display = self.original_image.copy()
+        # Scala per il canvas
+        canvas_w = self.canvas.winfo_width()
+        canvas_h = self.canvas.winfo_height()
+        
+        if canvas_w > 1 and canvas_h > 1:
+            img_h, img_w = self.original_image.shape[:2]
+            
+            scale_w = canvas_w / img_w
+            scale_h = canvas_h / img_h
+            self.scale_factor = min(scale_w, scale_h, 1.0)
+        
+        # Immagine già ridotta (RGB) dal livello più vicino della piramide: il costo
+        # dipende dalla dimensione del canvas, non da quella della scansione
+        s = self.scale_factor
+        view_w, view_h = self.tiles.pyramid.view_size(s)
+        display = self.tiles.render(s, 0, 0, view_w, view_h)
         
-        # Disegna regioni
+        # Disegna regioni (colori RGB, coordinate scalate)
         for region in self.regions:
+            contour = np.round(region.contour * s).astype(np.int32)
             if region.selected:
                 # Regione selezionata: bordo verde spesso
-                cv2.drawContours(display, [region.contour], 0, (0, 255, 0), 3)
+                cv2.drawContours(display, [contour], 0, (0, 255, 0), 3)
                 
                 # Etichetta
-                cx, cy = region.centroid
+                cx, cy = int(region.centroid[0] * s), int(region.centroid[1] * s)
                 cv2.putText(display, str(region.id), (cx-10, cy+5), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 3)
                 cv2.putText(display, str(region.id), (cx-10, cy+5), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 100, 0), 2)
             else:
                 # Regione deselezionata: bordo rosso sottile
-                cv2.drawContours(display, [region.contour], 0, (0, 0, 255), 1)
-        
-        # Ridimensiona per canvas
-        canvas_w = self.canvas.winfo_width()
-        canvas_h = self.canvas.winfo_height()
-        
-        if canvas_w > 1 and canvas_h > 1:
-            img_h, img_w = display.shape[:2]
-            
-            scale_w = canvas_w / img_w
-            scale_h = canvas_h / img_h
-            self.scale_factor = min(scale_w, scale_h, 1.0)
-            
-            new_w = int(img_w * self.scale_factor)
-            new_h = int(img_h * self.scale_factor)
-            
-            display = cv2.resize(display, (new_w, new_h))
+                cv2.drawContours(display, [contour], 0, (255, 0, 0), 1)
         
         # Converti per Tkinter
-        display_rgb = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
         self.display_image = display
         
-        pil_image = Image.fromarray(display_rgb)
+        pil_image = Image.fromarray(display)
         self.tk_image = ImageTk.PhotoImage(pil_image)
         
         self.canvas.delete("all")
         self.canvas.create_image(0, 0, anchor=tk.NW, image=self.tk_image)
     
+    @staticmethod
+    def _checkbox_image(checked: bool) -> ImageTk.PhotoImage:
+        """Casella 14x14 per lo stato della riga (immagine del tag)"""
+        image = Image.new('RGBA', (14, 14), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([1, 1, 12, 12], fill='white', outline='#555555')
+        if checked:
+            draw.line([(3, 7), (6, 10), (11, 3)], fill='#1e7e34', width=2)
+        return ImageTk.PhotoImage(image)
+    
+    @staticmethod
+    def _region_row(region: Region) -> Tuple[str, Tuple[str]]:
+        """Testo e tag della riga di una regione"""
+        text = f"[{region.id}] {region.name} ({region.area:.0f}px²)"
+        return text, ('selected' if region.selected else 'deselected',)
+    
     def _update_region_list(self):
-        """Aggiorna listbox regioni"""
-        self.region_listbox.delete(0, tk.END)
-        
-        for region in self.regions:
-            status = "✅" if region.selected else "❌"
-            text = f"{status} [{region.id}] {region.name} ({region.area:.0f}px²)"
-            self.region_listbox.insert(tk.END, text)
-            
-            # Colora sfondo
-            if region.selected:
-                self.region_listbox.itemconfig(tk.END, bg='#d4edda')
-            else:
-                self.region_listbox.itemconfig(tk.END, bg='#f8d7da')
+        """Ricostruisce la lista (solo quando cambia l'insieme delle regioni)"""
+        self.region_tree.delete(*self.region_tree.get_children())
+        self._append_region_rows()
     
-    def _on_click(self, event):
-        """Gestisce click su canvas"""
-        if not self.regions or self.original_image is None:
+    def _append_region_rows(self):
+        """Aggiunge le righe delle regioni non ancora in lista (estrazione in corso)"""
+        for idx in range(len(self.region_tree.get_children()), len(self.regions)):
+            text, tags = self._region_row(self.regions[idx])
+            self.region_tree.insert('', tk.END, iid=str(idx), text=text, tags=tags)
+    
+    def _refresh_region_rows(self, indices):
+        """Aggiorna solo le righe indicate (nome o selezione cambiati)"""
+        for idx in indices:
+            text, tags = self._region_row(self.regions[idx])
+            self.region_tree.item(str(idx), text=text, tags=tags)
+    
+    def _set_all_rows_selected(self, selected: bool):
+        """Stato di tutte le righe con due comandi sui tag (nessuna riga toccata una per una)"""
+        items = self.region_tree.get_children()
+        if not items:
             return
+        on, off = ('selected', 'deselected') if selected else ('deselected', 'selected')
+        self.region_tree.tk.call(self.region_tree, 'tag', 'remove', off, items)
+        self.region_tree.tk.call(self.region_tree, 'tag', 'add', on, items)
+    
+    def _selected_index(self) -> Optional[int]:
+        """Indice della regione selezionata nella lista"""
+        selection = self.region_tree.selection()
+        if selection:
+            idx = int(selection[0])
+            if idx < len(self.regions):
+                return idx
+        return None
+    
+    def _region_at(self, event) -> Optional[Region]:
+        """Regione sotto il cursore (quella disegnata sopra): una lettura del raster id"""
+        if self.region_ids is None:
+            return None
         
         # Converti coordinate canvas → immagine originale
         x = int(event.x / self.scale_factor)
         y = int(event.y / self.scale_factor)
+        h, w = self.region_ids.shape
+        if not (0 <= x < w and 0 <= y < h):
+            return None
         
-        # Trova regione cliccata
-        for region in self.regions:
-            result = cv2.pointPolygonTest(region.contour, (float(x), float(y)), False)
-            if result >= 0:
-                # Toggle selezione
-                region.selected = not region.selected
-                self._update_display()
-                self._update_region_list()
-                
-                status = "selezionata" if region.selected else "deselezionata"
-                self.status_var.set(f"Regione {region.id} ({region.name}) {status}")
-                return
+        region_id = int(self.region_ids[y, x])
+        return self.regions[region_id - 1] if region_id > 0 else None
+    
+    def _on_click(self, event):
+        """Gestisce click su canvas"""
+        region = self._region_at(event)
+        if region is None:
+            return
+        
+        # Toggle selezione
+        region.selected = not region.selected
+        self._update_display()
+        self._refresh_region_rows([region.id])
+        
+        status = "selezionata" if region.selected else "deselezionata"
+        self.status_var.set(f"Regione {region.id} ({region.name}) {status}")
+    
+    def _on_motion(self, event):
+        """Tooltip con il nome della regione sotto il cursore"""
+        region = self._region_at(event)
+        if region is None:
+            self._hide_tooltip()
+            return
+        
+        if region.id + 1 != self._hover_id or not self.canvas.find_withtag("tooltip"):
+            self._hide_tooltip()
+            self.canvas.create_text(0, 0, anchor=tk.NW, text=f"[{region.id}] {region.name}",
+                                    fill='white', font=('Arial', 9), tags=("tooltip", "tooltip_text"))
+            x0, y0, x1, y1 = self.canvas.bbox("tooltip_text")
+            self.canvas.create_rectangle(x0 - 3, y0 - 2, x1 + 3, y1 + 2, fill='#333333', outline='',
+                                         tags=("tooltip", "tooltip_box"))
+            self.canvas.tag_raise("tooltip_text")
+            self._hover_id = region.id + 1
+        
+        x0, y0, _, _ = self.canvas.bbox("tooltip_box")
+        self.canvas.move("tooltip", event.x + 14 - x0, event.y + 14 - y0)
+    
+    def _hide_tooltip(self):
+        self.canvas.delete("tooltip")
+        self._hover_id = 0
     
     def _on_resize(self, event):
         """Gestisce ridimensionamento finestra"""
@@ -386,59 +611,87 @@ class MapSelectorApp:
     
     def _on_list_select(self, event):
         """Gestisce selezione nella lista"""
-        selection = self.region_listbox.curselection()
-        if selection:
-            idx = selection[0]
-            if idx < len(self.regions):
-                region = self.regions[idx]
-                self.name_var.set(region.name)
+        idx = self._selected_index()
+        if idx is not None:
+            self.name_var.set(self.regions[idx].name)
     
     def _on_list_double_click(self, event):
         """Toggle selezione con doppio click"""
-        selection = self.region_listbox.curselection()
-        if selection:
-            idx = selection[0]
-            if idx < len(self.regions):
-                region = self.regions[idx]
-                region.selected = not region.selected
-                self._update_display()
-                self._update_region_list()
+        idx = self._selected_index()
+        if idx is not None:
+            region = self.regions[idx]
+            region.selected = not region.selected
+            self._update_display()
+            self._refresh_region_rows([idx])
     
     def _apply_name(self):
         """Applica nome alla regione selezionata"""
-        selection = self.region_listbox.curselection()
-        if selection:
-            idx = selection[0]
-            if idx < len(self.regions):
-                self.regions[idx].name = self.name_var.get()
-                self._update_region_list()
+        idx = self._selected_index()
+        if idx is not None:
+            self.regions[idx].name = self.name_var.get()
+            self._refresh_region_rows([idx])
     
     def _use_db_name(self):
         """Usa nome dal database"""
-        selection = self.region_listbox.curselection()
+        idx = self._selected_index()
         db_name = self.db_region_var.get()
         
-        if selection and db_name:
-            idx = selection[0]
-            if idx < len(self.regions):
-                # Estrai solo il nome (senza paese)
-                name = db_name.split(' (')[0] if ' (' in db_name else db_name
-                self.regions[idx].name = name
-                self.name_var.set(name)
-                self._update_region_list()
+        if idx is not None and db_name:
+            # Estrai solo il nome (senza paese)
+            name = db_name.split(' (')[0] if ' (' in db_name else db_name
+            self.regions[idx].name = name
+            self.name_var.set(name)
+            self._refresh_region_rows([idx])
+    
+    def _on_search_key(self, event=None):
+        """Rimanda il filtro a SEARCH_DEBOUNCE_MS dall'ultimo tasto (digitazione veloce = un solo aggiornamento)"""
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DEBOUNCE_MS, self._filter_db_regions)
     
     def _filter_db_regions(self, event=None):
-        """Filtra regioni nel dropdown in base alla ricerca"""
-        search_text = self.search_var.get().lower()
+        """Filtra regioni nel dropdown in base alla ricerca (senza accenti, prefissi per primi)"""
+        self._search_job = None
+        if self.search_index is None:
+            return
         
-        if not search_text:
+        if not self.search_var.get().strip():
             self.db_combo['values'] = [''] + self.all_db_regions
         else:
-            filtered = [r for r in self.all_db_regions if search_text in r.lower()]
-            self.db_combo['values'] = [''] + filtered[:100]  # Limita a 100 risultati
+            self.db_combo['values'] = [''] + self.search_index.search(self.search_var.get(), limit=SEARCH_LIMIT)
+    
+    @staticmethod
+    def _normalize_contour(coords: np.ndarray) -> np.ndarray:
+        """Contorno OpenCV (int32) scalato in 0-1000 sul lato maggiore"""
+        coords_norm = coords - coords.min(axis=0)
+        if coords_norm.max() > 0:
+            coords_norm = coords_norm / coords_norm.max() * 1000
+        return coords_norm.astype(np.int32).reshape(-1, 1, 2)
+    
+    def _italy_shape_moments(self) -> Tuple[List[str], np.ndarray]:
+        """Nomi e momenti di Hu dei poligoni principali GADM (calcolati una volta)"""
+        if self.italy_shapes is None:
+            db_contours = {}
+            for name, geom in zip(self.italy_regions['NAME_1'], self.italy_regions.geometry):
+                # Estrai coordinate del poligono principale
+                if geom.geom_type == 'MultiPolygon':
+                    largest = max(geom.geoms, key=lambda p: p.area)
+                    coords = np.array(largest.exterior.coords)
+                elif geom.geom_type == 'Polygon':
+                    coords = np.array(geom.exterior.coords)
+                else:
+                    continue
+                db_contours[name] = contour_hu_moments(self._normalize_contour(coords))
+            
+            self.italy_shapes = (list(db_contours), np.array(list(db_contours.values())).reshape(-1, 7))
+        return self.italy_shapes
     
     def _auto_assign_italian_regions(self):
         """Abbina automaticamente le regioni estratte confrontando le forme con GADM"""
+        if self.db_loading:
+            messagebox.showinfo("Attendere", "Database regioni in caricamento, riprova tra qualche secondo.")
+            return
+        
         if not hasattr(self, 'italy_regions') or self.italy_regions is None:
             messagebox.showerror("Errore", "Database regioni italiane non caricato!")
             return
@@ -452,83 +705,56 @@ class MapSelectorApp:
             messagebox.showwarning("Attenzione", "Nessuna regione selezionata!")
             return
         
-        self.status_var.set("Confronto forme in corso...")
-        self.root.update()
+        contours = [r.contour.reshape(-1, 2) for _, r in selected_regions]
         
-        # Prepara contorni dal database GADM
-        db_contours = {}
-        for _, row in self.italy_regions.iterrows():
-            name = row['NAME_1']
-            geom = row.geometry
-            
-            # Estrai coordinate del poligono principale
-            if geom.geom_type == 'MultiPolygon':
-                largest = max(geom.geoms, key=lambda p: p.area)
-                coords = np.array(largest.exterior.coords)
-            elif geom.geom_type == 'Polygon':
-                coords = np.array(geom.exterior.coords)
-            else:
-                continue
+        def work(task: BackgroundTask):
+            # Momenti di Hu: una volta per contorno (quelli GADM restano in memoria)
+            db_names, db_hu = self._italy_shape_moments()
+            region_hu = np.empty((len(contours), 7))
+            for n, contour in enumerate(contours):
+                task.check()
+                region_hu[n] = contour_hu_moments(self._normalize_contour(contour))
+                task.report((n + 1) / len(contours))
             
-            # Normalizza (0-1000)
-            coords_norm = coords - coords.min(axis=0)
-            if coords_norm.max() > 0:
-                coords_norm = coords_norm / coords_norm.max() * 1000
+            # Matrice dei costi (regioni estratte × regioni DB): il migliore tra I1, I2, I3
+            costs = match_shapes_matrix(region_hu, db_hu).min(axis=0)
+            task.check()
             
-            contour = coords_norm.astype(np.int32).reshape(-1, 1, 2)
-            db_contours[name] = contour
-        
-        # Calcola TUTTI gli score per ogni coppia (regione estratta, regione DB)
-        all_scores = []
-        
-        for i, region in selected_regions:
-            # Normalizza il contorno estratto
-            contour = region.contour.copy()
-            contour_2d = contour.reshape(-1, 2)
-            contour_norm = contour_2d - contour_2d.min(axis=0)
-            if contour_norm.max() > 0:
-                contour_norm = contour_norm / contour_norm.max() * 1000
-            contour_norm = contour_norm.astype(np.int32).reshape(-1, 1, 2)
-            
-            for name, db_contour in db_contours.items():
-                try:
-                    # Prova diversi metodi e prendi il migliore
-                    score1 = cv2.matchShapes(contour_norm, db_contour, cv2.CONTOURS_MATCH_I1, 0)
-                    score2 = cv2.matchShapes(contour_norm, db_contour, cv2.CONTOURS_MATCH_I2, 0)
-                    score3 = cv2.matchShapes(contour_norm, db_contour, cv2.CONTOURS_MATCH_I3, 0)
-                    
-                    # Usa la media pesata (I1 è spesso migliore)
-                    score = min(score1, score2, score3)
-                    
-                    all_scores.append((i, name, score, region.area))
-                except:
-                    continue
+            # Assegnazione uno-a-uno ottima (costo totale minimo); le coppie oltre la soglia
+            # costano più di qualsiasi insieme di coppie valide e vengono scartate dopo
+            rejected = ~(costs < MAX_SHAPE_DISTANCE)
+            penalty = MAX_SHAPE_DISTANCE * (min(costs.shape) + 1)
+            rows, cols = linear_sum_assignment(np.where(rejected, penalty, costs))
+            return db_names, costs, rejected, rows, cols
         
-        # Ordina per score (migliori prima)
-        all_scores.sort(key=lambda x: x[2])
+        def on_progress(events):
+            self._set_progress(events[-1])
         
-        # Assegnazione greedy: prendi i migliori match senza duplicati
+        def on_done(result):
+            self._apply_italian_assignments(selected_regions, *result)
+        
+        self._start_task(work, "confronto forme", on_progress, on_done)
+    
+    def _apply_italian_assignments(self, selected_regions: List[Tuple[int, Region]], db_names: List[str],
+                                   costs: np.ndarray, rejected: np.ndarray, rows: np.ndarray, cols: np.ndarray):
+        """Applica l'abbinamento calcolato in background e mostra il riepilogo"""
         assignments = {}
         used_db_regions = set()
-        used_extracted = set()
         match_details = []
         
-        for idx, db_name, score, area in all_scores:
-            if idx in used_extracted or db_name in used_db_regions:
+        for row, col in zip(rows, cols):
+            if rejected[row, col]:
                 continue
-            
-            # Accetta match con soglia più alta
-            if score < 2.0:  # Soglia molto più permissiva
-                assignments[idx] = (db_name, score)
-                used_db_regions.add(db_name)
-                used_extracted.add(idx)
-                match_details.append((idx, db_name, score))
+            idx, db_name, score = selected_regions[row][0], db_names[col], float(costs[row, col])
+            assignments[idx] = (db_name, score)
+            used_db_regions.add(db_name)
+            match_details.append((idx, db_name, score))
         
         # Applica le assegnazioni
         for idx, (name, score) in assignments.items():
             self.regions[idx].name = name
         
-        self._update_region_list()
+        self._refresh_region_rows(assignments)
         
         count = len(assignments)
         selected_count = len(selected_regions)
@@ -552,7 +778,7 @@ class MapSelectorApp:
             if unassigned > 0:
                 msg += f"\n{unassigned} regioni non abbinate"
                 # Trova quali regioni DB non sono state usate
-                unused_db = set(db_contours.keys()) - used_db_regions
+                unused_db = set(db_names) - used_db_regions
                 if unused_db and len(unused_db) <= 5:
                     msg += f"\nRegioni mancanti: {', '.join(sorted(unused_db))}"
             
@@ -571,14 +797,14 @@ class MapSelectorApp:
         for region in self.regions:
             region.selected = True
         self._update_display()
-        self._update_region_list()
+        self._set_all_rows_selected(True)
     
     def _deselect_all(self):
         """Deseleziona tutte le regioni"""
         for region in self.regions:
             region.selected = False
         self._update_display()
-        self._update_region_list()
+        self._set_all_rows_selected(False)
     
     def _pixel_to_latlon(self, x: int, y: int) -> Tuple[float, float]:
         """Converti pixel in lat/lon"""
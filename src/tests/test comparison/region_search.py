@@ -0,0 +1,129 @@
+"""
+Region Search - Indice di ricerca per il dropdown delle regioni di riferimento
+Etichette normalizzate (minuscolo, senza accenti), chiavi ordinate per la ricerca
+per prefisso e liste di n-grammi per le sottostringhe: ogni tasto costa qualche
+bisezione e l'intersezione di poche liste invece di una scansione di tutte le voci
+"""
+
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+WORD_PATTERN = re.compile(r'\w+')
+NGRAM_SIZES = (1, 2, 3)  # query di 1-2 caratteri: lista esatta; più lunghe: trigrammi
+MAX_CHAR = '\U0010ffff'
+
+
+def fold(text: str) -> str:
+    """Minuscolo e senza accenti ("Vallée d'Aoste" → "vallee d'aoste")"""
+    decomposed = unicodedata.normalize('NFKD', str(text).casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def ngrams(text: str, size: int) -> set:
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class RegionSearchIndex:
+    """Ricerca incrementale con ranking sulle etichette del dropdown
+
+    Ordine dei risultati: etichette che iniziano con la query, poi etichette con una
+    parola che inizia con la query, poi sottostringhe ovunque; a parità di livello
+    vale l'ordine delle etichette in ingresso (alfabetico).
+    """
+
+    def __init__(self, labels: List[str]):
+        self.labels = list(labels)
+        self.folded = [fold(label) for label in self.labels]
+
+        # Prefissi dell'etichetta intera
+        order = sorted(range(len(self.folded)), key=self.folded.__getitem__)
+        self._prefix_keys = [self.folded[i] for i in order]
+        self._prefix_ids = np.array(order, dtype=np.int32)
+
+        # Prefissi delle parole successive alla prima ("emilia-romagna" → "romagna")
+        words = sorted((match.group(), i) for i, text in enumerate(self.folded)
+                       for match in WORD_PATTERN.finditer(text) if match.start() > 0)
+        self._words = [word for word, _ in words]
+        self._word_ids = np.array([i for _, i in words], dtype=np.int32)
+
+        # Sottostringhe: liste ordinate di id per ogni n-gramma
+        postings: Dict[str, List[int]] = {}
+        for i, text in enumerate(self.folded):
+            for size in NGRAM_SIZES:
+                for gram in ngrams(text, size):
+                    postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        # Ricerca incrementale: id che contengono l'ultima query (sottoinsieme valido
+        # per ogni query che la estende)
+        self._last: Tuple[str, Optional[np.ndarray]] = ('', None)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def search(self, query: str, limit: int = 100) -> List[str]:
+        """Etichette che contengono la query (tutte se la query è vuota)"""
+        q = fold(query).strip()
+        if not q:
+            return list(self.labels)
+
+        results: List[int] = []
+        seen = set()
+
+        def add(ids) -> bool:
+            for i in ids:
+                i = int(i)
+                if i not in seen:
+                    seen.add(i)
+                    results.append(i)
+                    if len(results) >= limit:
+                        return True
+            return False
+
+        # 1. L'etichetta inizia con la query (id riordinati: ordine delle etichette in ingresso)
+        lo = bisect_left(self._prefix_keys, q)
+        hi = bisect_left(self._prefix_keys, q + MAX_CHAR, lo)
+        if add(np.sort(self._prefix_ids[lo:hi])):
+            return [self.labels[i] for i in results]
+
+        # 2. Una parola (non la prima) inizia con la query
+        first_word = WORD_PATTERN.match(q)
+        if first_word:
+            at_word_start = re.compile(r'(?<!\w)' + re.escape(q))
+            lo = bisect_left(self._words, first_word.group())
+            hi = bisect_left(self._words, first_word.group() + MAX_CHAR, lo)
+            candidates = (i for i in np.unique(self._word_ids[lo:hi]) if at_word_start.search(self.folded[i]))
+            if add(candidates):
+                return [self.labels[i] for i in results]
+
+        # 3. Sottostringa ovunque
+        add(self._substring_matches(q))
+        return [self.labels[i] for i in results]
+
+    def _substring_matches(self, q: str) -> np.ndarray:
+        """Id (ordinati) delle etichette che contengono q"""
+        empty = np.empty(0, dtype=np.int32)
+        if len(q) <= max(NGRAM_SIZES[:-1]):
+            matches = self._postings.get(q, empty)  # lista esatta, niente verifica
+        else:
+            # Candidati: la lista più corta tra quelle dei trigrammi e i risultati
+            # della query precedente, se questa la estende
+            lists = sorted((self._postings.get(gram, empty) for gram in ngrams(q, 3)), key=len)
+            last_query, last_ids = self._last
+            if last_ids is not None and last_query and q.startswith(last_query) and len(last_ids) < len(lists[0]):
+                candidates = last_ids
+            else:
+                candidates = lists[0]
+                for ids in lists[1:]:
+                    if len(candidates) == 0:
+                        break
+                    candidates = np.intersect1d(candidates, ids, assume_unique=True)
+            matches = np.array([i for i in candidates if q in self.folded[i]], dtype=np.int32)
+
+        self._last = (q, matches)
+        return matches
@@ -0,0 +1,315 @@
+"""
+Shape Index - Descrittori precalcolati delle forme del database di riferimento
+Contorni normalizzati e ricampionati, maschere raster compresse a bit, invarianti
+geometrici, momenti di Hu e descrittori di Fourier calcolati una sola volta e
+salvati accanto allo shapefile (.shapeidx.npz)
+"""
+
+import cv2
+import numpy as np
+import geopandas as gpd
+from pathlib import Path
+from typing import Dict, Optional
+from shapely.geometry import MultiPolygon, Polygon
+
+
+# Da incrementare quando cambiano i descrittori (invalida gli indici su disco)
+INDEX_VERSION = 5
+
+N_POINTS = 50        # punti del contorno ricampionato (come shape_similarity)
+N_FOURIER = 16       # coefficienti di Fourier conservati
+FOURIER_SAMPLES = 64  # punti equispaziati sul perimetro per la FFT
+
+N_INVARIANTS = 3     # allungamento, compattezza, rapporto area/inviluppo convesso
+N_HU_FILTER = 3      # momenti di Hu usati dal filtro (quelli di ordine alto sono rumorosi)
+HU_WEIGHT = 0.5      # peso della distanza di Hu rispetto agli invarianti
+FOURIER_WEIGHT = 1.0  # peso della distanza tra i descrittori di Fourier
+
+HAUSDORFF_CHUNK = 256  # contorni per blocco: (256, 50, 50) distanze ≈ 5 MB
+
+MASK_SIZE = 64       # lato della maschera raster per l'IoU (64×64 bit = 512 byte)
+
+INDEX_SUFFIX = '.shapeidx.npz'
+
+
+def main_polygon(geometry) -> Optional[Polygon]:
+    """Poligono principale (il più grande se MultiPolygon), None se non poligonale"""
+    if isinstance(geometry, MultiPolygon):
+        geometry = max(geometry.geoms, key=lambda p: p.area)
+    if not isinstance(geometry, Polygon) or geometry.is_empty:
+        return None
+    return geometry
+
+
+def normalize_shape(coords: np.ndarray) -> np.ndarray:
+    """Centra, scala (raggio massimo 1) e allinea al punto più a nord"""
+    centroid = np.mean(coords, axis=0)
+    coords_centered = coords - centroid
+
+    max_dist = np.max(np.linalg.norm(coords_centered, axis=1))
+    if max_dist > 0:
+        coords_normalized = coords_centered / max_dist
+    else:
+        coords_normalized = coords_centered
+
+    north_idx = np.argmax(coords_normalized[:, 1])
+    return np.roll(coords_normalized, -north_idx, axis=0)
+
+
+def interpolate_shape(coords: np.ndarray, n_points: int = N_POINTS) -> np.ndarray:
+    """Interpola n_points punti lungo la sequenza dei vertici"""
+    t = np.linspace(0, 1, len(coords))
+    t_new = np.linspace(0, 1, n_points)
+    return np.column_stack([np.interp(t_new, t, coords[:, 0]), np.interp(t_new, t, coords[:, 1])])
+
+
+def polygon_coords(poly: Polygon, flip_y: bool = False) -> np.ndarray:
+    """Vertici del contorno esterno normalizzati con normalize_shape
+
+    flip_y: per le forme in coordinate immagine (asse y verso il basso), così da
+            confrontarle nello stesso sistema delle geometrie lon/lat del database
+    """
+    coords = np.array(poly.exterior.coords[:-1])  # senza l'ultimo punto duplicato
+    if flip_y:
+        coords = coords * [1, -1]
+    return normalize_shape(coords)
+
+
+def shape_signature(poly: Polygon, n_points: int = N_POINTS, flip_y: bool = False) -> np.ndarray:
+    """Contorno normalizzato e ricampionato usato dalla distanza di Hausdorff"""
+    return interpolate_shape(polygon_coords(poly, flip_y), n_points)
+
+
+def shape_mask(poly: Polygon, size: int = MASK_SIZE, flip_y: bool = False) -> np.ndarray:
+    """Maschera size×size della forma normalizzata (come normalize_shape: centrata,
+    raggio massimo 1), compressa a bit con np.packbits; flip_y come in polygon_coords
+    """
+    coords = polygon_coords(poly, flip_y)
+
+    # [-1, 1] → pixel, riga 0 in alto (y massima); coordinate a virgola fissa (shift=4)
+    pixels = np.column_stack([(coords[:, 0] + 1), (1 - coords[:, 1])]) * (size / 2)
+    mask = np.zeros((size, size), dtype=np.uint8)
+    cv2.fillPoly(mask, [np.round(pixels * 16).astype(np.int32)], 1, lineType=cv2.LINE_8, shift=4)
+    return np.packbits(mask.ravel())
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    """Bit a 1 per riga di un array uint8 compresso"""
+    if hasattr(np, 'bitwise_count'):  # NumPy >= 2.0
+        return np.bitwise_count(bits).sum(axis=-1, dtype=np.int64)
+    return _POPCOUNT_TABLE[bits].sum(axis=-1, dtype=np.int64)
+
+
+def raster_iou(query_mask: np.ndarray, masks: np.ndarray) -> np.ndarray:
+    """IoU tra una maschera compressa (B,) e M maschere (M, B) via popcount"""
+    intersection = _popcount(masks & query_mask)
+    union = _popcount(masks | query_mask)
+    return np.where(union > 0, intersection / np.maximum(union, 1), 0.0)
+
+
+def contour_hu_moments(contour: np.ndarray) -> np.ndarray:
+    """Momenti di Hu grezzi di un contorno OpenCV (come li calcola cv2.matchShapes)"""
+    return cv2.HuMoments(cv2.moments(contour)).ravel()
+
+
+def match_shapes_matrix(hu_a: np.ndarray, hu_b: np.ndarray, eps: float = 1e-5) -> np.ndarray:
+    """Distanze I1, I2, I3 di cv2.matchShapes tra N e M forme, come array (3, N, M)
+
+    Stessa formula di OpenCV sui momenti di Hu già calcolati (N + M calcoli invece
+    di 3·N·M chiamate): i momenti con |h| <= eps vengono ignorati, e se una sola
+    delle due forme ha momenti utili la distanza è il massimo float.
+    """
+    hu_a = np.asarray(hu_a, dtype=np.float64)[:, None, :]
+    hu_b = np.asarray(hu_b, dtype=np.float64)[None, :, :]
+    usable_a, usable_b = np.abs(hu_a) > eps, np.abs(hu_b) > eps
+    usable = usable_a & usable_b
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_a = np.sign(hu_a) * np.log10(np.abs(hu_a))
+        log_b = np.sign(hu_b) * np.log10(np.abs(hu_b))
+        i1 = np.where(usable, np.abs(1 / log_b - 1 / log_a), 0).sum(axis=2)
+        i2 = np.where(usable, np.abs(log_b - log_a), 0).sum(axis=2)
+        i3 = np.where(usable, np.abs((log_a - log_b) / log_a), 0).max(axis=2)
+
+    distances = np.stack([i1, i2, i3])
+    distances[:, usable_a.any(axis=2) != usable_b.any(axis=2)] = np.finfo(np.float64).max
+    return distances
+
+
+def shape_invariants(poly: Polygon) -> np.ndarray:
+    """Invarianti economici a scala e traslazione: allungamento del bounding box
+    (lato corto / lato lungo), compattezza (4πA/P²) e rapporto tra area e area
+    dell'inviluppo convesso"""
+    minx, miny, maxx, maxy = poly.bounds
+    long_side = max(maxx - minx, maxy - miny)
+    aspect = min(maxx - minx, maxy - miny) / long_side if long_side > 0 else 1.0
+    compactness = 4 * np.pi * poly.area / poly.length ** 2 if poly.length > 0 else 0.0
+    hull_area = poly.convex_hull.area
+    area_ratio = poly.area / hull_area if hull_area > 0 else 0.0
+    return np.array([aspect, compactness, area_ratio])
+
+
+def hu_moments(poly: Polygon) -> np.ndarray:
+    """Momenti di Hu del contorno esterno in scala logaritmica (con segno)"""
+    contour = np.asarray(poly.exterior.coords, dtype=np.float32).reshape((-1, 1, 2))
+    hu = cv2.HuMoments(cv2.moments(contour)).ravel()
+    return -np.sign(hu) * np.log10(np.abs(hu) + 1e-30)
+
+
+def fourier_descriptor(poly: Polygon, n_coeffs: int = N_FOURIER,
+                       n_samples: int = FOURIER_SAMPLES) -> np.ndarray:
+    """Modulo dei coefficienti di Fourier del perimetro, ricampionato a passo costante
+
+    Le frequenze k e -k vengono combinate (√(|c_k|² + |c_-k|²)), quindi il descrittore
+    è invariante a posizione, scala, rotazione, punto di partenza, verso di percorrenza
+    e riflessione (le immagini hanno l'asse y verso il basso)
+    """
+    coords = np.asarray(poly.exterior.coords, dtype=np.float64)
+    arc = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(coords, axis=0), axis=1))])
+    if arc[-1] <= 0:
+        return np.zeros(n_coeffs)
+
+    distances = np.linspace(0, arc[-1], n_samples, endpoint=False)
+    points = np.interp(distances, arc, coords[:, 0]) + 1j * np.interp(distances, arc, coords[:, 1])
+    spectrum = np.abs(np.fft.fft(points))
+    k = np.arange(1, n_coeffs + 1)
+    magnitude = np.hypot(spectrum[k], spectrum[-k])
+    return magnitude / magnitude[0] if magnitude[0] > 0 else magnitude
+
+
+def descriptor_distance(query_invariants: np.ndarray, query_hu: np.ndarray, query_fourier: np.ndarray,
+                        invariants: np.ndarray, hu: np.ndarray, fourier: np.ndarray) -> np.ndarray:
+    """Distanza economica tra una forma e M forme dell'indice (più bassa = più simile)
+
+    Somma dei |log| dei rapporti tra invarianti, della distanza L1 dei primi momenti
+    di Hu in scala logaritmica (in valore assoluto: invariante alla riflessione,
+    le immagini hanno l'asse y verso il basso) e della distanza L1 dei descrittori
+    di Fourier (il primo coefficiente vale sempre 1 e viene saltato)
+    """
+    eps = 1e-9
+    distance = np.abs(np.log((invariants + eps) / (query_invariants + eps))).sum(axis=1)
+    hu_distance = np.abs(np.abs(hu[:, :N_HU_FILTER]) - np.abs(query_hu[:N_HU_FILTER])).sum(axis=1)
+    fourier_distance = np.abs(fourier[:, 1:] - query_fourier[1:]).sum(axis=1)
+    return distance + HU_WEIGHT * hu_distance + FOURIER_WEIGHT * fourier_distance
+
+
+def batch_hausdorff(query: np.ndarray, references: np.ndarray,
+                    chunk_size: int = HAUSDORFF_CHUNK) -> np.ndarray:
+    """Distanza di Hausdorff simmetrica tra un contorno (P, 2) e M contorni (M, Q, 2)
+
+    Equivale a max(directed_hausdorff(a, b), directed_hausdorff(b, a)) per ogni
+    coppia, calcolata a blocchi di chunk_size contorni per limitare la memoria.
+    """
+    query = np.asarray(query, dtype=np.float64)
+    references = np.asarray(references, dtype=np.float64)
+    result = np.empty(len(references), dtype=np.float64)
+
+    for start in range(0, len(references), chunk_size):
+        block = references[start:start + chunk_size]
+        # (B, P, Q) distanze al quadrato tra i punti della query e quelli di ogni riferimento
+        diff = query[None, :, None, :] - block[:, None, :, :]
+        squared = np.einsum('bpqd,bpqd->bpq', diff, diff)
+        forward = squared.min(axis=2).max(axis=1)
+        backward = squared.min(axis=1).max(axis=1)
+        result[start:start + chunk_size] = np.sqrt(np.maximum(forward, backward))
+
+    return result
+
+
+def source_signature(source_path: Path) -> np.ndarray:
+    """Dimensione e mtime di tutti i file del dataset (.shp, .dbf, .shx, ...)"""
+    source_path = Path(source_path)
+    files = sorted(p for p in source_path.parent.glob(source_path.stem + '.*')
+                   if not p.name.endswith((INDEX_SUFFIX, '.tmp')) and p.is_file())
+    return np.array([[p.stat().st_size, p.stat().st_mtime_ns] for p in files], dtype=np.int64)
+
+
+ARRAYS = ('valid', 'signatures', 'invariants', 'masks', 'hu', 'fourier')
+
+
+def index_path_for(source_path: Path) -> Path:
+    """<file>.shapeidx.npz: l'estensione resta nel nome (x.shp e x.geojson non si sovrascrivono)"""
+    source_path = Path(source_path)
+    return source_path.with_name(source_path.name + INDEX_SUFFIX)
+
+
+class ShapeIndex:
+    """Descrittori di tutte le feature di un GeoDataFrame (per posizione)"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.valid = arrays['valid']            # (N,) bool, feature poligonale
+        self.signatures = arrays['signatures']  # (N, N_POINTS, 2)
+        self.invariants = arrays['invariants']  # (N, N_INVARIANTS)
+        self.masks = arrays['masks']            # (N, MASK_SIZE² / 8) uint8
+        self.hu = arrays['hu']                  # (N, 7)
+        self.fourier = arrays['fourier']        # (N, N_FOURIER)
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    @classmethod
+    def build(cls, gdf: gpd.GeoDataFrame) -> 'ShapeIndex':
+        n = len(gdf)
+        arrays = {
+            'valid': np.zeros(n, dtype=bool),
+            'signatures': np.zeros((n, N_POINTS, 2), dtype=np.float64),
+            'invariants': np.zeros((n, N_INVARIANTS), dtype=np.float64),
+            'masks': np.zeros((n, MASK_SIZE * MASK_SIZE // 8), dtype=np.uint8),
+            'hu': np.zeros((n, 7), dtype=np.float64),
+            'fourier': np.zeros((n, N_FOURIER), dtype=np.float64),
+        }
+
+        for i, geometry in enumerate(gdf.geometry.values):
+            poly = main_polygon(geometry)
+            if poly is None:
+                continue
+            arrays['valid'][i] = True
+            arrays['signatures'][i] = shape_signature(poly)
+            arrays['invariants'][i] = shape_invariants(poly)
+            arrays['masks'][i] = shape_mask(poly)
+            arrays['hu'][i] = hu_moments(poly)
+            arrays['fourier'][i] = fourier_descriptor(poly)
+
+        return cls(arrays)
+
+    def save(self, path: Path, signature: np.ndarray):
+        """Scrittura atomica (file temporaneo + rename)"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=np.array(INDEX_VERSION), source=signature, valid=self.valid,
+                     signatures=self.signatures, invariants=self.invariants,
+                     masks=self.masks, hu=self.hu, fourier=self.fourier)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load_or_build(cls, gdf: gpd.GeoDataFrame, source_path: Optional[Path] = None) -> 'ShapeIndex':
+        """Carica l'indice accanto al file sorgente se aggiornato, altrimenti lo ricostruisce
+
+        L'indice è valido se versione, numero di feature e dimensione/mtime dei file
+        sorgente coincidono. Se la cartella non è scrivibile l'indice resta in memoria.
+        """
+        if source_path is None:
+            return cls.build(gdf)
+
+        path = index_path_for(source_path)
+        signature = source_signature(source_path)
+
+        if path.exists():
+            try:
+                with np.load(str(path), allow_pickle=False) as data:
+                    if (int(data['version']) == INDEX_VERSION and len(data['valid']) == len(gdf)
+                            and np.array_equal(data['source'], signature)):
+                        return cls({name: data[name] for name in ARRAYS})
+            except (OSError, ValueError, KeyError):
+                pass
+
+        index = cls.build(gdf)
+        try:
+            index.save(path, signature)
+        except OSError:
+            pass
+        return index
@@ -6,6 +6,10 @@ Riconosce automaticamente regioni/paesi confrontando geometrie
 import cv2
 import numpy as np
 import json
+import multiprocessing
+import os
+import threading
+import time
 import urllib.request
 import zipfile
 from pathlib import Path
@@ -13,16 +17,56 @@ from typing import List, Dict, Tuple, Optional
 from shapely.geometry import Polygon, MultiPolygon, shape, mapping
 from shapely.ops import unary_union
 from scipy.spatial import distance
-import geopandas as gpd
+from concurrent.futures import ProcessPoolExecutor
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from extraction import SegmentationCache, read_reference, segment_image
+from shape_index import (ShapeIndex, batch_hausdorff, descriptor_distance, fourier_descriptor, hu_moments,
+                         interpolate_shape, main_polygon, normalize_shape, raster_iou, shape_invariants,
+                         shape_mask, shape_signature)
+
+
+# Stato dei processi worker di match_all(workers > 1): il matcher viene ereditato con
+# fork; il lock impedisce a due match paralleli contemporanei di sovrascriverlo
+_worker: Dict = {}
+_worker_lock = threading.Lock()
+
+
+def _init_match_worker():
+    cv2.setNumThreads(1)
+    # Le stampe di find_best_match le fa solo il processo principale
+    sys.stdout = open(os.devnull, 'w')
+
+
+def _match_shape_worker(task: Tuple[Dict, Optional[str], bool]) -> Tuple[List[Dict], Dict]:
+    shape, region_filter, prefer_large = task
+    matcher = _worker['matcher']
+    matcher.match_stats = matcher._empty_stats()
+    matches = matcher.find_best_match(shape, top_k=5, region_filter=region_filter, prefer_large=prefer_large)
+    return matches, matcher.match_stats
 
 
 class ShapeMatcher:
-    def __init__(self, database_path: str = None, use_gadm_italy: bool = True):
-        """Inizializza il matcher con database mondiale (o GADM Italy per regioni)"""
+    def __init__(self, database_path: str = None, use_gadm_italy: bool = True, use_cache: bool = True,
+                 cascade_top_n: Optional[int] = None):
+        """Inizializza il matcher con database mondiale (o GADM Italy per regioni)
+        
+        cascade_top_n: candidati che superano il filtro economico (invarianti + Hu) e
+                       ricevono il punteggio completo Hausdorff + IoU. Default None:
+                       confronto esaustivo; un valore (es. 40) attiva il filtro, più
+                       veloce ma può scartare il match corretto
+        """
         self.use_gadm_italy = use_gadm_italy
+        self.cascade_top_n = cascade_top_n
+        self.match_stats = self._empty_stats()
+        self.cache = SegmentationCache() if use_cache else None
         self.database_path = database_path or self._get_database_path()
         self.world_shapes = None
         self.italy_regions = None
+        self.world_index: Optional[ShapeIndex] = None
+        self.italy_index: Optional[ShapeIndex] = None
         self.load_database()
         
         # Carica GADM Italy se richiesto
@@ -96,8 +140,9 @@ class ShapeMatcher:
         print(f"\n🗺️  Caricamento database mondiale...")
         
         try:
-            self.world_shapes = gpd.read_file(str(self.database_path))
+            self.world_shapes = read_reference(Path(self.database_path))
             print(f"   ✅ {len(self.world_shapes)} regioni/stati caricati")
+            self.world_index = ShapeIndex.load_or_build(self.world_shapes, Path(self.database_path))
             print(f"   📍 Copertura: {', '.join(self.world_shapes['admin'].unique()[:5])}...")
             
         except Exception as e:
@@ -116,62 +161,67 @@ class ShapeMatcher:
             return
         
         try:
-            self.italy_regions = gpd.read_file(str(gadm_shapefile))
+            self.italy_regions = read_reference(gadm_shapefile)
+            self.italy_index = ShapeIndex.load_or_build(self.italy_regions, gadm_shapefile)
             print(f"\n🇮🇹 Database GADM Italy caricato")
             print(f"   ✅ {len(self.italy_regions)} regioni italiane ufficiali")
         except Exception as e:
             print(f"   ⚠️ Errore caricamento GADM Italy: {e}")
             self.italy_regions = None
     
-    def extract_features_from_image(self, image_path: str, n_colors: int = 60, min_area: int = 300) -> List[Dict]:
-        """Estrae contorni da immagine (riutilizza logica K-Means)"""
+    def extract_features_from_image(self, image_path: str, n_colors: int = 60, min_area: int = 300,
+                                    pyramid_levels: int = 0, image: Optional[np.ndarray] = None) -> List[Dict]:
+        """Estrae contorni da immagine (riutilizza logica K-Means)
+        
+        pyramid_levels > 0: segmentazione coarse-to-fine (vedi extraction.pyramid)
+        image: immagine BGR già decodificata (evita di rileggere image_path)
+        """
         print(f"\n🎨 Estrazione forme da immagine...")
         
-        image = cv2.imread(str(image_path))
+        if image is None:
+            image = cv2.imread(str(image_path))
         if image is None:
             raise ValueError(f"Impossibile caricare: {image_path}")
         
         height, width = image.shape[:2]
         print(f"   Dimensioni: {width}x{height}px")
         
-        # K-Means clustering
-        pixels = image.reshape((-1, 3)).astype(np.float32)
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
-        _, labels, centers = cv2.kmeans(pixels, n_colors, None, criteria, 10, cv2.KMEANS_PP_CENTERS)
-        
-        # Trova contorni per ogni colore
+        # Palette esatta oppure K-Means (campione stratificato + assegnazione vettorizzata),
+        # eventualmente su immagine ridotta con rifinitura dei soli confini, poi componenti
+        # connesse di tutti i colori in un solo passaggio (riusate dalla cache se possibile)
+        segmentation = segment_image(image, n_colors, pyramid_levels, cache=self.cache)
+        components = segmentation.components
+        cached = ", cache" if segmentation.cached else ""
+        print(f"   Quantizzazione: {segmentation.method} ({len(segmentation.centers)} colori{cached})")
         candidates = []
         
-        for color_idx in range(n_colors):
-            mask = (labels.flatten() == color_idx).reshape((height, width)).astype(np.uint8) * 255
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for cid in components.select(min_area):
+            contour = components.contour(cid)
+            area = cv2.contourArea(contour)
+            if area < min_area:
+                continue
+            
+            # Semplifica contorno
+            epsilon = 0.001 * cv2.arcLength(contour, True)
+            approx = cv2.approxPolyDP(contour, epsilon, True)
+            points = [(int(p[0][0]), int(p[0][1])) for p in approx]
             
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                if area < min_area:
+            # Normalizza coordinate (0-1)
+            normalized_points = [(x/width, y/height) for x, y in points]
+            
+            # Crea poligono Shapely
+            if len(normalized_points) >= 3:
+                try:
+                    poly = Polygon(normalized_points)
+                    if poly.is_valid and poly.area > 0:
+                        candidates.append({
+                            'geometry': poly,
+                            'area': area,
+                            'points': points,
+                            'normalized': normalized_points
+                        })
+                except:
                     continue
-                
-                # Semplifica contorno
-                epsilon = 0.001 * cv2.arcLength(contour, True)
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-                points = [(int(p[0][0]), int(p[0][1])) for p in approx]
-                
-                # Normalizza coordinate (0-1)
-                normalized_points = [(x/width, y/height) for x, y in points]
-                
-                # Crea poligono Shapely
-                if len(normalized_points) >= 3:
-                    try:
-                        poly = Polygon(normalized_points)
-                        if poly.is_valid and poly.area > 0:
-                            candidates.append({
-                                'geometry': poly,
-                                'area': area,
-                                'points': points,
-                                'normalized': normalized_points
-                            })
-                    except:
-                        continue
         
         print(f"   ✅ {len(candidates)} forme estratte")
         return candidates
@@ -179,35 +229,21 @@ class ShapeMatcher:
     def normalize_shape(self, poly: Polygon) -> np.ndarray:
         """Normalizza forma per confronto (invariante a scala/rotazione/traslazione)"""
         coords = np.array(poly.exterior.coords[:-1])  # Rimuovi ultimo punto duplicato
-        
-        # Centra sul centroide
-        centroid = np.mean(coords, axis=0)
-        coords_centered = coords - centroid
-        
-        # Normalizza scala
-        max_dist = np.max(np.linalg.norm(coords_centered, axis=1))
-        if max_dist > 0:
-            coords_normalized = coords_centered / max_dist
-        else:
-            coords_normalized = coords_centered
-        
-        # Allinea orientamento (usa punto più a nord come riferimento)
-        north_idx = np.argmax(coords_normalized[:, 1])
-        coords_aligned = np.roll(coords_normalized, -north_idx, axis=0)
-        
-        return coords_aligned
+        return normalize_shape(coords)
     
-    def shape_similarity(self, poly1: Polygon, poly2: Polygon) -> float:
-        """Calcola similarità tra due forme (0=diverso, 1=identico)"""
+    def shape_similarity(self, poly1: Polygon, poly2: Polygon,
+                         signature1: np.ndarray = None, signature2: np.ndarray = None) -> float:
+        """Calcola similarità tra due forme (0=diverso, 1=identico)
+        
+        poly1: forma estratta (coordinate immagine 0-1, asse y verso il basso)
+        poly2: forma del database (lon/lat)
+        signature1/2: contorni normalizzati e ricampionati già calcolati (ShapeIndex)
+        """
         try:
-            # Metodo 1: Hausdorff distance normalizzata
-            coords1 = self.normalize_shape(poly1)
-            coords2 = self.normalize_shape(poly2)
-            
-            # Interpola per avere stesso numero di punti
-            n_points = 50
-            coords1_interp = self._interpolate_shape(coords1, n_points)
-            coords2_interp = self._interpolate_shape(coords2, n_points)
+            # Metodo 1: Hausdorff distance normalizzata, su contorni normalizzati
+            # e interpolati a 50 punti (dall'indice se disponibili)
+            coords1_interp = signature1 if signature1 is not None else shape_signature(poly1, flip_y=True)
+            coords2_interp = signature2 if signature2 is not None else shape_signature(poly2)
             
             # Distanza Hausdorff
             hausdorff = max(
@@ -215,43 +251,60 @@ class ShapeMatcher:
                 distance.directed_hausdorff(coords2_interp, coords1_interp)[0]
             )
             
-            # Converti in score (0-1)
-            similarity_hausdorff = np.exp(-hausdorff * 5)
-            
-            # Metodo 2: IoU (Intersection over Union)
-            intersection = poly1.intersection(poly2).area
-            union = poly1.union(poly2).area
-            iou = intersection / union if union > 0 else 0
-            
-            # Combina metodi (pesato)
-            combined_score = 0.6 * similarity_hausdorff + 0.4 * iou
-            
-            return combined_score
-            
+            # Metodo 2: IoU delle maschere raster (forme normalizzate, stesso orientamento
+            # della firma di Hausdorff: la forma estratta è ribaltata in entrambi i metodi)
+            iou = raster_iou(shape_mask(poly1, flip_y=True), shape_mask(poly2)[None])[0]
         except:
             return 0.0
+        
+        return float(self._combined_score(hausdorff, iou))
+    
+    @staticmethod
+    def _combined_score(hausdorff, iou):
+        """Score finale (0-1) da distanza di Hausdorff e IoU (scalari o array)"""
+        # Converti in score (0-1)
+        similarity_hausdorff = np.exp(-hausdorff * 5)
+        
+        # Combina metodi (pesato)
+        return 0.6 * similarity_hausdorff + 0.4 * iou
     
     def _interpolate_shape(self, coords: np.ndarray, n_points: int) -> np.ndarray:
         """Interpola punti lungo perimetro"""
-        from scipy.interpolate import interp1d
-        
-        t = np.linspace(0, 1, len(coords))
-        t_new = np.linspace(0, 1, n_points)
-        
-        fx = interp1d(t, coords[:, 0], kind='linear')
-        fy = interp1d(t, coords[:, 1], kind='linear')
-        
-        return np.column_stack([fx(t_new), fy(t_new)])
+        return interpolate_shape(coords, n_points)
+    
+    @staticmethod
+    def _empty_stats() -> Dict:
+        return {'shapes': 0, 'candidates': 0, 'scored': 0, 'matches': 0, 'filter_time': 0.0, 'score_time': 0.0}
+    
+    def _cascade_filter(self, extracted_shape: Dict, shape_index: ShapeIndex,
+                        positions: np.ndarray, top_n: int) -> np.ndarray:
+        """Stadio 1: tiene i top_n candidati più vicini secondo i descrittori economici"""
+        query = extracted_shape['geometry']
+        
+        distances = descriptor_distance(shape_invariants(query), hu_moments(query), fourier_descriptor(query),
+                                        shape_index.invariants[positions], shape_index.hu[positions],
+                                        shape_index.fourier[positions])
+        # Ordine originale del search set tra i sopravvissuti (a parità di score vince il primo)
+        return np.sort(np.argpartition(distances, top_n)[:top_n])
     
-    def find_best_match(self, extracted_shape: Dict, top_k: int = 5, region_filter: str = None, prefer_large: bool = True) -> List[Dict]:
-        """Trova migliori match nel database mondiale"""
+    def find_best_match(self, extracted_shape: Dict, top_k: int = 5, region_filter: str = None, prefer_large: bool = True,
+                        top_n: Optional[int] = None) -> List[Dict]:
+        """Trova migliori match nel database mondiale
+        
+        Cascata a due stadi (solo se top_n, default self.cascade_top_n, è impostato):
+        filtro economico sui descrittori precalcolati fino a top_n candidati, poi
+        Hausdorff + IoU solo sui sopravvissuti. Senza top_n tutti i candidati sono valutati.
+        """
+        top_n = self.cascade_top_n if top_n is None else top_n
         extracted_poly = extracted_shape['geometry']
         
         matches = []
+        base_gdf, shape_index = self.world_shapes, self.world_index
         
         # Usa GADM Italy se disponibile e filtro Italy
         if region_filter and region_filter.lower() == 'italy' and self.italy_regions is not None:
             search_set = self.italy_regions.copy()
+            base_gdf, shape_index = self.italy_regions, self.italy_index
             name_field = 'NAME_1'  # Nome regione in GADM
             admin_field = 'COUNTRY'
             print(f"     [GADM] Confronto con {len(search_set)} regioni italiane...", end='', flush=True)
@@ -277,43 +330,102 @@ class ShapeMatcher:
             admin_field = 'admin'
             print(f"     Confronto con {len(search_set)} entità...", end='', flush=True)
         
-        for idx, row in search_set.iterrows():
-            db_geom = row.geometry
-            
-            # Converti MultiPolygon in Polygon principale
-            if isinstance(db_geom, MultiPolygon):
-                db_geom = max(db_geom.geoms, key=lambda p: p.area)
-            
-            if not isinstance(db_geom, Polygon):
-                continue
-            
-            # Calcola similarità
-            score = self.shape_similarity(extracted_poly, db_geom)
-            
-            if score > 0.12:  # Soglia bassissima per mappe stilizzate
-                matches.append({
-                    'name': row.get(name_field, 'Unknown'),
-                    'admin': row.get(admin_field, 'Unknown') if admin_field in row else 'Italy',
-                    'region': row.get('region', '') if 'region' in row else 'Europe',
-                    'score': score,
-                    'geometry': db_geom,
-                    'properties': row.to_dict()
-                })
-        
-        print(f" trovati {len(matches)} candidati")
+        # Descrittori precalcolati: posizione di ogni candidato nel GeoDataFrame indicizzato
+        positions = base_gdf.index.get_indexer(search_set.index)
+        rows = np.flatnonzero(shape_index.valid[positions])
+        n_candidates = len(rows)
+        
+        # Stadio 1: filtro economico
+        t0 = time.perf_counter()
+        if top_n and len(rows) > top_n:
+            rows = rows[self._cascade_filter(extracted_shape, shape_index, positions[rows], top_n)]
+        t_filter = time.perf_counter() - t0
+        
+        # Stadio 2: Hausdorff e IoU raster vettorizzati su tutti i sopravvissuti
+        t0 = time.perf_counter()
+        targets = positions[rows]
+        try:
+            scores = self._combined_score(
+                batch_hausdorff(shape_signature(extracted_poly, flip_y=True), shape_index.signatures[targets]),
+                raster_iou(shape_mask(extracted_poly, flip_y=True), shape_index.masks[targets]))
+        except Exception:
+            scores = np.zeros(len(rows))  # forma estratta degenere: nessun match (come in shape_similarity)
+        
+        # Soglia bassissima per mappe stilizzate; le righe si leggono solo per i top_k
+        passed = np.flatnonzero(scores > 0.12)
+        n_matches = len(passed)
+        for k in passed[np.argsort(-scores[passed], kind='stable')[:top_k]]:
+            row = search_set.iloc[rows[k]]
+            matches.append({
+                'name': row.get(name_field, 'Unknown'),
+                'admin': row.get(admin_field, 'Unknown') if admin_field in row else 'Italy',
+                'region': row.get('region', '') if 'region' in row else 'Europe',
+                'score': float(scores[k]),
+                'geometry': main_polygon(row.geometry),  # MultiPolygon → Polygon principale
+                'properties': row.to_dict()
+            })
+        t_score = time.perf_counter() - t0
+        
+        stats = self.match_stats
+        stats['shapes'] += 1
+        stats['candidates'] += n_candidates
+        stats['scored'] += len(rows)
+        stats['matches'] += n_matches
+        stats['filter_time'] += t_filter
+        stats['score_time'] += t_score
+        
+        if len(rows) < n_candidates:
+            print(f" filtro {n_candidates} → {len(rows)} ({t_filter*1000:.1f}ms),", end='')
+        print(f" trovati {n_matches} candidati ({t_score*1000:.0f}ms)")
         
         # Ordina per score
         matches.sort(key=lambda x: x['score'], reverse=True)
         
         return matches[:top_k]
     
-    def match_all(self, image_path: str, confidence_threshold: float = 0.3, region_filter: str = None) -> Dict:
+    def _match_parallel(self, shapes: List[Dict], region_filter: Optional[str], prefer_large: bool,
+                        workers: int) -> Optional[List[List[Dict]]]:
+        """find_best_match su un pool di processi, risultati nell'ordine delle forme
+        
+        Database e indici non vengono serializzati: i worker (fork) li ereditano
+        copy-on-write. Restituisce None, e match_all procede in sequenza, se fork non
+        è disponibile (Windows, macOS con spawn) o se un altro match parallelo è in corso.
+        """
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            print("   ⚠️  fork non disponibile: matching sequenziale")
+            return None
+        if not _worker_lock.acquire(blocking=False):
+            print("   ⚠️  Un altro matching parallelo è in corso: matching sequenziale")
+            return None
+        
+        print(f"   ⚙️  {workers} processi in parallelo")
+        # Alle forme serve solo la geometria (niente punti/contorni da serializzare)
+        tasks = [({'geometry': shape['geometry']}, region_filter, prefer_large) for shape in shapes]
+        try:
+            _worker['matcher'] = self
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=_init_match_worker) as executor:
+                results = list(executor.map(_match_shape_worker, tasks))
+        finally:
+            _worker.pop('matcher', None)
+            _worker_lock.release()
+        
+        for _, stats in results:
+            for key, value in stats.items():
+                self.match_stats[key] += value
+        return [matches for matches, _ in results]
+    
+    def match_all(self, image_path: str, confidence_threshold: float = 0.3, region_filter: str = None,
+                  output_path: str = None, image: Optional[np.ndarray] = None, workers: int = 1) -> Dict:
         """Processo completo: estrai → match → GeoJSON
         
         Args:
             image_path: Path immagine
             confidence_threshold: Soglia minima confidenza (0.0-1.0)
             region_filter: Filtra per paese (es. "Italy", "France")
+            output_path: Path GeoJSON (default: <immagine>.matched.geojson)
+            image: Immagine BGR già decodificata (opzionale)
+            workers: Processi per il matching delle forme (1 = sequenziale)
         """
         print("\n" + "="*60)
         print("🔍 SHAPE MATCHING - Riconoscimento Automatico")
@@ -323,7 +435,7 @@ class ShapeMatcher:
             print(f"🎯 Filtro geografico: {region_filter}")
         
         # 1. Estrai forme da immagine
-        extracted_shapes = self.extract_features_from_image(image_path, n_colors=80, min_area=200)
+        extracted_shapes = self.extract_features_from_image(image_path, n_colors=80, min_area=200, image=image)
         
         if not extracted_shapes:
             print("\n❌ Nessuna forma estratta dall'immagine")
@@ -331,18 +443,28 @@ class ShapeMatcher:
         
         # Ordina per area (più grandi prima)
         extracted_shapes.sort(key=lambda x: x['area'], reverse=True)
+        self.match_stats = self._empty_stats()
         
         # 2. Match con database
         print(f"\n🎯 Matching con database mondiale...")
         
         results = []
+        shapes = extracted_shapes[:25]  # Limita a 25 forme più grandi
+        
+        # Prioritizza entità grandi se filtro Italy (regioni non province)
+        prefer_large = bool(region_filter and region_filter.lower() == 'italy')
+        
+        parallel_matches = None
+        if workers > 1 and len(shapes) > 1:
+            parallel_matches = self._match_parallel(shapes, region_filter, prefer_large, min(workers, len(shapes)))
         
-        for i, shape in enumerate(extracted_shapes[:25]):  # Limita a 25 forme più grandi
-            print(f"\n   Forma {i+1}/{min(25, len(extracted_shapes))} (area: {shape['area']:.0f}px²)...")
+        for i, shape in enumerate(shapes):
+            print(f"\n   Forma {i+1}/{len(shapes)} (area: {shape['area']:.0f}px²)...")
             
-            # Prioritizza entità grandi se filtro Italy (regioni non province)
-            prefer_large = (region_filter and region_filter.lower() == 'italy')
-            matches = self.find_best_match(shape, top_k=5, region_filter=region_filter, prefer_large=prefer_large)
+            if parallel_matches is not None:
+                matches = parallel_matches[i]
+            else:
+                matches = self.find_best_match(shape, top_k=5, region_filter=region_filter, prefer_large=prefer_large)
             
             if matches:
                 best_match = matches[0]
@@ -368,6 +490,10 @@ class ShapeMatcher:
             else:
                 print(f"     ⚠️ Nessun candidato trovato")
         
+        stats = self.match_stats
+        print(f"\n⏱️  Cascata su {stats['shapes']} forme: filtro {stats['candidates']} → {stats['scored']} candidati "
+              f"({stats['filter_time']:.3f}s), Hausdorff + IoU → {stats['matches']} match ({stats['score_time']:.3f}s)")
+        
         # 3. Crea GeoJSON
         print(f"\n📝 Generazione GeoJSON...")
         
@@ -393,7 +519,7 @@ class ShapeMatcher:
         }
         
         # Salva
-        output_path = Path(image_path).with_suffix('.matched.geojson')
+        output_path = Path(output_path) if output_path else Path(image_path).with_suffix('.matched.geojson')
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(geojson, f, indent=2, ensure_ascii=False)
         
@@ -428,9 +554,13 @@ def main():
     threshold_input = input("   Soglia [0.18]: ").strip()
     threshold = float(threshold_input) if threshold_input else 0.18
     
+    workers_input = input(f"   Processi paralleli [1, max {os.cpu_count()}]: ").strip()
+    workers = int(workers_input) if workers_input else 1
+    
     try:
         matcher = ShapeMatcher()
-        result = matcher.match_all(image_path, confidence_threshold=threshold, region_filter=region_filter)
+        result = matcher.match_all(image_path, confidence_threshold=threshold, region_filter=region_filter,
+                                   workers=workers)
         
         if result:
             print("\n" + "="*70)
@@ -6,28 +6,73 @@ Versione 1.0 - Usa Computer Vision (OpenCV) senza modelli pesanti
 import cv2
 import numpy as np
 import json
+import shutil
+import sys
+import tempfile
 from pathlib import Path
 from typing import List, Tuple, Dict
 import argparse
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from extraction import ComponentBuilder, downscale, iter_strips, open_image, strip_rows
+
+# Righe di alone per banda: coprono blur 5x5 e adaptiveThreshold 11x11
+TILE_HALO = 8
+
+# Lato massimo dell'immagine di visualizzazione (le scansioni enormi vengono ridotte)
+VIS_MAX_SIDE = 4096
+
+
 class MapExtractor:
-    def __init__(self, image_path: str):
-        """Inizializza l'estrattore con un'immagine"""
+    def __init__(self, image_path: str, tiled: bool = False, memory_budget_mb: float = 1024,
+                 image: np.ndarray = None):
+        """Inizializza l'estrattore con un'immagine
+        
+        tiled=True: immagine mappata su disco ed elaborata a bande (scansioni enormi)
+        image: immagine BGR già decodificata (evita di rileggere image_path)
+        """
         self.image_path = Path(image_path)
-        self.image = cv2.imread(str(self.image_path))
+        self.tiled = tiled
+        self.memory_budget_mb = memory_budget_mb
+        self.work_dir = Path(tempfile.mkdtemp(prefix='map_tiles_')) if tiled else None
+        
+        if image is not None:
+            self.image = image
+        elif tiled:
+            self.image = open_image(self.image_path, self.work_dir)
+        else:
+            self.image = cv2.imread(str(self.image_path))
         if self.image is None:
             raise ValueError(f"Impossibile caricare immagine: {image_path}")
         
-        self.gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
         self.height, self.width = self.image.shape[:2]
+        self.gray = None if tiled else cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
         self.regions = []
         
         print(f"✅ Immagine caricata: {self.width}x{self.height}px")
     
+    def close(self):
+        """Rimuove i file temporanei della modalità tiled (immagine, maschera e componenti .npy)"""
+        if self.work_dir is not None:
+            self.image = self.binary = None  # rilascia i memmap prima di cancellare i file
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
     def preprocess(self):
         """Preprocessa l'immagine per migliorare il rilevamento"""
         print("🔄 Preprocessing immagine...")
         
+        if self.tiled:
+            self._preprocess_tiled()
+            print("✅ Preprocessing completato")
+            return
+        
         # Riduzione rumore
         self.gray = cv2.GaussianBlur(self.gray, (5, 5), 0)
         
@@ -44,6 +89,83 @@ class MapExtractor:
         
         print("✅ Preprocessing completato")
     
+    def _preprocess_tiled(self):
+        """Come preprocess, banda per banda su disco (binary è un np.memmap)
+        
+        Blur e soglia adattiva sono esatti grazie all'alone; la CLAHE usa tile della
+        stessa altezza dell'immagine intera, ma i bordi delle bande la rendono approssimata.
+        """
+        rows = strip_rows(self.width, self.memory_budget_mb)
+        grid_rows = 8 * rows / self.height
+        self.binary = np.lib.format.open_memmap(
+            str(self.work_dir / 'binary.npy'), mode='w+', dtype=np.uint8,
+            shape=(self.height, self.width)
+        )
+        
+        for y0, y1, r0, r1 in iter_strips(self.height, rows, halo=TILE_HALO):
+            gray = cv2.cvtColor(np.asarray(self.image[r0:r1]), cv2.COLOR_BGR2GRAY)
+            gray = cv2.GaussianBlur(gray, (5, 5), 0)
+            
+            tiles_y = max(1, int(round(grid_rows * (r1 - r0) / rows)))
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, tiles_y))
+            gray = clahe.apply(gray)
+            
+            binary = cv2.adaptiveThreshold(
+                gray, 255,
+                cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                cv2.THRESH_BINARY_INV, 11, 2
+            )
+            self.binary[y0:y1] = binary[y0 - r0:y1 - r0]
+        
+        self.binary.flush()
+    
+    def _detect_regions_tiled(self, min_area: int, max_area: float) -> List[Dict]:
+        """Regioni dalle componenti connesse della maschera binaria, unite tra le bande
+        
+        Le componenti bianche danno i contorni esterni e quelle nere racchiuse i buchi,
+        come la gerarchia RETR_TREE; il contorno si estrae solo sul bbox della componente.
+        """
+        rows = strip_rows(self.width, self.memory_budget_mb)
+        builder = ComponentBuilder(self.width)
+        for y0, y1, _, _ in iter_strips(self.height, rows):
+            builder.add_rows(np.asarray(self.binary[y0:y1]))
+        
+        component_map = np.lib.format.open_memmap(
+            str(self.work_dir / 'components.npy'), mode='w+', dtype=np.int32,
+            shape=(self.height, self.width)
+        )
+        components = builder.build(component_map=component_map, rows_per_chunk=rows)
+        print(f"   Trovate {len(components)} componenti")
+        
+        valid_regions = []
+        for cid in components.select(min_area):
+            if components.areas[cid] > max_area:
+                continue
+            contour = components.contour(cid)
+            area = cv2.contourArea(contour)
+            
+            if min_area <= area <= max_area:
+                epsilon = 0.005 * cv2.arcLength(contour, True)
+                approx = cv2.approxPolyDP(contour, epsilon, True)
+                points = [(int(p[0][0]), int(p[0][1])) for p in approx]
+                
+                M = cv2.moments(contour)
+                if M["m00"] != 0:
+                    cx = int(M["m10"] / M["m00"])
+                    cy = int(M["m01"] / M["m00"])
+                else:
+                    cx, cy = points[0]
+                
+                valid_regions.append({
+                    'id': f'region_{cid}',
+                    'pixels': points,
+                    'area': area,
+                    'centroid': (cx, cy),
+                    'bounds': cv2.boundingRect(contour)
+                })
+        
+        return valid_regions
+    
     def detect_regions(self, min_area: int = 1000, max_area: int = None):
         """Rileva regioni/confini usando contour detection"""
         print("🔍 Rilevamento regioni...")
@@ -51,6 +173,12 @@ class MapExtractor:
         if max_area is None:
             max_area = self.width * self.height * 0.8
         
+        if self.tiled:
+            valid_regions = self._detect_regions_tiled(min_area, max_area)
+            self.regions = valid_regions
+            print(f"✅ Rilevate {len(valid_regions)} regioni valide")
+            return valid_regions
+        
         # Trova contorni
         contours, hierarchy = cv2.findContours(
             self.binary, 
@@ -204,19 +332,19 @@ class MapExtractor:
         """Visualizza le regioni rilevate"""
         print("\n🎨 Creazione visualizzazione...")
         
-        # Copia immagine originale
-        vis = self.image.copy()
+        # Copia ridotta a bande dell'immagine originale (in tiled è un memmap enorme)
+        vis, scale = downscale(self.image, VIS_MAX_SIDE)
         
         # Disegna ogni regione con colore casuale
         for i, region in enumerate(self.regions):
             color = tuple(np.random.randint(0, 255, 3).tolist())
             
             # Disegna contorno
-            points = np.array(region['pixels'], dtype=np.int32)
+            points = np.round(np.array(region['pixels']) * scale).astype(np.int32)
             cv2.polylines(vis, [points], True, color, 2)
             
             # Disegna centroide
-            cx, cy = region['centroid']
+            cx, cy = (int(round(c * scale)) for c in region['centroid'])
             cv2.circle(vis, (cx, cy), 5, color, -1)
             
             # Etichetta
@@ -250,6 +378,10 @@ def main():
                        help='Salta calibrazione geografica')
     parser.add_argument('--no-viz', action='store_true',
                        help='Non mostrare visualizzazione')
+    parser.add_argument('--tiled', action='store_true',
+                       help='Elaborazione a bande su disco (scansioni molto grandi)')
+    parser.add_argument('--memory-mb', type=float, default=1024,
+                       help='Budget di memoria per banda in modalità --tiled (MB)')
     
     args = parser.parse_args()
     
@@ -258,24 +390,24 @@ def main():
     
     try:
         # Carica ed elabora immagine
-        extractor = MapExtractor(args.image)
-        extractor.preprocess()
-        extractor.detect_regions(min_area=args.min_area)
-        
-        # Calibrazione geografica
-        if not args.no_calibration:
-            if not extractor.calibrate_manual():
-                print("\n⚠️  Continuo senza calibrazione geografica")
-        
-        # Esporta GeoJSON
-        extractor.to_geojson(args.output)
-        
-        # Visualizza
-        if not args.no_viz:
-            extractor.visualize(show=False, save=True)
-        
-        print("\n✅ Processo completato!")
-        print("🌐 Testa il GeoJSON su: http://geojson.io")
+        with MapExtractor(args.image, tiled=args.tiled, memory_budget_mb=args.memory_mb) as extractor:
+            extractor.preprocess()
+            extractor.detect_regions(min_area=args.min_area)
+            
+            # Calibrazione geografica
+            if not args.no_calibration:
+                if not extractor.calibrate_manual():
+                    print("\n⚠️  Continuo senza calibrazione geografica")
+            
+            # Esporta GeoJSON
+            extractor.to_geojson(args.output)
+            
+            # Visualizza
+            if not args.no_viz:
+                extractor.visualize(show=False, save=True)
+            
+            print("\n✅ Processo completato!")
+            print("🌐 Testa il GeoJSON su: http://geojson.io")
         
     except Exception as e:
         print(f"\n❌ Errore: {e}")
@@ -293,19 +425,19 @@ if __name__ == "__main__":
         image_path = input("\n📁 Path immagine mappa: ").strip('"')
         
         try:
-            extractor = MapExtractor(image_path)
-            extractor.preprocess()
-            extractor.detect_regions()
-            
-            # Chiedi calibrazione
-            resp = input("\n🎯 Vuoi calibrare geograficamente? (s/n): ")
-            if resp.lower() == 's':
-                extractor.calibrate_manual()
-            
-            extractor.to_geojson()
-            extractor.visualize(show=False, save=True)
-            
-            print("\n✅ Completato!")
+            with MapExtractor(image_path) as extractor:
+                extractor.preprocess()
+                extractor.detect_regions()
+                
+                # Chiedi calibrazione
+                resp = input("\n🎯 Vuoi calibrare geograficamente? (s/n): ")
+                if resp.lower() == 's':
+                    extractor.calibrate_manual()
+                
+                extractor.to_geojson()
+                extractor.visualize(show=False, save=True)
+                
+                print("\n✅ Completato!")
             
         except Exception as e:
             print(f"❌ Errore: {e}")
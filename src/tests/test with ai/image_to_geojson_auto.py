@@ -7,153 +7,179 @@ import cv2
 import numpy as np
 import json
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 from collections import defaultdict
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from extraction import (SegmentationCache, TiledSegmenter, downscale, filled_contour_stats,
+                        open_image, region_stats, remove_overlaps, segment_image)
+
+
+# Lato massimo dell'immagine di visualizzazione (le scansioni enormi vengono ridotte)
+VIS_MAX_SIDE = 4096
 
 
 class KMeansExtractor:
-    def __init__(self, image_path: str):
+    def __init__(self, image_path: str, tiled: bool = False, memory_budget_mb: float = 1024,
+                 image: Optional[np.ndarray] = None, use_cache: bool = True):
+        """tiled=True: immagine mappata su disco e segmentata a bande (scansioni enormi)
+        image: immagine BGR già decodificata (evita di rileggere image_path)
+        use_cache: riusa segmentazioni già calcolate (non in modalità tiled)
+        """
         self.image_path = Path(image_path)
-        self.image = cv2.imread(str(self.image_path))
+        self.tiled = tiled
+        self.memory_budget_mb = memory_budget_mb
+        self.cache = SegmentationCache() if use_cache and not tiled else None
+        self.work_dir = Path(tempfile.mkdtemp(prefix='map_tiles_')) if tiled else None
+        
+        if image is not None:
+            self.image = image
+        elif tiled:
+            self.image = open_image(self.image_path, self.work_dir)
+        else:
+            self.image = cv2.imread(str(self.image_path))
         if self.image is None:
             raise ValueError(f"Impossibile caricare: {image_path}")
         
         self.height, self.width = self.image.shape[:2]
         self.regions = []
+        self.segmentation_method: Optional[str] = None
         
         print(f"✅ Immagine: {self.width}x{self.height}px")
     
-    def segment_by_color(self, n_colors: int = 40, min_area: int = 500):
-        """Segmenta l'immagine in regioni di colore usando K-Means"""
+    def close(self):
+        """Rimuove i file temporanei della modalità tiled (immagine .npy e component_map)"""
+        if self.work_dir is not None:
+            self.image = None  # rilascia il memmap prima di cancellare il file
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def segment_by_color(self, n_colors: int = 40, min_area: int = 500, max_regions: int = 30,
+                         pyramid_levels: int = 0, save_debug: bool = True):
+        """Segmenta l'immagine in regioni di colore usando K-Means
+        
+        pyramid_levels > 0: clustering su immagine ridotta di 2**livelli, piena
+        risoluzione solo vicino ai confini (mappe a colori piatti)
+        """
         print(f"\n🎨 Segmentazione in {n_colors} colori...")
         
-        # 1. Reshape immagine per K-Means
-        pixels = self.image.reshape((-1, 3))
-        pixels = np.float32(pixels)
-        
-        # 2. K-Means clustering
-        print("   Clustering colori (può richiedere 10-20 sec)...")
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
-        _, labels, centers = cv2.kmeans(
-            pixels, 
-            n_colors, 
-            None, 
-            criteria, 
-            10, 
-            cv2.KMEANS_PP_CENTERS
-        )
-        
-        # 3. Crea immagine segmentata
-        centers = np.uint8(centers)
-        segmented = centers[labels.flatten()]
-        segmented = segmented.reshape(self.image.shape)
-        
-        print("   ✅ Segmentazione completata")
-        
-        # 4. Per ogni colore, trova regioni connesse
-        print("\n🔍 Rilevamento regioni per colore...")
+        if self.tiled:
+            # 1-4. Centri globali, label e componenti a bande (memoria limitata dal budget)
+            print(f"   Clustering colori a bande (budget {self.memory_budget_mb:.0f} MB)...")
+            segmenter = TiledSegmenter(self.image, n_colors, self.memory_budget_mb, work_dir=self.work_dir)
+            components, centers = segmenter.segment()
+            stats = segmenter.region_stats(components)
+            segmented = segmenter.preview(components, centers)
+            method = 'kmeans-tiled'
+            print(f"   ✅ Segmentazione completata (K-Means a bande da {segmenter.rows} righe, "
+                  f"run dei confini {segmenter.run_bytes / 1024 ** 2:.0f} MB)")
+        else:
+            # 1-2. Palette esatta (mappe a colori piatti) oppure K-Means su campione
+            #      (con pyramid_levels > 0 sull'immagine ridotta + rifinitura dei confini)
+            #      e componenti connesse di tutti i colori in un solo passaggio; tutto
+            #      viene riusato dalla cache se immagine e parametri sono gli stessi
+            print("   Clustering colori...")
+            segmentation = segment_image(self.image, n_colors, pyramid_levels, cache=self.cache)
+            components, centers, method = segmentation.components, segmentation.centers, segmentation.method
+            
+            # 3. Crea immagine segmentata
+            segmented = np.uint8(centers)[segmentation.labels]
+            
+            if segmentation.cached:
+                print(f"   ✅ Segmentazione dalla cache ({method}, {len(centers)} colori)")
+            elif method.startswith('palette'):
+                print(f"   ✅ Segmentazione completata (palette esatta, {len(centers)} colori, K-Means saltato)")
+            else:
+                print("   ✅ Segmentazione completata (K-Means)")
+            
+            # 4. Statistiche colore per componente
+            stats = region_stats(components.component_map, self.image, len(components))
         
+        self.segmentation_method = method
+        
+        print("\n🔍 Rilevamento regioni per colore...")
         candidates = []
         
-        for color_idx in range(n_colors):
-            # Crea maschera per questo colore
-            mask = (labels.flatten() == color_idx).reshape((self.height, self.width))
-            mask = mask.astype(np.uint8) * 255
+        for cid in components.select(min_area):
+            contour = components.contour(cid)
+            area = cv2.contourArea(contour)
             
-            # Trova contorni
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if area < min_area:
+                continue
             
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                
-                if area < min_area:
-                    continue
-                
-                # Colore medio reale (non cluster)
-                mask_single = np.zeros((self.height, self.width), dtype=np.uint8)
-                cv2.drawContours(mask_single, [contour], 0, 255, -1)
-                mean_color_bgr = cv2.mean(self.image, mask=mask_single)[:3]
-                b, g, r = mean_color_bgr
-                
-                # FILTRI BASE (meno restrittivi)
-                # Escludi solo bianco puro
-                if min(r, g, b) > 240:
-                    continue
-                
-                # Escludi nero puro
-                if max(r, g, b) < 30:
-                    continue
-                
-                # Semplifica contorno (minimo per massima fedeltà)
-                epsilon = 0.0002 * cv2.arcLength(contour, True)
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-                points = [(int(p[0][0]), int(p[0][1])) for p in approx]
-                
-                # Centroide
-                M = cv2.moments(contour)
-                if M["m00"] != 0:
-                    cx = int(M["m10"] / M["m00"])
-                    cy = int(M["m01"] / M["m00"])
-                else:
-                    cx, cy = points[0]
-                
-                candidates.append({
-                    'approx': points,
-                    'area': area,
-                    'centroid': (cx, cy),
-                    'color': (int(r), int(g), int(b)),
-                    'contour': contour
-                })
-                
-                print(f"   Regione: {area:.0f}px² - RGB({int(r)},{int(g)},{int(b)})")
+            # Colore medio reale (non cluster), buchi racchiusi dal contorno inclusi
+            _, mean_color_bgr, _ = filled_contour_stats(
+                stats, components.component_map, self.image, cid, contour, components.bboxes[cid]
+            )
+            b, g, r = mean_color_bgr
+            
+            # FILTRI BASE (meno restrittivi)
+            # Escludi solo bianco puro
+            if min(r, g, b) > 240:
+                continue
+            
+            # Escludi nero puro
+            if max(r, g, b) < 30:
+                continue
+            
+            # Semplifica contorno (minimo per massima fedeltà)
+            epsilon = 0.0002 * cv2.arcLength(contour, True)
+            approx = cv2.approxPolyDP(contour, epsilon, True)
+            points = [(int(p[0][0]), int(p[0][1])) for p in approx]
+            
+            # Centroide
+            M = cv2.moments(contour)
+            if M["m00"] != 0:
+                cx = int(M["m10"] / M["m00"])
+                cy = int(M["m01"] / M["m00"])
+            else:
+                cx, cy = points[0]
+            
+            candidates.append({
+                'approx': points,
+                'area': area,
+                'centroid': (cx, cy),
+                'color': (int(r), int(g), int(b)),
+                'contour': contour
+            })
+            
+            print(f"   Regione: {area:.0f}px² - RGB({int(r)},{int(g)},{int(b)})")
         
         # 5. Ordina per area
         candidates.sort(key=lambda x: x['area'], reverse=True)
         
-        # 6. Rimuovi sovrapposizioni
+        # 6. Rimuovi sovrapposizioni (prefiltro bbox, overlap sul solo ritaglio comune)
         final_regions = []
         
-        for candidate in candidates[:30]:  # Max 30 regioni
-            # Controlla sovrapposizione
-            is_duplicate = False
-            cx1, cy1 = candidate['centroid']
-            
-            for existing in final_regions:
-                # Se centroide dentro altra regione
-                result = cv2.pointPolygonTest(existing['contour'], (float(cx1), float(cy1)), False)
-                if result >= 0:
-                    is_duplicate = True
-                    break
-                
-                # Se aree si sovrappongono > 80%
-                mask1 = np.zeros((self.height, self.width), dtype=np.uint8)
-                mask2 = np.zeros((self.height, self.width), dtype=np.uint8)
-                cv2.drawContours(mask1, [candidate['contour']], 0, 255, -1)
-                cv2.drawContours(mask2, [existing['contour']], 0, 255, -1)
-                
-                overlap = np.logical_and(mask1, mask2).sum()
-                if overlap > 0.8 * min(candidate['area'], existing['area']):
-                    is_duplicate = True
-                    break
-            
-            if not is_duplicate:
-                r, g, b = candidate['color']
-                final_regions.append({
-                    'id': f'region_{len(final_regions)}',
-                    'pixels': candidate['approx'],
-                    'area': candidate['area'],
-                    'centroid': candidate['centroid'],
-                    'color': f'rgb({r},{g},{b})',
-                    'contour': candidate['contour']
-                })
+        for candidate in remove_overlaps(candidates, max_regions=max_regions):
+            r, g, b = candidate['color']
+            final_regions.append({
+                'id': f'region_{len(final_regions)}',
+                'pixels': candidate['approx'],
+                'area': candidate['area'],
+                'centroid': candidate['centroid'],
+                'color': f'rgb({r},{g},{b})',
+                'contour': candidate['contour']
+            })
         
         self.regions = final_regions
         print(f"\n✅ {len(final_regions)} regioni finali")
         
         # Salva immagine segmentata per debug
-        debug_path = self.image_path.with_name(self.image_path.stem + '_segmented.png')
-        cv2.imwrite(str(debug_path), segmented)
-        print(f"   Debug: {debug_path}")
+        if save_debug:
+            debug_path = self.image_path.with_name(self.image_path.stem + '_segmented.png')
+            cv2.imwrite(str(debug_path), segmented)
+            print(f"   Debug: {debug_path}")
         
         return final_regions
     
@@ -251,16 +277,17 @@ class KMeansExtractor:
         """Visualizza regioni"""
         print("\n🎨 Visualizzazione...")
         
-        vis = self.image.copy()
+        # Copia ridotta a bande: con tiled=True l'immagine intera non entra in RAM
+        vis, scale = downscale(self.image, VIS_MAX_SIDE)
         np.random.seed(42)
         
         for region in self.regions:
             color = tuple(np.random.randint(50, 255, 3).tolist())
-            points = np.array(region['pixels'], dtype=np.int32)
+            points = np.round(np.array(region['pixels']) * scale).astype(np.int32)
             
             cv2.polylines(vis, [points], True, color, 3)
             
-            cx, cy = region['centroid']
+            cx, cy = (int(round(c * scale)) for c in region['centroid'])
             cv2.circle(vis, (cx, cy), 8, color, -1)
             cv2.circle(vis, (cx, cy), 10, (0, 0, 0), 2)
             
@@ -322,46 +349,45 @@ def main():
     image_path = input("📁 Immagine: ").strip('"')
     
     try:
-        extractor = KMeansExtractor(image_path)
-        
-        # Segmenta per colore
-        extractor.segment_by_color(
-            n_colors=60,        # Più cluster per migliore distinzione bordi
-            min_area=300        # Cattura tutte le regioni
-        )
-        
-        if not extractor.regions:
-            print("\n❌ Nessuna regione trovata!")
-            print("   Prova ad aumentare n_colors o abbassare min_area")
-            return
-        
-        # Selezione interattiva
-        print("\n" + "="*60)
-        choice = input("🔍 Vuoi selezionare manualmente le regioni? [s/N]: ").strip().lower()
-        
-        if choice in ['s', 'y', 'yes', 'si', 'sì']:
-            count = extractor.interactive_selection()
-            if count == 0:
-                print("\n❌ Nessuna regione selezionata!")
+        with KMeansExtractor(image_path) as extractor:
+            # Segmenta per colore
+            extractor.segment_by_color(
+                n_colors=60,        # Più cluster per migliore distinzione bordi
+                min_area=300        # Cattura tutte le regioni
+            )
+            
+            if not extractor.regions:
+                print("\n❌ Nessuna regione trovata!")
+                print("   Prova ad aumentare n_colors o abbassare min_area")
                 return
-        
-        # Calibrazione
-        print("\n" + "="*60)
-        mode = input("🎯 [1] Italia, [2] Manuale, [3] Skip: ").strip()
-        
-        if mode == '1':
-            extractor.calibrate_italy()
-        elif mode == '2':
-            extractor.calibrate_manual()
-        
-        # Esporta
-        extractor.to_geojson()
-        extractor.visualize()
-        
-        print("\n" + "="*60)
-        print("✅ COMPLETATO!")
-        print("="*60)
-        print("\n🌐 Testa su: http://geojson.io")
+            
+            # Selezione interattiva
+            print("\n" + "="*60)
+            choice = input("🔍 Vuoi selezionare manualmente le regioni? [s/N]: ").strip().lower()
+            
+            if choice in ['s', 'y', 'yes', 'si', 'sì']:
+                count = extractor.interactive_selection()
+                if count == 0:
+                    print("\n❌ Nessuna regione selezionata!")
+                    return
+            
+            # Calibrazione
+            print("\n" + "="*60)
+            mode = input("🎯 [1] Italia, [2] Manuale, [3] Skip: ").strip()
+            
+            if mode == '1':
+                extractor.calibrate_italy()
+            elif mode == '2':
+                extractor.calibrate_manual()
+            
+            # Esporta
+            extractor.to_geojson()
+            extractor.visualize()
+            
+            print("\n" + "="*60)
+            print("✅ COMPLETATO!")
+            print("="*60)
+            print("\n🌐 Testa su: http://geojson.io")
         
     except Exception as e:
         print(f"\n❌ Errore: {e}")
@@ -0,0 +1,13 @@
+"""
+Percorsi dei moduli sotto src/ (gli script non sono un pacchetto installabile)
+"""
+
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+for path in (SRC_DIR, SRC_DIR / "tests" / "test comparison", SRC_DIR / "tests" / "test with ai",
+             SRC_DIR / "batch", SRC_DIR / "georeferencer"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
@@ -0,0 +1,149 @@
+"""
+Conversione batch: manifest, ripresa dopo un'interruzione, file corrotti e worker terminati
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+import batch_convert
+from batch_convert import BatchConfig, Manifest, collect_images, run_batch
+
+
+def write_map(path, seed: int = 0):
+    """Piccola mappa a blocchi di colore, abbastanza grande da avere regioni"""
+    rng = np.random.default_rng(seed)
+    image = np.full((120, 160, 3), 255, dtype=np.uint8)
+    for y in range(0, 120, 40):
+        for x in range(0, 160, 40):
+            image[y + 2:y + 38, x + 2:x + 38] = rng.integers(0, 200, size=3)
+    cv2.imwrite(str(path), image)
+
+
+@pytest.fixture
+def scans(tmp_path):
+    """ok / corrotta / ok / ok: la corrotta è in mezzo allo stesso blocco"""
+    root = tmp_path / 'scans'
+    root.mkdir()
+    for i, name in enumerate(('a.png', 'c.png', 'd.png')):
+        write_map(root / name, seed=i)
+    (root / 'b.png').write_bytes(b'non una png')
+    return root
+
+
+def config_for(tmp_path, root, **kwargs) -> BatchConfig:
+    return BatchConfig(mode='contours', input_root=str(root), output_dir=str(tmp_path / 'out'),
+                       min_area=100, **kwargs)
+
+
+def read_manifest(config: BatchConfig):
+    with open(os.path.join(config.output_dir, 'manifest.jsonl'), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def statuses(config: BatchConfig):
+    return {os.path.basename(e['image']): e['status'] for e in read_manifest(config)}
+
+
+def test_bad_file_mid_chunk_fails_alone(tmp_path, scans):
+    config = config_for(tmp_path, scans)
+    counts = run_batch(collect_images([str(scans)]), config, workers=1, chunk_size=4)
+
+    assert counts == {'done': 3, 'error': 1, 'skipped': 0}
+    assert statuses(config) == {'a.png': 'done', 'b.png': 'error', 'c.png': 'done', 'd.png': 'done'}
+    for entry in read_manifest(config):
+        if entry['status'] == 'done':
+            assert os.path.exists(entry['output'])
+
+
+def test_resume_skips_completed_and_retries_changed(tmp_path, scans):
+    config = config_for(tmp_path, scans)
+    images = collect_images([str(scans)])
+    run_batch(images, config, workers=1, chunk_size=2)
+
+    # Stesso lavoro: niente da fare (l'errore resta finché non si chiede --retry-failed)
+    assert run_batch(images, config, workers=1, chunk_size=2) == {'done': 0, 'error': 0, 'skipped': 4}
+    assert run_batch(images, config, workers=1, chunk_size=2, retry_failed=True) == \
+        {'done': 0, 'error': 1, 'skipped': 3}
+
+    # Il file corrotto viene sostituito e una mappa modificata: entrambe rielaborate
+    write_map(scans / 'b.png', seed=7)
+    write_map(scans / 'c.png', seed=8)
+    assert run_batch(images, config, workers=1, chunk_size=2) == {'done': 2, 'error': 0, 'skipped': 2}
+    assert set(statuses(config).values()) == {'done'}
+
+
+def test_manifest_is_done_checks_fingerprint_first(tmp_path):
+    image = tmp_path / 'map.png'
+    write_map(image)
+    manifest = Manifest(tmp_path / 'manifest.jsonl', signature='A')
+    assert not manifest.is_done(image)
+
+    entry = Manifest.fingerprint(image)
+    entry.update(status='error', error='ValueError: x')
+    manifest.record(entry)
+    assert manifest.is_done(image)
+    assert not manifest.is_done(image, retry_failed=True)
+
+    # File modificato: rielaborato anche se l'ultima volta era in errore
+    write_map(image, seed=1)
+    os.utime(image, ns=(entry['mtime_ns'] + 10**9, entry['mtime_ns'] + 10**9))
+    assert not manifest.is_done(image)
+
+    entry = Manifest.fingerprint(image)
+    entry['status'] = 'done'
+    manifest.record(entry)
+    manifest.close()
+
+    # Riletto da disco, con una riga troncata in coda come dopo un crash
+    with open(tmp_path / 'manifest.jsonl', 'a', encoding='utf-8') as f:
+        f.write('{"image": "tronc')
+    assert Manifest(tmp_path / 'manifest.jsonl', signature='A').is_done(image)
+    # Parametri diversi: rielaborato
+    assert not Manifest(tmp_path / 'manifest.jsonl', signature='B').is_done(image)
+
+
+def test_signature_ignores_paths_and_verbosity():
+    base = BatchConfig(input_root='a', output_dir='b', verbose=False)
+    assert base.signature() == BatchConfig(input_root='c', output_dir='d', verbose=True).signature()
+    assert base.signature() != BatchConfig(n_colors=12).signature()
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(),
+                    reason="il _convert sostituito arriva ai worker solo con fork")
+def test_crashed_worker_keeps_finished_images(tmp_path, scans, monkeypatch):
+    (scans / 'b.png').unlink()
+    write_map(scans / 'b.png', seed=3)
+    convert = batch_convert._convert
+
+    def crash_on_c(image_path, image, config):
+        if image_path.name == 'c.png':
+            os._exit(1)
+        return convert(image_path, image, config)
+
+    monkeypatch.setattr(batch_convert, '_convert', crash_on_c)
+    config = config_for(tmp_path, scans)
+    counts = run_batch(collect_images([str(scans)]), config, workers=1, chunk_size=4)
+
+    # a e b registrate prima del crash, c in errore, d elaborata sul nuovo pool
+    assert counts == {'done': 3, 'error': 1, 'skipped': 0}
+    result = statuses(config)
+    assert result == {'a.png': 'done', 'b.png': 'done', 'c.png': 'error', 'd.png': 'done'}
+    assert 'BrokenProcessPool' in next(e['error'] for e in read_manifest(config) if e['status'] == 'error')
+
+
+def test_cli(tmp_path, scans, monkeypatch, capsys):
+    output = tmp_path / 'cli_out'
+    monkeypatch.setattr(sys, 'argv', ['batch_convert.py', str(scans), '-o', str(output),
+                                      '--mode', 'contours', '--min-area', '100', '-j', '1'])
+    batch_convert.main()
+    assert '3 completate, 1 errori, 0 saltate' in capsys.readouterr().out
+    assert (output / 'a.geojson').exists()
+
+    batch_convert.main()
+    assert '0 completate, 0 errori, 4 saltate' in capsys.readouterr().out
@@ -0,0 +1,107 @@
+"""
+SegmentationCache: chiavi, riuso in segment_image, evizione LRU e pulizia dei .tmp orfani
+"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from extraction import SegmentationCache, segment_image
+from extraction.cache import STALE_TMP_SECONDS
+
+
+def flat_map(seed: int = 0) -> np.ndarray:
+    """Mappa a tinte piatte (4 colori a blocchi)"""
+    colors = np.random.default_rng(seed).integers(0, 256, size=(4, 3), dtype=np.uint8)
+    blocks = np.arange(4).reshape(2, 2).repeat(20, axis=0).repeat(30, axis=1)
+    return colors[blocks]
+
+
+def test_key_depends_on_pixels_and_params():
+    image = flat_map()
+    params = {'n_colors': 4, 'pyramid_levels': 0, 'seed': 42}
+    key = SegmentationCache.key(image, params)
+
+    assert SegmentationCache.key(image.copy(), dict(reversed(params.items()))) == key
+    assert SegmentationCache.key(image, {**params, 'n_colors': 5}) != key
+    assert SegmentationCache.key(image, {**params, 'pyramid_levels': 1}) != key
+
+    changed = image.copy()
+    changed[0, 0, 0] ^= 1
+    assert SegmentationCache.key(changed, params) != key
+    assert SegmentationCache.key(image.reshape(80, 30, 3), params) != key  # stessi byte, forma diversa
+
+
+def test_segment_image_reuses_entry_until_params_change(tmp_path):
+    cache = SegmentationCache(tmp_path)
+    image = flat_map()
+
+    first = segment_image(image, n_colors=4, cache=cache)
+    second = segment_image(image, n_colors=4, cache=cache)
+    assert not first.cached and second.cached
+    assert (cache.hits, cache.misses) == (1, 1)
+    np.testing.assert_array_equal(second.labels, first.labels)
+    np.testing.assert_array_equal(second.centers, first.centers)
+    assert second.method == first.method
+
+    assert not segment_image(image, n_colors=3, cache=cache).cached
+    assert not segment_image(flat_map(seed=1), n_colors=4, cache=cache).cached
+    assert len(list(tmp_path.glob('*.npz'))) == 3
+
+
+def set_mtime(path, seconds_ago: float):
+    when = time.time() - seconds_ago
+    os.utime(path, (when, when))
+
+
+def test_evicts_least_recently_read_entries(tmp_path):
+    cache = SegmentationCache(tmp_path)
+    payload = {'data': np.random.default_rng(0).integers(0, 256, size=4096, dtype=np.uint8)}
+    for i, key in enumerate(('a', 'b', 'c')):
+        cache.put(key, payload)
+        set_mtime(tmp_path / f'{key}.npz', 100 - i)  # a è la più vecchia
+    entry_size = (tmp_path / 'a.npz').stat().st_size
+
+    assert cache.get('a') is not None  # la lettura rende 'a' la più recente
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+    assert sorted(p.stem for p in tmp_path.glob('*.npz')) == ['a', 'c']
+
+    cache.put('d', payload)  # put applica il limite
+    assert sorted(p.stem for p in tmp_path.glob('*.npz')) == ['a', 'd']
+    assert sum(p.stat().st_size for p in tmp_path.glob('*.npz')) <= cache.max_bytes
+
+
+def test_sweeps_only_stale_tmp_files(tmp_path):
+    cache = SegmentationCache(tmp_path)
+    stale, fresh = tmp_path / 'crash.tmp', tmp_path / 'writing.tmp'
+    stale.write_bytes(b'x')
+    fresh.write_bytes(b'x')
+    set_mtime(stale, STALE_TMP_SECONDS + 60)
+    set_mtime(fresh, 5)  # scrittura in corso di un altro processo
+
+    cache.evict()
+    assert not stale.exists() and fresh.exists()
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = SegmentationCache(tmp_path)
+    (tmp_path / 'broken.npz').write_bytes(b'non un npz')
+    assert cache.get('broken') is None and cache.get('missing') is None
+    assert cache.misses == 2
+
+
+@pytest.mark.parametrize('levels', [0, 1])
+def test_cached_segmentation_equals_uncached(tmp_path, levels):
+    image = flat_map(seed=2)
+    cache = SegmentationCache(tmp_path)
+    segment_image(image, n_colors=4, pyramid_levels=levels, cache=cache)
+    cached = segment_image(image, n_colors=4, pyramid_levels=levels, cache=cache)
+    direct = segment_image(image, n_colors=4, pyramid_levels=levels)
+
+    assert cached.cached
+    np.testing.assert_array_equal(cached.components.component_map, direct.components.component_map)
+    np.testing.assert_array_equal(cached.components.areas, direct.components.areas)
+    np.testing.assert_array_equal(cached.labels, direct.labels)
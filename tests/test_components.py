@@ -0,0 +1,97 @@
+"""
+Componenti connesse (run + grafo sparso, anche a bande) contro cv2.connectedComponentsWithStats
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from extraction import ComponentBuilder, find_components, rasterize_contours
+
+
+def random_labels(height: int = 45, width: int = 60, n_labels: int = 3, seed: int = 0) -> np.ndarray:
+    """Label casuali pixel per pixel: molte componenti unite solo in diagonale"""
+    return np.random.default_rng(seed).integers(0, n_labels, size=(height, width)).astype(np.int32)
+
+
+def reference_components(labels: np.ndarray, connectivity: int):
+    """Mappa componenti + statistiche da cv2, una maschera per label"""
+    component_map = np.full(labels.shape, -1, dtype=np.int64)
+    areas, bboxes, centroids = [], [], []
+    for label in np.unique(labels):
+        n, cc, stats, cents = cv2.connectedComponentsWithStats(
+            (labels == label).astype(np.uint8), connectivity=connectivity)
+        for i in range(1, n):
+            component_map[cc == i] = len(areas)
+            areas.append(stats[i, cv2.CC_STAT_AREA])
+            bboxes.append(stats[i, :4])
+            centroids.append(cents[i])
+    return component_map, np.array(areas), np.array(bboxes), np.array(centroids)
+
+
+def assert_same_components(table, labels: np.ndarray, connectivity: int):
+    ref_map, ref_areas, ref_bboxes, ref_centroids = reference_components(labels, connectivity)
+    assert len(table) == len(ref_areas)
+
+    # Stessa partizione: corrispondenza biunivoca tra gli id delle due mappe
+    pairs = np.unique(np.column_stack([table.component_map.ravel(), ref_map.ravel()]), axis=0)
+    assert len(pairs) == len(table)
+    ours, theirs = pairs[:, 0], pairs[:, 1]
+
+    np.testing.assert_array_equal(table.areas[ours], ref_areas[theirs])
+    np.testing.assert_array_equal(table.bboxes[ours], ref_bboxes[theirs])
+    np.testing.assert_allclose(table.centroids[ours], ref_centroids[theirs])
+    for cid in ours[:50]:
+        assert labels[table.component_map == cid][0] == table.labels[cid]
+
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+def test_find_components_matches_cv2(connectivity):
+    labels = random_labels()
+    assert_same_components(find_components(labels, connectivity), labels, connectivity)
+
+
+@pytest.mark.parametrize('rows', [1, 2, 7, 44])
+def test_builder_strips_match_whole_image(rows):
+    """Componenti unite attraverso i bordi delle bande (riga di alone)"""
+    labels = random_labels(seed=rows)
+    whole = find_components(labels)
+
+    builder = ComponentBuilder(labels.shape[1])
+    for y0 in range(0, labels.shape[0], rows):
+        builder.add_rows(labels[y0:y0 + rows])
+    component_map = np.zeros(labels.shape, dtype=np.int32)
+    strips = builder.build(component_map=component_map, rows_per_chunk=3)
+
+    assert strips.component_map is component_map
+    np.testing.assert_array_equal(strips.component_map, whole.component_map)
+    np.testing.assert_array_equal(strips.areas, whole.areas)
+    np.testing.assert_array_equal(strips.bboxes, whole.bboxes)
+    assert_same_components(strips, labels, 8)
+
+
+def test_component_contour_matches_find_contours():
+    labels = np.zeros((40, 50), dtype=np.int32)
+    cv2.circle(labels, (20, 18), 12, 1, -1)
+    cv2.rectangle(labels, (36, 5), (46, 30), 2, -1)
+    table = find_components(labels)
+
+    for cid in table.select(min_area=50):
+        mask = (table.component_map == cid).astype(np.uint8)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        reference = max(contours, key=cv2.contourArea)
+        assert cv2.contourArea(table.contour(cid)) == cv2.contourArea(reference)
+
+
+def test_rasterize_contours_matches_draw_contours():
+    contours = [np.array([[[5, 5]], [[30, 5]], [[30, 25]], [[5, 25]]], dtype=np.int32),
+                np.array([[[20, 15]], [[45, 15]], [[32, 38]]], dtype=np.int32)]
+    raster = rasterize_contours(contours, (40, 50))
+
+    assert raster.dtype == np.uint16
+    reference = np.zeros((40, 50), dtype=np.int64)
+    for i, contour in enumerate(contours):
+        mask = np.zeros((40, 50), dtype=np.uint8)
+        cv2.drawContours(mask, [contour], 0, 1, cv2.FILLED)
+        reference[mask > 0] = i + 1  # l'ultimo disegnato vince
+    np.testing.assert_array_equal(raster, reference)
@@ -0,0 +1,93 @@
+"""
+Rimozione delle regioni sovrapposte (prefiltro bbox + ritaglio comune) contro il
+confronto originale a coppie su maschere dell'immagine intera
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from extraction import remove_overlaps
+
+
+def reference_remove_overlaps(candidates, height, width, max_regions=30, overlap_ratio=0.8):
+    """Algoritmo originale di KMeansExtractor.segment_by_color (maschere HxW per coppia)"""
+    final = []
+    for candidate in candidates[:max_regions]:
+        is_duplicate = False
+        cx1, cy1 = candidate['centroid']
+
+        for existing in final:
+            result = cv2.pointPolygonTest(existing['contour'], (float(cx1), float(cy1)), False)
+            if result >= 0:
+                is_duplicate = True
+                break
+
+            mask1 = np.zeros((height, width), dtype=np.uint8)
+            mask2 = np.zeros((height, width), dtype=np.uint8)
+            cv2.drawContours(mask1, [candidate['contour']], 0, 255, -1)
+            cv2.drawContours(mask2, [existing['contour']], 0, 255, -1)
+
+            overlap = np.logical_and(mask1, mask2).sum()
+            if overlap > overlap_ratio * min(candidate['area'], existing['area']):
+                is_duplicate = True
+                break
+
+        if not is_duplicate:
+            final.append(candidate)
+    return final
+
+
+def synthetic_candidates(n: int, height: int, width: int, seed: int):
+    """Ellissi, rettangoli ed L sovrapposti, ordinati per area come in segment_by_color"""
+    rng = np.random.default_rng(seed)
+    candidates = []
+    for i in range(n):
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cx, cy = int(rng.integers(10, width - 10)), int(rng.integers(10, height - 10))
+        a, b = int(rng.integers(5, 60)), int(rng.integers(5, 60))
+        kind = i % 3
+        if kind == 0:
+            cv2.ellipse(mask, (cx, cy), (a, b), float(rng.uniform(0, 180)), 0, 360, 255, -1)
+        elif kind == 1:
+            cv2.rectangle(mask, (cx - a, cy - b), (cx + a, cy + b), 255, -1)
+        else:  # forma concava: il centroide può cadere fuori
+            cv2.rectangle(mask, (cx - a, cy - b), (cx + a, cy - b + 8), 255, -1)
+            cv2.rectangle(mask, (cx - a, cy - b), (cx - a + 8, cy + b), 255, -1)
+
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contour = max(contours, key=cv2.contourArea)
+        area = cv2.contourArea(contour)
+        moments = cv2.moments(contour)
+        if moments['m00'] == 0:
+            continue
+        centroid = (int(moments['m10'] / moments['m00']), int(moments['m01'] / moments['m00']))
+        candidates.append({'id': i, 'contour': contour, 'area': area, 'centroid': centroid})
+
+    candidates.sort(key=lambda c: c['area'], reverse=True)
+    return candidates
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_remove_overlaps_matches_full_mask_version(seed):
+    height, width = 240, 320
+    candidates = synthetic_candidates(60, height, width, seed)
+
+    for max_regions in (10, 60):
+        result = remove_overlaps(candidates, max_regions=max_regions)
+        expected = reference_remove_overlaps(candidates, height, width, max_regions=max_regions)
+        assert [c['id'] for c in result] == [c['id'] for c in expected]
+
+
+def test_overlap_without_centroid_hit_is_removed():
+    """Una L coperta da un rettangolo: con un centroide fuori dal rettangolo decide
+    solo la sovrapposizione sul ritaglio comune (> 80% dell'area minore)"""
+    candidates = synthetic_candidates(0, 10, 10, 0)
+    big = np.array([[[10, 10]], [[110, 10]], [[110, 110]], [[10, 110]]], dtype=np.int32)
+    ell = np.array([[[12, 12]], [[108, 12]], [[108, 20]], [[20, 20]], [[20, 108]], [[12, 108]]], dtype=np.int32)
+    for i, contour in enumerate((big, ell)):
+        candidates.append({'id': i, 'contour': contour, 'area': cv2.contourArea(contour),
+                           'centroid': (200, 200) if i else (60, 60)})
+
+    assert [c['id'] for c in remove_overlaps(candidates)] == [0]
+    assert [c['id'] for c in reference_remove_overlaps(candidates, 240, 320)] == [0]
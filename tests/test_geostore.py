@@ -0,0 +1,113 @@
+"""
+Store binari dei layer di riferimento: stessi dati di GeoPandas, un file per sorgente
+"""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import MultiPolygon, Polygon
+
+from extraction import GeoStore, compile_geostore, read_reference
+from extraction.geostore import store_path_for
+from shape_index import ShapeIndex, index_path_for
+
+
+def layer(names, offset: float = 0.0) -> gpd.GeoDataFrame:
+    geometries = [Polygon([(i + offset, 0), (i + offset + 1, 0), (i + offset, 1)]) for i in range(len(names))]
+    geometries[-1] = MultiPolygon([geometries[-1], Polygon([(9, 9), (10, 9), (10, 10), (9, 10)])])
+    return gpd.GeoDataFrame({'name': names, 'pop': np.arange(len(names))}, geometry=geometries, crs='EPSG:4326')
+
+
+def test_store_roundtrip(tmp_path):
+    path = tmp_path / 'regions.geojson'
+    layer(['a', 'b', 'c']).to_file(path)
+
+    first = read_reference(path)
+    assert store_path_for(path).is_dir()
+    second = read_reference(path)  # dallo store
+
+    assert list(second['name']) == list(first['name'])
+    np.testing.assert_array_equal(second['pop'], first['pop'])
+    assert all(a.equals(b) for a, b in zip(second.geometry, first.geometry))
+
+
+def test_same_stem_sources_do_not_share_store(tmp_path):
+    """x.shp e x.geojson nella stessa cartella: store e indici separati"""
+    shp, geojson = tmp_path / 'regions.shp', tmp_path / 'regions.geojson'
+    layer(['shp1', 'shp2']).to_file(shp)
+    layer(['json1', 'json2', 'json3'], offset=0.5).to_file(geojson)
+
+    assert store_path_for(shp) != store_path_for(geojson)
+    assert index_path_for(shp) != index_path_for(geojson)
+
+    for _ in range(2):  # compilazione, poi lettura dagli store
+        assert list(read_reference(shp)['name']) == ['shp1', 'shp2']
+        assert list(read_reference(geojson)['name']) == ['json1', 'json2', 'json3']
+
+    # L'indice di una sorgente non invalida quello dell'altra
+    gdf_shp, gdf_json = read_reference(shp), read_reference(geojson)
+    ShapeIndex.load_or_build(gdf_shp, shp)
+    ShapeIndex.load_or_build(gdf_json, geojson)
+    mtime = index_path_for(shp).stat().st_mtime_ns
+    ShapeIndex.load_or_build(gdf_shp, shp)
+    assert index_path_for(shp).stat().st_mtime_ns == mtime
+
+
+def mixed_layer() -> gpd.GeoDataFrame:
+    """Un attributo per ogni tipo di colonna, quasi tutti con valori mancanti"""
+    gdf = layer(['a', 'b', 'c', 'd'])
+    gdf['name'] = pd.Series(['Lazio', None, 'Molise', 'Umbria'], dtype=object)
+    gdf['label'] = pd.array(['x', None, 'z', 'w'], dtype='string')
+    gdf['area'] = [1.5, np.nan, 3.0, 4.25]
+    gdf['code'] = np.array([1, 2, 3, 250], dtype=np.uint8)
+    gdf['capital'] = [True, False, True, False]
+    gdf['count'] = pd.array([10, None, 30, 40], dtype='Int64')
+    gdf['ratio'] = pd.array([0.5, 0.25, None, 1.0], dtype='Float64')
+    gdf['coastal'] = pd.array([True, None, False, True], dtype='boolean')
+    gdf['island'] = pd.Series([True, None, False, False], dtype=object)  # come da GeoJSON con null
+    gdf['founded'] = pd.to_datetime(['1970-01-01 00:00:00', None, '2001-09-09 01:46:40', '1861-03-17 12:00:00'])
+    gdf['updated'] = pd.to_datetime(['2024-03-31 03:30', '2024-10-27 02:30', None, '2024-01-01 00:00']
+                                    ).tz_localize('Europe/Rome', ambiguous=[True, False, True, True])
+    gdf['zone'] = pd.Categorical(['nord', None, 'sud', 'centro'], categories=['nord', 'centro', 'sud'])
+    gdf['rank'] = pd.Categorical([3, 1, 2, 1], categories=[1, 2, 3], ordered=True)
+    gdf['mixed'] = pd.Series([1, 'due', 3.5, None], dtype=object)  # oggetti eterogenei: stringhe
+    return gdf
+
+
+def test_store_keeps_attribute_dtypes(tmp_path):
+    gdf = mixed_layer()
+    path = tmp_path / 'regions.gpkg'
+    path.touch()
+    store = GeoStore(compile_geostore(path, gdf=gdf))
+
+    # Nessun array object: tutto mappabile con mmap
+    for npy in store.path.glob('*.npy'):
+        assert np.load(str(npy), mmap_mode='r').dtype != object, npy.name
+
+    restored = store.to_geodataframe()
+    expected = gdf.drop(columns='mixed')
+    pd.testing.assert_frame_equal(pd.DataFrame(restored.drop(columns=['geometry', 'mixed'])),
+                                  pd.DataFrame(expected.drop(columns='geometry')))
+    assert list(restored['mixed']) == ['1', 'due', '3.5', None]
+    assert restored['island'].tolist() == [True, None, False, False]
+    assert all(isinstance(v, bool) for v in restored['island'].dropna())
+
+
+def test_store_with_nullable_columns_is_not_recompiled(tmp_path, monkeypatch):
+    path = tmp_path / 'regions.geojson'
+    gdf = layer(['a', 'b', 'c'])
+    gdf['count'] = pd.array([1, None, 3], dtype='Int64')
+    gdf['flag'] = pd.Series([True, None, False], dtype=object)
+    gdf.to_file(path)
+
+    first = read_reference(path)
+    meta_mtime = (store_path_for(path) / 'meta.json').stat().st_mtime_ns
+
+    def no_read(*args, **kwargs):
+        raise AssertionError("lo store andava riaperto, non ricompilato")
+
+    monkeypatch.setattr(gpd, 'read_file', no_read)
+    second = read_reference(path)
+    assert (store_path_for(path) / 'meta.json').stat().st_mtime_ns == meta_mtime
+    pd.testing.assert_frame_equal(pd.DataFrame(second.drop(columns='geometry')),
+                                  pd.DataFrame(first.drop(columns='geometry')))
@@ -0,0 +1,90 @@
+"""
+ImagePyramid / TileCache: viste composte da tile contro il ricampionamento dell'immagine intera,
+limite in byte e ordine LRU della cache
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from extraction import ImagePyramid, TileCache
+
+
+@pytest.fixture(scope='module')
+def image():
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, size=(45, 60, 3), dtype=np.uint8)
+    return cv2.resize(small, (600, 450), interpolation=cv2.INTER_CUBIC)  # dettagli a più scale
+
+
+def test_pyramid_levels_and_level_choice(image):
+    pyramid = ImagePyramid(image, min_size=64)
+    shapes = [level.shape[:2] for level in pyramid.levels]
+    assert shapes == [(450, 600), (225, 300), (113, 150), (57, 75), (29, 38)]
+    assert pyramid.level_for(1.0) == 0
+    assert pyramid.level_for(0.5) == 1
+    assert pyramid.level_for(0.3) == 1       # il livello 1/4 ridurrebbe sotto la scala
+    assert pyramid.level_for(0.1) == 3
+    assert pyramid.level_for(0.01) == 4
+
+
+def test_identity_view_is_the_image(image):
+    cache = TileCache(ImagePyramid(image), tile_size=64)
+    np.testing.assert_array_equal(cache.render(1.0, 0, 0, 600, 450), image)
+    np.testing.assert_array_equal(cache.render(1.0, 130, 70, 333, 301), image[70:301, 130:333])
+
+
+@pytest.mark.parametrize('scale', [0.37, 0.5, 0.8, 1.6, 3.0])
+def test_tiled_render_matches_single_tile_render(image, scale):
+    pyramid = ImagePyramid(image, min_size=64)
+    view_w, view_h = pyramid.view_size(scale)
+    whole = TileCache(pyramid, tile_size=10 ** 6).render(scale, 0, 0, view_w, view_h)
+    tiled = TileCache(pyramid, tile_size=64).render(scale, 0, 0, view_w, view_h)
+
+    assert whole.shape == tiled.shape == (view_h, view_w, 3)
+    # Stessa trasformazione, solo l'origine del ritaglio cambia: al più l'arrotondamento di cv2
+    assert np.abs(whole.astype(int) - tiled.astype(int)).max() <= 1
+
+    # E una vista parziale è la porzione corrispondente della vista intera
+    x0, y0 = view_w // 3, view_h // 4
+    part = TileCache(pyramid, tile_size=64).render(scale, x0, y0, x0 + 100, y0 + 80)
+    np.testing.assert_array_equal(part, tiled[y0:y0 + 80, x0:x0 + 100])
+
+
+def test_render_matches_resize_of_the_level(image):
+    pyramid = ImagePyramid(image, min_size=64)
+    level = pyramid.levels[1]
+    view = TileCache(pyramid, tile_size=64).render(0.4, 0, 0, *pyramid.view_size(0.4))
+    expected = cv2.resize(level, pyramid.view_size(0.4), interpolation=cv2.INTER_LINEAR)
+    assert np.abs(view.astype(int) - expected.astype(int)).max() <= 2
+
+
+def test_byte_cap_and_lru_order(image):
+    pyramid = ImagePyramid(image)
+    tile_bytes = 32 * 32 * 3
+    cache = TileCache(pyramid, tile_size=32, max_bytes=4 * tile_bytes)
+
+    for tx in range(4):
+        cache.tile(1.0, tx, 0)
+    assert cache.nbytes == 4 * tile_bytes and cache.misses == 4
+
+    cache.tile(1.0, 0, 0)   # (0, 0) diventa il più recente
+    cache.tile(1.0, 4, 0)   # supera il limite: esce (1, 0), il meno recente
+    assert cache.hits == 1
+    assert list(cache._tiles) == [(1.0, 2, 0), (1.0, 3, 0), (1.0, 0, 0), (1.0, 4, 0)]
+    assert cache.nbytes == sum(t.nbytes for t in cache._tiles.values()) <= cache.max_bytes
+
+    cache.render(1.0, 0, 0, 600, 450)  # molti più tile del limite
+    assert cache.nbytes == sum(t.nbytes for t in cache._tiles.values()) <= cache.max_bytes
+    assert (1.0, 18, 14) in cache._tiles  # l'ultimo tile composto resta in cache
+
+    cache.clear()
+    assert cache.nbytes == 0 and not cache._tiles
+
+
+def test_oversized_tile_is_kept_alone(image):
+    cache = TileCache(ImagePyramid(image), tile_size=64, max_bytes=100)
+    tile = cache.tile(1.0, 0, 0)
+    assert len(cache._tiles) == 1 and cache.nbytes == tile.nbytes
+    cache.tile(1.0, 1, 0)
+    assert list(cache._tiles) == [(1.0, 1, 0)]
@@ -0,0 +1,59 @@
+"""
+Palette esatta per mappe a colori piatti contro i colori noti della mappa sintetica
+"""
+
+import numpy as np
+
+from extraction import exact_palette, quantize_image
+
+
+PALETTE = np.array([[200, 30, 30], [30, 160, 60], [40, 60, 210], [230, 220, 90], [250, 250, 250]],
+                   dtype=np.uint8)
+
+
+def flat_map(height: int = 120, width: int = 160, seed: int = 0):
+    """Mappa a colori piatti (blocchi di palette) con bordi di anti-aliasing"""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, len(PALETTE), size=(height // 20, width // 20))
+    truth = np.kron(blocks, np.ones((20, 20), dtype=np.int64))
+    image = PALETTE[truth].copy()
+
+    # Bordi verticali: miscela 50/50 dei due colori adiacenti
+    edges = np.flatnonzero(truth[0, 1:] != truth[0, :-1])
+    for x in edges:
+        image[:, x] = ((PALETTE[truth[:, x]].astype(int) + PALETTE[truth[:, x + 1]]) // 2).astype(np.uint8)
+    return image, truth
+
+
+def nearest_reference(pixels: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    distances = ((pixels[:, None, :].astype(np.float64) - centers[None].astype(np.float64)) ** 2).sum(axis=2)
+    return distances.argmin(axis=1)
+
+
+def test_exact_palette_recovers_flat_colors():
+    image, truth = flat_map()
+    result = exact_palette(image, max_colors=10)
+    assert result is not None
+    labels, centers = result
+
+    # Centri = colori di palette usati; ogni pixel pieno etichettato con il suo colore
+    assert len(centers) == len(np.unique(truth))
+    colors = centers[labels].astype(np.uint8)
+    solid = (image == PALETTE[truth]).all(axis=2)
+    assert (~solid).any()
+    np.testing.assert_array_equal(colors[solid], image[solid])
+
+    # I pixel di bordo vanno al colore di palette più vicino
+    np.testing.assert_array_equal(labels[~solid], nearest_reference(image[~solid], centers))
+
+
+def test_quantize_image_falls_back_to_kmeans_on_noisy_images():
+    image, _ = flat_map()
+    assert quantize_image(image, 10)[2] == 'palette'
+
+    noise = np.random.default_rng(3).normal(0, 12, size=image.shape)
+    noisy = np.clip(image + noise, 0, 255).astype(np.uint8)
+    assert exact_palette(noisy, 10) is None
+    labels, centers, method = quantize_image(noisy, 5, sample_size=5000)
+    assert method == 'kmeans'
+    assert labels.shape == image.shape[:2] and len(centers) == 5
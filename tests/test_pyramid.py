@@ -0,0 +1,70 @@
+"""
+Segmentazione coarse-to-fine contro la quantizzazione a piena risoluzione
+"""
+
+import cv2
+import numpy as np
+
+from extraction import label_boundaries, quantize_image, quantize_pyramid
+from extraction.quantization import assign_nearest
+
+
+COLORS = np.array([[200, 30, 30], [30, 160, 60], [40, 60, 210], [230, 220, 90], [120, 40, 160]],
+                  dtype=np.uint8)
+
+
+def voronoi_map(height: int = 180, width: int = 240, n_cells: int = 18, seed: int = 0):
+    """Celle di Voronoi a colori piatti (confini obliqui, non allineati ai pixel ridotti)"""
+    rng = np.random.default_rng(seed)
+    seeds = rng.uniform(0, [width, height], size=(n_cells, 2))
+    ys, xs = np.mgrid[0:height, 0:width]
+    cell = np.argmin((xs[..., None] - seeds[:, 0]) ** 2 + (ys[..., None] - seeds[:, 1]) ** 2, axis=2)
+    return COLORS[cell % len(COLORS)]
+
+
+def refine_band(labels_small: np.ndarray, factor: int, shape, band: int = 1) -> np.ndarray:
+    """Fascia riassegnata da quantize_pyramid (ricalcolata dalla label map ridotta)"""
+    boundary = cv2.dilate(label_boundaries(labels_small).astype(np.uint8), np.ones((3, 3), np.uint8),
+                          iterations=band)
+    big = np.repeat(np.repeat(boundary, factor, axis=0), factor, axis=1)
+    return big[:shape[0], :shape[1]].astype(bool)
+
+
+def test_levels_zero_is_quantize_image():
+    image = voronoi_map()
+    labels, centers, method = quantize_pyramid(image, 8, levels=0)
+    expected = quantize_image(image, 8)
+    np.testing.assert_array_equal(labels, expected[0])
+    np.testing.assert_array_equal(centers, expected[1])
+    assert method == expected[2]
+
+
+def test_flat_map_matches_full_resolution_exactly():
+    """Palette esatta: dopo la rifinitura dei confini ogni pixel ha il colore giusto"""
+    image = voronoi_map()
+    for levels in (1, 2, 3):
+        labels, centers, method = quantize_pyramid(image, 8, levels=levels)
+        full_labels, full_centers, _ = quantize_image(image, 8)
+
+        assert method == 'palette'
+        np.testing.assert_array_equal(centers[labels].astype(np.uint8), image)
+        np.testing.assert_array_equal(centers[labels], full_centers[full_labels])
+
+
+def test_noisy_map_agrees_away_from_boundaries_and_exactly_in_band():
+    image = voronoi_map(seed=1)
+    noise = np.random.default_rng(2).normal(0, 8, size=image.shape)
+    noisy = np.clip(image + noise, 0, 255).astype(np.uint8)
+    factor = 4
+
+    labels, centers, method = quantize_pyramid(noisy, 5, levels=2, sample_size=4000)
+    assert method == 'kmeans'
+
+    # Riferimento in memoria con gli stessi centri
+    reference = assign_nearest(noisy.reshape((-1, 3)), centers).reshape(noisy.shape[:2])
+    small_labels = labels[::factor, ::factor]
+    band = refine_band(small_labels, factor, noisy.shape)
+
+    np.testing.assert_array_equal(labels[band], reference[band])
+    assert band.any() and (~band).any()
+    assert np.mean(labels[~band] == reference[~band]) > 0.99
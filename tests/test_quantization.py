@@ -0,0 +1,46 @@
+"""
+Quantizzazione colori (campione + assegnazione) contro l'argmin esaustivo delle distanze
+"""
+
+import numpy as np
+
+from extraction import ColorQuantizer, quantize_colors
+from extraction.quantization import assign_nearest
+
+
+def nearest_reference(pixels: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    distances = ((pixels[:, None, :].astype(np.float64) - centers[None].astype(np.float64)) ** 2).sum(axis=2)
+    return distances.argmin(axis=1)
+
+
+def test_assign_nearest_matches_exhaustive_argmin():
+    rng = np.random.default_rng(1)
+    pixels = rng.integers(0, 256, size=(5000, 3)).astype(np.uint8)
+    centers = rng.uniform(0, 255, size=(12, 3)).astype(np.float32)
+
+    labels = assign_nearest(pixels, centers, chunk_size=777)
+    reference = nearest_reference(pixels, centers)
+
+    # A parità (quasi) di distanza float32 può vincere l'altro centro: stessa distanza
+    chosen = ((pixels - centers[labels]) ** 2).sum(axis=1)
+    best = ((pixels - centers[reference]) ** 2).sum(axis=1)
+    np.testing.assert_allclose(chosen, best, rtol=1e-4)
+
+
+def test_color_quantizer_predict_is_nearest_center():
+    rng = np.random.default_rng(2)
+    image = rng.integers(0, 256, size=(80, 90, 3)).astype(np.uint8)
+    labels, centers = ColorQuantizer(6, sample_size=2000).fit_predict(image)
+
+    assert labels.shape == image.shape[:2]
+    assert centers.shape == (6, 3)
+    reference = nearest_reference(image.reshape((-1, 3)), centers)
+    assert np.mean(labels.ravel() == reference) > 0.999
+
+
+def test_quantize_colors_is_reproducible():
+    image = np.random.default_rng(3).integers(0, 256, size=(60, 70, 3)).astype(np.uint8)
+    first = quantize_colors(image, 5, sample_size=1500)
+    second = quantize_colors(image, 5, sample_size=1500)
+    np.testing.assert_array_equal(first[0], second[0])
+    np.testing.assert_array_equal(first[1], second[1])
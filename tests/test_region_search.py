@@ -0,0 +1,79 @@
+"""
+RegionSearchIndex contro la scansione lineare delle etichette normalizzate (fold)
+"""
+
+import re
+
+import numpy as np
+import pytest
+
+from region_search import RegionSearchIndex, fold
+
+
+LABELS = sorted([
+    "Abruzzo", "Aosta", "Basilicata", "Bolzano - Bozen", "Calabria", "Campania", "Emilia-Romagna",
+    "Friuli-Venezia Giulia", "Lazio", "Liguria", "Lombardia", "Marche", "Molise", "Piemonte",
+    "Puglia", "Reggio di Calabria", "Reggio nell'Emilia", "Roma", "Sardegna", "Sicilia",
+    "Toscana", "Trentino-Alto Adige", "Umbria", "Valle d'Aosta", "Vallée d'Aoste", "Veneto",
+    "Île-de-France", "Provence-Alpes-Côte d'Azur", "Baden-Württemberg", "São Paulo",
+    "ÅLAND", "Ciudad Autónoma de Buenos Aires", "Rome (Italy)", "Romagna", "Città di Roma",
+])
+
+
+def linear_search(labels, query: str, limit: int = 100):
+    """Scansione di tutte le etichette: prefisso, poi inizio di parola, poi sottostringa;
+    a parità di livello l'ordine in ingresso"""
+    q = fold(query).strip()
+    if not q:
+        return list(labels)
+    at_word_start = re.compile(r'(?<!\w)' + re.escape(q)) if re.match(r'\w', q) else None
+
+    ranked = []
+    for i, label in enumerate(labels):
+        text = fold(label)
+        if text.startswith(q):
+            ranked.append((0, i))
+        elif at_word_start is not None and at_word_start.search(text):
+            ranked.append((1, i))
+        elif q in text:
+            ranked.append((2, i))
+    return [labels[i] for _, i in sorted(ranked)[:limit]]
+
+
+def random_labels(n: int, seed: int = 0):
+    """Etichette sintetiche da sillabe, con accenti, trattini e parole ripetute"""
+    rng = np.random.default_rng(seed)
+    syllables = ['ro', 'ma', 'gna', 'em', 'i', 'lia', 'vé', 'ne', 'to', 'sa', 'ò', 'de', 'l\'a']
+    separators = [' ', '-', ' di ', '']
+    labels = set()
+    while len(labels) < n:
+        words = [''.join(rng.choice(syllables, rng.integers(1, 4))) for _ in range(rng.integers(1, 4))]
+        label = words[0]
+        for word in words[1:]:
+            label += rng.choice(separators) + word
+        labels.add(label.capitalize() if rng.random() < 0.5 else label.upper())
+    return sorted(labels)
+
+
+@pytest.mark.parametrize('query', ['', ' ', 'r', 'ro', 'rom', 'roma', 'ROMA', 'róma', 'emilia',
+                                   'reggio e', "d'ao", 'aoste', 'vallee', 'alto adige', '-', 'a',
+                                   'land', 'cote', 'xyz', 'württ'])
+def test_search_matches_linear_scan(query):
+    index = RegionSearchIndex(LABELS)
+    assert index.search(query) == linear_search(LABELS, query)
+    assert index.search(query, limit=3) == linear_search(LABELS, query, limit=3)
+
+
+def test_incremental_typing_matches_linear_scan():
+    """Sequenza di tasti (aggiunte e cancellazioni) su molte etichette: il riuso dei
+    risultati della query precedente non deve cambiare il risultato"""
+    labels = random_labels(3000)
+    index = RegionSearchIndex(labels)
+    rng = np.random.default_rng(1)
+
+    for target in rng.choice(labels, 15):
+        word = fold(target)[int(rng.integers(0, 3)):]
+        typed = [word[:n] for n in range(1, min(len(word), 9) + 1)]
+        typed += [typed[-1][:-1], typed[-1][:-2] + 'x', typed[-1]]
+        for query in typed:
+            assert index.search(query, limit=50) == linear_search(labels, query, limit=50), query
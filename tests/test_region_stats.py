@@ -0,0 +1,58 @@
+"""
+Statistiche colore per regione (bincount) contro cv2.mean / np.var su maschere
+"""
+
+import cv2
+import numpy as np
+
+from extraction import filled_contour_stats, find_components, region_stats
+
+
+def map_with_holes(seed: int = 0):
+    """Label map con due regioni che racchiudono buchi di altri colori + immagine rumorosa"""
+    labels = np.zeros((90, 120), dtype=np.int32)
+    cv2.rectangle(labels, (10, 10), (70, 70), 1, -1)
+    cv2.circle(labels, (30, 30), 8, 2, -1)     # buco nella regione 1
+    cv2.rectangle(labels, (45, 45), (60, 58), 3, -1)
+    cv2.circle(labels, (95, 50), 18, 2, -1)
+    cv2.circle(labels, (95, 50), 6, 0, -1)     # buco nel disco
+
+    colors = np.array([[240, 240, 240], [200, 40, 40], [40, 180, 60], [30, 50, 200]], dtype=np.float64)
+    noise = np.random.default_rng(seed).normal(0, 10, size=labels.shape + (3,))
+    image = np.clip(colors[labels] + noise, 0, 255).astype(np.uint8)
+    return labels, image
+
+
+def test_region_stats_matches_masked_reductions():
+    labels, image = map_with_holes()
+    table = find_components(labels)
+    stats = region_stats(table.component_map, image, len(table))
+
+    for cid in range(len(table)):
+        pixels = image[table.component_map == cid].astype(np.float64)
+        assert stats.counts[cid] == len(pixels)
+        np.testing.assert_allclose(stats.means[cid], pixels.mean(axis=0))
+        np.testing.assert_allclose(stats.variances[cid], pixels.var(axis=0), atol=1e-6)
+
+
+def test_filled_contour_stats_matches_cv2_mean():
+    labels, image = map_with_holes()
+    table = find_components(labels)
+    stats = region_stats(table.component_map, image, len(table))
+
+    with_holes = 0
+    for cid in table.select(min_area=100):
+        contour = table.contour(cid)
+        count, mean, variance = filled_contour_stats(stats, table.component_map, image, cid,
+                                                     contour, table.bboxes[cid])
+
+        mask = np.zeros(labels.shape, dtype=np.uint8)
+        cv2.drawContours(mask, [contour], 0, 255, -1)
+        pixels = image[mask > 0].astype(np.float64)
+        with_holes += count > stats.counts[cid]
+
+        assert count == np.count_nonzero(mask)
+        np.testing.assert_allclose(mean, cv2.mean(image, mask=mask)[:3])
+        np.testing.assert_allclose(variance, pixels.var(axis=0), atol=1e-6)
+
+    assert with_holes >= 2
@@ -0,0 +1,160 @@
+"""
+Descrittori dell'indice delle forme contro scipy / cv2, e invalidazione dell'indice su disco
+"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+import geopandas as gpd
+import pytest
+from scipy.spatial.distance import directed_hausdorff
+from shapely import affinity
+from shapely.geometry import Polygon, mapping
+
+import shape_index
+from shape_index import (INDEX_VERSION, ShapeIndex, batch_hausdorff, contour_hu_moments,
+                         fourier_descriptor, index_path_for, match_shapes_matrix, raster_iou, shape_mask)
+
+
+def random_contours(n: int, n_points: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).uniform(-1, 1, size=(n, n_points, 2))
+
+
+def random_polygon(rng, n_vertices: int = 9) -> np.ndarray:
+    """Poligono stellato (vertici ordinati per angolo, raggi casuali) in pixel"""
+    angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+    radii = rng.uniform(20, 60, n_vertices)
+    center = rng.uniform(80, 120, 2)
+    points = center + np.column_stack([np.cos(angles), np.sin(angles)]) * radii[:, None]
+    return np.round(points).astype(np.int32).reshape((-1, 1, 2))
+
+
+def test_batch_hausdorff_matches_scipy():
+    query = random_contours(1, 50, seed=1)[0]
+    references = random_contours(300, 50, seed=2)  # più di un blocco (HAUSDORFF_CHUNK)
+
+    result = batch_hausdorff(query, references, chunk_size=128)
+    expected = [max(directed_hausdorff(query, ref)[0], directed_hausdorff(ref, query)[0])
+                for ref in references]
+    np.testing.assert_allclose(result, expected, rtol=1e-12)
+
+
+def test_match_shapes_matrix_matches_cv2():
+    rng = np.random.default_rng(3)
+    contours = [random_polygon(rng) for _ in range(8)]
+    hu = np.array([contour_hu_moments(c) for c in contours])
+
+    distances = match_shapes_matrix(hu[:5], hu[3:])
+    assert distances.shape == (3, 5, 5)
+    for method in range(3):
+        for i, a in enumerate(contours[:5]):
+            for j, b in enumerate(contours[3:]):
+                expected = cv2.matchShapes(a, b, method + 1, 0)
+                assert distances[method, i, j] == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+
+def test_raster_iou_matches_unpacked_masks():
+    rng = np.random.default_rng(4)
+    polygons = [Polygon(random_polygon(rng).reshape((-1, 2))) for _ in range(6)]
+    masks = np.array([shape_mask(p) for p in polygons])
+    dense = np.unpackbits(masks, axis=1).astype(bool)
+
+    result = raster_iou(masks[0], masks)
+    expected = (dense & dense[0]).sum(axis=1) / (dense | dense[0]).sum(axis=1)
+    np.testing.assert_allclose(result, expected)
+    assert result[0] == 1.0
+
+
+def test_fourier_descriptor_is_similarity_and_reflection_invariant():
+    rng = np.random.default_rng(6)
+    poly = Polygon(random_polygon(rng, n_vertices=12).reshape((-1, 2)))
+    descriptor = fourier_descriptor(poly)
+    assert descriptor[0] == pytest.approx(1.0)
+
+    moved = affinity.translate(affinity.scale(affinity.rotate(poly, 37), 2.5, 2.5), 400, -90)
+    mirrored = affinity.scale(poly, 1, -1)
+    coords = np.array(poly.exterior.coords[:-1])
+    reversed_from_5 = Polygon(np.roll(coords[::-1], 5, axis=0))
+    for other in (moved, mirrored, reversed_from_5):
+        np.testing.assert_allclose(fourier_descriptor(other), descriptor, atol=0.02)
+
+    different = Polygon(random_polygon(rng, n_vertices=12).reshape((-1, 2)))
+    assert np.abs(fourier_descriptor(different) - descriptor).sum() > 0.1
+
+
+# ---------------------------------------------------------------------------
+# Indice su disco
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def dataset(tmp_path):
+    rng = np.random.default_rng(5)
+    features = [{'type': 'Feature', 'properties': {'name': f'r{i}'},
+                 'geometry': mapping(Polygon(random_polygon(rng).reshape((-1, 2)) / 100))}
+                for i in range(5)]
+    path = tmp_path / 'regions.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    return path, gpd.read_file(path)
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Conta le ricostruzioni dell'indice"""
+    calls = []
+    original = ShapeIndex.build.__func__
+
+    def counting_build(cls, gdf):
+        calls.append(len(gdf))
+        return original(cls, gdf)
+
+    monkeypatch.setattr(ShapeIndex, 'build', classmethod(counting_build))
+    return calls
+
+
+def test_index_is_reused_when_source_is_unchanged(dataset, builds):
+    path, gdf = dataset
+    first = ShapeIndex.load_or_build(gdf, path)
+    assert index_path_for(path).exists() and len(builds) == 1
+
+    second = ShapeIndex.load_or_build(gdf, path)
+    assert len(builds) == 1
+    np.testing.assert_array_equal(second.signatures, first.signatures)
+    np.testing.assert_array_equal(second.masks, first.masks)
+    np.testing.assert_array_equal(second.fourier, first.fourier)
+
+
+def test_index_is_rebuilt_when_version_changes(dataset, builds, monkeypatch):
+    path, gdf = dataset
+    ShapeIndex.load_or_build(gdf, path)
+
+    monkeypatch.setattr(shape_index, 'INDEX_VERSION', INDEX_VERSION + 1)
+    ShapeIndex.load_or_build(gdf, path)
+    ShapeIndex.load_or_build(gdf, path)
+    assert len(builds) == 2
+
+
+def test_index_is_rebuilt_when_source_changes(dataset, builds):
+    path, gdf = dataset
+    ShapeIndex.load_or_build(gdf, path)
+
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    ShapeIndex.load_or_build(gdf, path)
+    assert len(builds) == 2
+
+    ShapeIndex.load_or_build(gdf.iloc[:3], path)  # numero di feature diverso
+    assert len(builds) == 3
+
+
+def test_descriptor_distance_ranks_own_shape_first(dataset):
+    _, gdf = dataset
+    index = ShapeIndex.build(gdf)
+    for i, geometry in enumerate(gdf.geometry.values):
+        # Stessa forma ruotata, scalata e ribaltata come un'estrazione dall'immagine
+        query = affinity.scale(affinity.rotate(geometry, 20), 3, -3)
+        distances = shape_index.descriptor_distance(
+            shape_index.shape_invariants(query), shape_index.hu_moments(query), fourier_descriptor(query),
+            index.invariants, index.hu, index.fourier)
+        assert int(np.argmin(distances)) == i
@@ -0,0 +1,111 @@
+"""
+ShapeMatcher - una regione estratta dall'immagine (asse y verso il basso) deve
+coincidere con la propria geometria di riferimento (lon/lat)
+"""
+
+import json
+
+import cv2
+import numpy as np
+import pytest
+from shapely.geometry import Polygon, mapping
+
+from shape_index import batch_hausdorff, raster_iou, shape_mask, shape_signature
+import shape_matcher
+from shape_matcher import ShapeMatcher
+
+
+# Forme asimmetriche rispetto all'asse orizzontale: ribaltate non coincidono
+REFERENCES = {
+    'Elle': [(10, 40), (11, 40), (11, 41.5), (13, 41.5), (13, 42), (10, 42)],
+    'Triangolo': [(12, 44), (15, 44), (12.5, 46)],
+    'Trapezio': [(8, 38), (12, 38), (11, 39), (9.5, 39)],
+    'Freccia': [(14, 36), (16, 37), (14, 38), (14.8, 37)],
+}
+
+
+def to_image(poly: Polygon) -> Polygon:
+    """Coordinate immagine 0-1 come extract_features_from_image (y verso il basso)"""
+    minx, miny, maxx, maxy = poly.bounds
+    span = max(maxx - minx, maxy - miny)
+    return Polygon([((x - minx) / span, (maxy - y) / span) for x, y in poly.exterior.coords[:-1]])
+
+
+@pytest.fixture(scope='module')
+def matcher(tmp_path_factory):
+    path = tmp_path_factory.mktemp('db') / 'references.geojson'
+    features = [{'type': 'Feature', 'properties': {'name': name, 'admin': 'Test'},
+                 'geometry': mapping(Polygon(coords))} for name, coords in REFERENCES.items()]
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    return ShapeMatcher(database_path=str(path), use_gadm_italy=False, use_cache=False)
+
+
+@pytest.mark.parametrize('name', sorted(REFERENCES))
+def test_region_matches_own_reference(matcher, name):
+    reference = Polygon(REFERENCES[name])
+    extracted = to_image(reference)
+
+    hausdorff = batch_hausdorff(shape_signature(extracted, flip_y=True), shape_signature(reference)[None])[0]
+    iou = raster_iou(shape_mask(extracted, flip_y=True), shape_mask(reference)[None])[0]
+    assert hausdorff == pytest.approx(0, abs=1e-9)
+    assert iou == pytest.approx(1)
+
+    assert matcher.shape_similarity(extracted, reference) == pytest.approx(1)
+    matches = matcher.find_best_match({'geometry': extracted}, top_k=1)
+    assert matches[0]['name'] == name
+    assert matches[0]['score'] == pytest.approx(1)
+
+
+def test_index_signatures_match_extracted_orientation(matcher):
+    names = list(matcher.world_shapes['name'])
+    for name, coords in REFERENCES.items():
+        extracted = to_image(Polygon(coords))
+        distances = batch_hausdorff(shape_signature(extracted, flip_y=True), matcher.world_index.signatures)
+        assert names[int(np.argmin(distances))] == name
+
+
+def test_cascade_filter_is_opt_in(matcher):
+    extracted = {'geometry': to_image(Polygon(REFERENCES['Elle']))}
+    assert matcher.cascade_top_n is None
+
+    matcher.match_stats = matcher._empty_stats()
+    matcher.find_best_match(extracted)
+    assert matcher.match_stats['scored'] == matcher.match_stats['candidates'] == len(REFERENCES)
+
+    matcher.match_stats = matcher._empty_stats()
+    matches = matcher.find_best_match(extracted, top_k=1, top_n=2)
+    assert matcher.match_stats['scored'] == 2
+    assert matches[0]['name'] == 'Elle'
+
+
+def synthetic_map() -> np.ndarray:
+    """Le forme di riferimento disegnate a tinta piatta su sfondo bianco (y verso il basso)"""
+    image = np.full((400, 500, 3), 255, dtype=np.uint8)
+    colors = [(200, 60, 60), (60, 160, 60), (60, 60, 200), (180, 140, 40)]
+    for color, coords in zip(colors, REFERENCES.values()):
+        points = [((x - 7) * 55, (47 - y) * 35) for x, y in coords]
+        cv2.fillPoly(image, [np.round(points).astype(np.int32)], color)
+    return image
+
+
+def match_all_features(matcher, tmp_path, name, **kwargs):
+    result = matcher.match_all(str(tmp_path / 'map.png'), confidence_threshold=0.0, image=synthetic_map(),
+                               output_path=str(tmp_path / f'{name}.geojson'), **kwargs)
+    return result['geojson']['features'], dict(matcher.match_stats)
+
+
+def test_parallel_match_equals_serial(matcher, tmp_path):
+    serial, serial_stats = match_all_features(matcher, tmp_path, 'serial')
+    parallel, parallel_stats = match_all_features(matcher, tmp_path, 'parallel', workers=2)
+
+    assert len(serial) >= len(REFERENCES)
+    assert parallel == serial
+    for key in ('shapes', 'candidates', 'scored', 'matches'):
+        assert parallel_stats[key] == serial_stats[key]
+
+
+def test_parallel_match_falls_back_to_serial_without_fork(matcher, tmp_path, monkeypatch):
+    serial, _ = match_all_features(matcher, tmp_path, 'serial')
+    monkeypatch.setattr(shape_matcher.multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    fallback, _ = match_all_features(matcher, tmp_path, 'fallback', workers=2)
+    assert fallback == serial
@@ -0,0 +1,87 @@
+"""
+ReferenceIndex (STRtree, predicato 'within') contro il ciclo iterrows + contains che sostituisce
+"""
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import MultiPolygon, Point, Polygon, box
+
+from spatial_index import ReferenceIndex, deepest_name_field
+
+
+def reference_layer() -> gpd.GeoDataFrame:
+    """Griglia 3×3 di quadrati con bordi condivisi, un poligono sovrapposto, uno con un buco
+    e un MultiPolygon"""
+    geometries = [box(x, y, x + 1, y + 1) for y in range(3) for x in range(3)]
+    geometries.append(Polygon([(0.5, 0.5), (2.5, 0.5), (1.5, 2.5)]))  # sovrapposto alla griglia
+    geometries.append(Polygon([(5, 0), (8, 0), (8, 3), (5, 3)], holes=[[(6, 1), (7, 1), (7, 2), (6, 2)]]))
+    geometries.append(MultiPolygon([box(10, 0, 11, 1), box(12, 0, 13, 1)]))
+    return gpd.GeoDataFrame({'NAME_1': ['Regione'] * len(geometries),
+                             'NAME_2': [f'f{i}' for i in range(len(geometries))]},
+                            geometry=geometries, crs='EPSG:4326')
+
+
+def iterrows_locate(gdf: gpd.GeoDataFrame, lons, lats) -> np.ndarray:
+    """Il ciclo originale: prima feature (in ordine) che contiene il punto"""
+    result = []
+    for lon, lat in zip(lons, lats):
+        point = Point(lon, lat)
+        found = -1
+        for position, (_, row) in enumerate(gdf.iterrows()):
+            if row.geometry.contains(point):
+                found = position
+                break
+        result.append(found)
+    return np.array(result)
+
+
+# Casi limite (lon, lat) → posizione attesa; -1 = nessuna feature (i bordi non sono "contains")
+EDGE_CASES = {
+    (0.2, 0.2): 0,     # dentro il primo quadrato
+    (0.5, 0.5): 0,     # vertice del sovrapposto, dentro il quadrato 0
+    (1, 1): 9,         # vertice condiviso da 4 quadrati, dentro il sovrapposto
+    (1.5, 1.5): 4,     # dentro quadrato centrale e sovrapposto: vince il primo in ordine
+    (1.5, 2.5): 7,     # vertice del sovrapposto, dentro il quadrato 7
+    (1, 0.5): -1,      # bordo condiviso da due quadrati, fuori dal sovrapposto (bordo)
+    (0.5, 1): -1,      # bordo condiviso, fuori dal sovrapposto
+    (2, 1.5): -1,      # bordo condiviso che coincide con il bordo del sovrapposto
+    (0, 0): -1,        # angolo esterno della griglia
+    (3, 1.5): -1,      # bordo esterno della griglia
+    (5.5, 1.5): 10,    # nell'anello del poligono con buco
+    (6, 1.5): -1,      # sul bordo del buco
+    (6.5, 1.5): -1,    # nel buco
+    (10.5, 0.5): 11,   # prima parte del MultiPolygon
+    (12.5, 0.5): 11,   # seconda parte
+    (11.5, 0.5): -1,   # tra le due parti
+    (-5, -5): -1,      # lontano da tutto
+    (20, 20): -1,
+}
+
+
+def test_locate_matches_iterrows_contains():
+    gdf = reference_layer()
+    rng = np.random.default_rng(0)
+    points = np.vstack([rng.uniform([-1, -1], [14, 4], size=(300, 2)), list(EDGE_CASES)])
+    lons, lats = points.T
+
+    result = ReferenceIndex(gdf).locate(lons, lats)
+    expected = iterrows_locate(gdf, lons, lats)
+    np.testing.assert_array_equal(result, expected)
+
+    np.testing.assert_array_equal(result[300:], list(EDGE_CASES.values()))
+    assert (expected[:300] == -1).sum() > 50  # molti punti casuali fuori da ogni feature
+
+
+def test_names_from_deepest_level():
+    gdf = reference_layer()
+    index = ReferenceIndex(gdf)
+    assert deepest_name_field(gdf) == 'NAME_2' == index.name_field
+    assert index.name(3) == 'f3'
+
+    unnamed = ReferenceIndex(gdf[['geometry']].set_axis(range(100, 100 + len(gdf))))
+    assert unnamed.name(0) == 'Region 100'
+
+
+def test_empty_query():
+    index = ReferenceIndex(reference_layer())
+    assert index.locate(np.array([]), np.array([])).shape == (0,)